@@ -5,11 +5,171 @@ from datetime import datetime
 import uuid
 import shutil
 import os
+import time
+import queue
+import random
+import atexit
+import argparse
+import collections
+import csv
+import gzip
+import hashlib
+import hmac
+import itertools
+import json
+import re
+import secrets
+import tempfile
+import threading
+from contextlib import contextmanager
+
+DB_PATH = 'school_management.db'
+SEARCH_DEBOUNCE_MS = 250
+VIRTUAL_PAGE_ROWS = 100
+VIRTUAL_MAX_PAGES = 3
+TASK_POLL_MS = 30
+SCREEN_TIMING_SAMPLES = 200
+
+# Database Access Layer
+# A single long-lived connection is shared by every handler (guarded by a
+# lock), with a small pool of extra connections for background workers.
+class Database:
+    PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA cache_size=-16000",
+        "PRAGMA mmap_size=134217728",
+        "PRAGMA busy_timeout=5000",
+    )
+
+    def __init__(self, path=DB_PATH, pool_size=4):
+        self.path = path
+        self.pool_size = pool_size
+        self.lock = threading.RLock()
+        self.conn = self.connect()
+        self._readers = queue.LifoQueue()
+        self._after_commit = []
+
+    def connect(self):
+        # isolation_level=None leaves transaction control to transaction();
+        # cached_statements keeps the prepared statements of every handler hot.
+        conn = sqlite3.connect(self.path, check_same_thread=False,
+                               isolation_level=None, cached_statements=256)
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def execute(self, sql, params=()):
+        # Rows are read under the lock; a cursor handed back would be
+        # iterated after other threads had reused the connection.
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def fetchone(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchone()
+
+    def fetchall(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    @contextmanager
+    def transaction(self):
+        # Nested calls become savepoints so helpers can be composed freely.
+        with self.lock:
+            c = self.conn.cursor()
+            nested = self.conn.in_transaction
+            callbacks = len(self._after_commit)
+            c.execute("SAVEPOINT nested" if nested else "BEGIN IMMEDIATE")
+            try:
+                yield c
+            except BaseException:
+                del self._after_commit[callbacks:]
+                if nested:
+                    c.execute("ROLLBACK TO nested")
+                    c.execute("RELEASE nested")
+                else:
+                    c.execute("ROLLBACK")
+                raise
+            else:
+                c.execute("RELEASE nested" if nested else "COMMIT")
+            finally:
+                c.close()
+            if nested:
+                return
+            callbacks, self._after_commit = self._after_commit, []
+        # Outside the lock: a callback may wait on a thread that needs it.
+        for callback in callbacks:
+            callback()
+
+    def after_commit(self, callback):
+        # Runs callback once the enclosing transaction commits, or now if
+        # none is open; it is dropped if the transaction rolls back.
+        with self.lock:
+            if self.conn.in_transaction:
+                self._after_commit.append(callback)
+                return
+        callback()
+
+    @contextmanager
+    def reader(self):
+        # Pooled connection for worker threads; WAL lets these read while
+        # the main connection writes.
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            conn = self.connect()
+            conn.execute("PRAGMA query_only=1")
+        try:
+            yield conn
+        finally:
+            if self._readers.qsize() < self.pool_size:
+                self._readers.put(conn)
+            else:
+                conn.close()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+
+_db = None
+_db_lock = threading.Lock()
+
+def open_db(path=DB_PATH):
+    global _db
+    close_audit_log()
+    with _db_lock:
+        if _db is not None:
+            _db.close()
+        _db = Database(path)
+        student_dashboards.invalidate()
+        return _db
+
+def get_db():
+    with _db_lock:
+        if _db is not None:
+            return _db
+    return open_db()
 
 # Database Setup
-def init_db():
-    conn = sqlite3.connect('school_management.db')
-    c = conn.cursor()
+def init_db(db=None):
+    # A database already at SCHEMA_VERSION needs no DDL or seeding, so a warm
+    # start is a single PRAGMA read instead of a write transaction.
+    db = db or get_db()
+    if db.fetchone("PRAGMA user_version")[0] == SCHEMA_VERSION:
+        return False
+    with db.transaction() as c:
+        init_schema(c)
+        migrate(c)
+    return True
+
+def init_schema(c):
     
     # Users table with role
     c.execute('''CREATE TABLE IF NOT EXISTS users (
@@ -96,20 +256,2878 @@ def init_db():
     # Sample fees data
     c.execute("INSERT OR IGNORE INTO fees (class, amount) VALUES (?, ?)", ('Class 10', 5000.0))
     c.execute("INSERT OR IGNORE INTO fees (class, amount) VALUES (?, ?)", ('Class 11', 6000.0))
+
+# Schema Migrations
+# Each migration upgrades the schema by one version. PRAGMA user_version
+# records the last one applied, so existing databases are upgraded in place
+# at startup. Append new migrations; never edit or reorder applied ones.
+def migration_lookup_indexes(c):
+    c.execute("CREATE INDEX IF NOT EXISTS idx_hostelers_student ON hostelers(student_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bus_holders_student ON bus_holders(student_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_fee_transactions_student ON fee_transactions(student_id, amount)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_report_cards_student ON report_cards(student_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_salary_slips_employee_month ON salary_slips(employee_id, month)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_students_class ON students(class)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_students_name ON students(name)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_system_logs_timestamp ON system_logs(timestamp)")
+
+def fts5_available(c):
+    try:
+        c.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+        c.execute("DROP TABLE temp.fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+def migration_student_search(c):
+    # External-content FTS5 index over students(name, class), keyed by the
+    # students rowid and kept in sync by triggers. Builds without FTS5 skip
+    # this and search_students falls back to LIKE.
+    if not fts5_available(c):
+        return
+    c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS students_fts USING fts5(
+                 name, class, content='students', content_rowid='rowid', prefix='2 3')''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS students_fts_insert AFTER INSERT ON students BEGIN
+                 INSERT INTO students_fts(rowid, name, class) VALUES (new.rowid, new.name, new.class);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS students_fts_delete AFTER DELETE ON students BEGIN
+                 INSERT INTO students_fts(students_fts, rowid, name, class) VALUES ('delete', old.rowid, old.name, old.class);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS students_fts_update AFTER UPDATE OF name, class ON students BEGIN
+                 INSERT INTO students_fts(students_fts, rowid, name, class) VALUES ('delete', old.rowid, old.name, old.class);
+                 INSERT INTO students_fts(rowid, name, class) VALUES (new.rowid, new.name, new.class);
+                 END''')
+    rebuild_search_index(c)
+
+# Amounts owed per student and fee type, recomputed by the students triggers.
+STUDENT_DUES_SQL = '''INSERT INTO fee_balances (student_id, fee_type, amount_due, amount_paid) VALUES
+    (new.student_id, 'Class', COALESCE((SELECT amount FROM fees WHERE class = new.class), 0), 0),
+    (new.student_id, 'Hostel', CASE WHEN new.hostel_status = 'Yes'
+        THEN COALESCE((SELECT amount FROM service_fees WHERE fee_type = 'Hostel'), 0) ELSE 0 END, 0),
+    (new.student_id, 'Bus', CASE WHEN new.bus_status = 'Yes'
+        THEN COALESCE((SELECT amount FROM service_fees WHERE fee_type = 'Bus'), 0) ELSE 0 END, 0)
+    ON CONFLICT(student_id, fee_type) DO UPDATE SET amount_due = excluded.amount_due;'''
+
+def migration_fee_ledger(c):
+    # fee_balances holds what each student owes and has paid per fee type.
+    # Triggers keep it current in the same transaction as every write to
+    # students, fees, service_fees and fee_transactions, and the partial
+    # index makes "who has dues" an index lookup.
+    c.execute('''CREATE TABLE IF NOT EXISTS service_fees (
+                 fee_type TEXT PRIMARY KEY,
+                 amount REAL)''')
+    # The school sets these amounts on the Fee Settings screen.
+    c.execute("INSERT OR IGNORE INTO service_fees (fee_type, amount) VALUES (?, ?)", ('Hostel', 0.0))
+    c.execute("INSERT OR IGNORE INTO service_fees (fee_type, amount) VALUES (?, ?)", ('Bus', 0.0))
+    c.execute('''CREATE TABLE IF NOT EXISTS fee_balances (
+                 student_id TEXT,
+                 fee_type TEXT,
+                 amount_due REAL,
+                 amount_paid REAL,
+                 PRIMARY KEY (student_id, fee_type),
+                 FOREIGN KEY(student_id) REFERENCES students(student_id)) WITHOUT ROWID''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_fee_balances_outstanding ON fee_balances(student_id, fee_type)
+                 WHERE amount_paid < amount_due''')
     
-    conn.commit()
-    conn.close()
+    # Backfill from existing data. Payments with any other fee type (e.g.
+    # "Tuition", "Exam") are counted as Class payments, and how many were
+    # remapped is recorded in system_logs.
+    unmapped = c.execute('''SELECT COUNT(*) FROM fee_transactions
+                            WHERE fee_type IS NULL OR lower(trim(fee_type)) NOT IN ('class', 'hostel', 'bus')''').fetchone()[0]
+    c.execute('''UPDATE fee_transactions SET fee_type = CASE lower(trim(fee_type))
+                 WHEN 'hostel' THEN 'Hostel' WHEN 'bus' THEN 'Bus' ELSE 'Class' END''')
+    if unmapped:
+        c.execute("INSERT INTO system_logs (log_id, action, username, timestamp) VALUES (?, ?, ?, ?)",
+                  (str(uuid.uuid4()), f"Schema upgrade: {unmapped} payments with an unknown fee type counted as Class",
+                   'system', datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+    c.execute('''INSERT INTO fee_balances (student_id, fee_type, amount_due, amount_paid)
+                 SELECT s.student_id, 'Class', COALESCE(f.amount, 0), 0
+                 FROM students s LEFT JOIN fees f ON f.class = s.class''')
+    for fee_type, status in (('Hostel', 'hostel_status'), ('Bus', 'bus_status')):
+        c.execute(f'''INSERT INTO fee_balances (student_id, fee_type, amount_due, amount_paid)
+                      SELECT student_id, ?, CASE WHEN {status} = 'Yes'
+                          THEN (SELECT amount FROM service_fees WHERE fee_type = ?) ELSE 0 END, 0
+                      FROM students''', (fee_type, fee_type))
+    c.execute('''INSERT INTO fee_balances (student_id, fee_type, amount_due, amount_paid)
+                 SELECT student_id, fee_type, 0, SUM(amount) FROM fee_transactions WHERE 1
+                 GROUP BY student_id, fee_type
+                 ON CONFLICT(student_id, fee_type) DO UPDATE SET amount_paid = excluded.amount_paid''')
+    
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS fee_balances_student_insert AFTER INSERT ON students BEGIN
+                  {STUDENT_DUES_SQL}
+                  END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS fee_balances_student_update
+                  AFTER UPDATE OF class, hostel_status, bus_status ON students BEGIN
+                  {STUDENT_DUES_SQL}
+                  END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS fee_balances_student_delete AFTER DELETE ON students BEGIN
+                 DELETE FROM fee_balances WHERE student_id = old.student_id;
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS fee_balances_payment_insert AFTER INSERT ON fee_transactions BEGIN
+                 INSERT INTO fee_balances (student_id, fee_type, amount_due, amount_paid)
+                 VALUES (new.student_id, new.fee_type, 0, new.amount)
+                 ON CONFLICT(student_id, fee_type) DO UPDATE SET amount_paid = amount_paid + excluded.amount_paid;
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS fee_balances_payment_delete AFTER DELETE ON fee_transactions BEGIN
+                 UPDATE fee_balances SET amount_paid = amount_paid - old.amount
+                 WHERE student_id = old.student_id AND fee_type = old.fee_type;
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS fee_balances_payment_update
+                 AFTER UPDATE OF student_id, fee_type, amount ON fee_transactions BEGIN
+                 UPDATE fee_balances SET amount_paid = amount_paid - old.amount
+                 WHERE student_id = old.student_id AND fee_type = old.fee_type;
+                 INSERT INTO fee_balances (student_id, fee_type, amount_due, amount_paid)
+                 VALUES (new.student_id, new.fee_type, 0, new.amount)
+                 ON CONFLICT(student_id, fee_type) DO UPDATE SET amount_paid = amount_paid + excluded.amount_paid;
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS fee_balances_class_fee_insert AFTER INSERT ON fees BEGIN
+                 UPDATE fee_balances SET amount_due = new.amount WHERE fee_type = 'Class'
+                 AND student_id IN (SELECT student_id FROM students WHERE class = new.class);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS fee_balances_class_fee_update AFTER UPDATE OF class, amount ON fees BEGIN
+                 UPDATE fee_balances SET amount_due = 0 WHERE fee_type = 'Class'
+                 AND student_id IN (SELECT student_id FROM students WHERE class = old.class);
+                 UPDATE fee_balances SET amount_due = new.amount WHERE fee_type = 'Class'
+                 AND student_id IN (SELECT student_id FROM students WHERE class = new.class);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS fee_balances_class_fee_delete AFTER DELETE ON fees BEGIN
+                 UPDATE fee_balances SET amount_due = 0 WHERE fee_type = 'Class'
+                 AND student_id IN (SELECT student_id FROM students WHERE class = old.class);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS fee_balances_service_fee AFTER UPDATE OF amount ON service_fees BEGIN
+                 UPDATE fee_balances SET amount_due = new.amount WHERE fee_type = new.fee_type
+                 AND student_id IN (SELECT student_id FROM students WHERE
+                     CASE new.fee_type WHEN 'Hostel' THEN hostel_status WHEN 'Bus' THEN bus_status END = 'Yes');
+                 END''')
+
+def migration_unique_marks(c):
+    # One mark per student and subject: keep the latest duplicate, then let
+    # the unique index (which also serves student_id lookups) enforce it.
+    c.execute('''DELETE FROM report_cards WHERE rowid IN (
+                 SELECT rowid FROM (
+                     SELECT rowid, ROW_NUMBER() OVER (
+                         PARTITION BY student_id, subject ORDER BY created_at DESC, rowid DESC) AS n
+                     FROM report_cards)
+                 WHERE n > 1)''')
+    c.execute("DROP INDEX IF EXISTS idx_report_cards_student")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_report_cards_student_subject ON report_cards(student_id, subject)")
+
+def migration_payroll(c):
+    # Employees can be marked inactive, and each employee gets at most one
+    # slip per month (latest duplicate kept).
+    c.execute("ALTER TABLE employees ADD COLUMN status TEXT DEFAULT 'Active'")
+    c.execute('''DELETE FROM salary_slips WHERE rowid IN (
+                 SELECT rowid FROM (
+                     SELECT rowid, ROW_NUMBER() OVER (
+                         PARTITION BY employee_id, month ORDER BY issued_date DESC, rowid DESC) AS n
+                     FROM salary_slips)
+                 WHERE n > 1)''')
+    c.execute("DROP INDEX IF EXISTS idx_salary_slips_employee_month")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_salary_slips_employee_month ON salary_slips(employee_id, month)")
+
+def migration_dashboard_stats(c):
+    # Summary tables behind the admin dashboard. Triggers keep them current
+    # in the same transaction as every write to the base tables, so reading
+    # the dashboard never scans students or fee_transactions.
+    c.execute('''CREATE TABLE IF NOT EXISTS class_stats (
+                 class TEXT PRIMARY KEY,
+                 students INTEGER,
+                 hostel INTEGER,
+                 bus INTEGER) WITHOUT ROWID''')
+    c.execute('''CREATE TABLE IF NOT EXISTS route_stats (
+                 route_number TEXT PRIMARY KEY,
+                 riders INTEGER) WITHOUT ROWID''')
+    c.execute('''CREATE TABLE IF NOT EXISTS monthly_collections (
+                 month TEXT PRIMARY KEY,
+                 payments INTEGER,
+                 amount REAL) WITHOUT ROWID''')
+    c.execute('''CREATE TABLE IF NOT EXISTS dashboard_totals (
+                 name TEXT PRIMARY KEY,
+                 value REAL) WITHOUT ROWID''')
+    # Filled by migration_hostel_rooms once hostel_rooms, which the
+    # aggregates also read, exists.
+    
+    class_delta = '''INSERT INTO class_stats (class, students, hostel, bus)
+                     VALUES ({row}.class, {sign}1, {sign}({row}.hostel_status = 'Yes'), {sign}({row}.bus_status = 'Yes'))
+                     ON CONFLICT(class) DO UPDATE SET students = students + excluded.students,
+                         hostel = hostel + excluded.hostel, bus = bus + excluded.bus;'''
+    add_class = class_delta.format(row='new', sign='')
+    remove_class = class_delta.format(row='old', sign='-')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS class_stats_student_insert AFTER INSERT ON students BEGIN
+                  {add_class}
+                  END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS class_stats_student_delete AFTER DELETE ON students BEGIN
+                  {remove_class}
+                  END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS class_stats_student_update
+                  AFTER UPDATE OF class, hostel_status, bus_status ON students BEGIN
+                  {remove_class}
+                  {add_class}
+                  END''')
+    
+    c.execute('''CREATE TRIGGER IF NOT EXISTS dashboard_hosteler_insert AFTER INSERT ON hostelers BEGIN
+                 UPDATE dashboard_totals SET value = value + 1 WHERE name = 'hostelers';
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS dashboard_hosteler_delete AFTER DELETE ON hostelers BEGIN
+                 UPDATE dashboard_totals SET value = value - 1 WHERE name = 'hostelers';
+                 END''')
+    
+    route_delta = '''INSERT INTO route_stats (route_number, riders) VALUES ({row}.route_number, {sign}1)
+                     ON CONFLICT(route_number) DO UPDATE SET riders = riders + excluded.riders;'''
+    add_rider = route_delta.format(row='new', sign='')
+    remove_rider = route_delta.format(row='old', sign='-')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS route_stats_insert AFTER INSERT ON bus_holders BEGIN
+                  {add_rider}
+                  END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS route_stats_delete AFTER DELETE ON bus_holders BEGIN
+                  {remove_rider}
+                  END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS route_stats_update AFTER UPDATE OF route_number ON bus_holders BEGIN
+                  {remove_rider}
+                  {add_rider}
+                  END''')
+    
+    payment_delta = '''INSERT INTO monthly_collections (month, payments, amount)
+                       VALUES (substr({row}.payment_date, 1, 7), {sign}1, {sign}{row}.amount)
+                       ON CONFLICT(month) DO UPDATE SET payments = payments + excluded.payments,
+                           amount = amount + excluded.amount;'''
+    add_payment = payment_delta.format(row='new', sign='')
+    remove_payment = payment_delta.format(row='old', sign='-')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS monthly_collections_insert AFTER INSERT ON fee_transactions BEGIN
+                  {add_payment}
+                  END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS monthly_collections_delete AFTER DELETE ON fee_transactions BEGIN
+                  {remove_payment}
+                  END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS monthly_collections_update
+                  AFTER UPDATE OF amount, payment_date ON fee_transactions BEGIN
+                  {remove_payment}
+                  {add_payment}
+                  END''')
+    
+    # fee_balances is itself maintained by triggers, so these fire for every
+    # change to students, fees, service_fees and fee_transactions.
+    c.execute('''CREATE TRIGGER IF NOT EXISTS dashboard_dues_insert AFTER INSERT ON fee_balances BEGIN
+                 UPDATE dashboard_totals SET value = value + max(new.amount_due - new.amount_paid, 0)
+                 WHERE name = 'outstanding_dues';
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS dashboard_dues_delete AFTER DELETE ON fee_balances BEGIN
+                 UPDATE dashboard_totals SET value = value - max(old.amount_due - old.amount_paid, 0)
+                 WHERE name = 'outstanding_dues';
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS dashboard_dues_update AFTER UPDATE ON fee_balances BEGIN
+                 UPDATE dashboard_totals SET value = value - max(old.amount_due - old.amount_paid, 0)
+                     + max(new.amount_due - new.amount_paid, 0)
+                 WHERE name = 'outstanding_dues';
+                 END''')
+
+# Checks shared by new allocations and room changes.
+HOSTEL_BED_CHECKS = '''SELECT RAISE(ABORT, 'Room not found')
+                       WHERE NOT EXISTS (SELECT 1 FROM hostel_rooms WHERE room_number = new.room_number);
+                       SELECT RAISE(ABORT, 'Room is full')
+                       WHERE EXISTS (SELECT 1 FROM hostel_rooms WHERE room_number = new.room_number AND occupied >= capacity);
+                       SELECT RAISE(ABORT, 'Room is reserved for another class or gender')
+                       WHERE EXISTS (SELECT 1 FROM hostel_rooms r, students s
+                                     WHERE r.room_number = new.room_number AND s.student_id = new.student_id
+                                     AND ((r.gender IS NOT NULL AND r.gender IS NOT s.gender)
+                                          OR (r.class IS NOT NULL AND r.class IS NOT s.class)));'''
+
+def migration_hostel_rooms(c):
+    # Rooms with a bed capacity and an occupied counter kept by triggers. The
+    # partial index holds only rooms with a free bed, so finding one never
+    # scans hostelers; idx_hostelers_room answers "who is in room X".
+    # Existing free-text rooms are backfilled as full rooms.
+    c.execute("ALTER TABLE students ADD COLUMN gender TEXT")
+    c.execute('''CREATE TABLE IF NOT EXISTS hostel_rooms (
+                 room_number TEXT PRIMARY KEY,
+                 block TEXT,
+                 capacity INTEGER,
+                 occupied INTEGER DEFAULT 0,
+                 gender TEXT,
+                 class TEXT,
+                 CHECK (occupied <= capacity))''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_hostel_rooms_free ON hostel_rooms(gender, class, room_number)
+                 WHERE occupied < capacity''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_hostelers_room ON hostelers(room_number)")
+    c.execute('''INSERT OR IGNORE INTO hostel_rooms (room_number, capacity, occupied)
+                 SELECT room_number, COUNT(*), COUNT(*) FROM hostelers GROUP BY room_number''')
+    
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS hostel_beds_check_insert BEFORE INSERT ON hostelers BEGIN
+                  SELECT RAISE(ABORT, 'Student already has a bed')
+                  WHERE EXISTS (SELECT 1 FROM hostelers WHERE student_id = new.student_id);
+                  {HOSTEL_BED_CHECKS}
+                  END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS hostel_beds_check_update BEFORE UPDATE OF room_number ON hostelers
+                  WHEN new.room_number IS NOT old.room_number BEGIN
+                  {HOSTEL_BED_CHECKS}
+                  END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS hostel_beds_insert AFTER INSERT ON hostelers BEGIN
+                 UPDATE hostel_rooms SET occupied = occupied + 1 WHERE room_number = new.room_number;
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS hostel_beds_delete AFTER DELETE ON hostelers BEGIN
+                 UPDATE hostel_rooms SET occupied = occupied - 1 WHERE room_number = old.room_number;
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS hostel_beds_update AFTER UPDATE OF room_number ON hostelers
+                 WHEN new.room_number IS NOT old.room_number BEGIN
+                 UPDATE hostel_rooms SET occupied = occupied - 1 WHERE room_number = old.room_number;
+                 UPDATE hostel_rooms SET occupied = occupied + 1 WHERE room_number = new.room_number;
+                 END''')
+    
+    # Total bed capacity is a dashboard total like hostelers.
+    c.execute('''CREATE TRIGGER IF NOT EXISTS dashboard_beds_insert AFTER INSERT ON hostel_rooms BEGIN
+                 UPDATE dashboard_totals SET value = value + new.capacity WHERE name = 'beds';
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS dashboard_beds_delete AFTER DELETE ON hostel_rooms BEGIN
+                 UPDATE dashboard_totals SET value = value - old.capacity WHERE name = 'beds';
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS dashboard_beds_update AFTER UPDATE OF capacity ON hostel_rooms BEGIN
+                 UPDATE dashboard_totals SET value = value - old.capacity + new.capacity WHERE name = 'beds';
+                 END''')
+    rebuild_dashboard(c)
+
+# Checks shared by new bus holders and route or stop changes.
+BUS_SEAT_CHECKS = '''SELECT RAISE(ABORT, 'Route not found')
+                      WHERE NOT EXISTS (SELECT 1 FROM bus_routes WHERE route_number = new.route_number);
+                      SELECT RAISE(ABORT, 'Pickup point is not a stop on this route')
+                      WHERE NOT EXISTS (SELECT 1 FROM bus_stops
+                                        WHERE pickup_point = new.pickup_point AND route_number = new.route_number);'''
+BUS_ROUTE_FULL = '''SELECT RAISE(ABORT, 'Route is full')
+                     WHERE EXISTS (SELECT 1 FROM bus_routes WHERE route_number = new.route_number AND riders >= capacity);'''
+
+def migration_bus_routes(c):
+    # Routes with a seat capacity and a riders counter kept by triggers, and
+    # the stops each route serves (keyed by pickup point so "which routes
+    # stop here" is an index lookup). students.pickup_point records where a
+    # bus student wants to be picked up, for batch assignment. Existing
+    # free-text routes and stops are backfilled, routes as full.
+    c.execute("ALTER TABLE students ADD COLUMN pickup_point TEXT")
+    c.execute('''CREATE TABLE IF NOT EXISTS bus_routes (
+                 route_number TEXT PRIMARY KEY,
+                 capacity INTEGER,
+                 riders INTEGER DEFAULT 0,
+                 CHECK (riders <= capacity))''')
+    c.execute('''CREATE TABLE IF NOT EXISTS bus_stops (
+                 pickup_point TEXT,
+                 route_number TEXT,
+                 stop_order INTEGER,
+                 PRIMARY KEY (pickup_point, route_number),
+                 FOREIGN KEY(route_number) REFERENCES bus_routes(route_number)) WITHOUT ROWID''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bus_stops_route ON bus_stops(route_number, stop_order)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bus_holders_route ON bus_holders(route_number)")
+    c.execute('''INSERT OR IGNORE INTO bus_routes (route_number, capacity, riders)
+                 SELECT route_number, COUNT(*), COUNT(*) FROM bus_holders GROUP BY route_number''')
+    c.execute('''INSERT OR IGNORE INTO bus_stops (pickup_point, route_number, stop_order)
+                 SELECT pickup_point, route_number, ROW_NUMBER() OVER (PARTITION BY route_number ORDER BY pickup_point)
+                 FROM bus_holders GROUP BY route_number, pickup_point''')
+    
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS bus_seats_check_insert BEFORE INSERT ON bus_holders BEGIN
+                  SELECT RAISE(ABORT, 'Student already has a bus seat')
+                  WHERE EXISTS (SELECT 1 FROM bus_holders WHERE student_id = new.student_id);
+                  {BUS_SEAT_CHECKS}
+                  {BUS_ROUTE_FULL}
+                  END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS bus_seats_check_update BEFORE UPDATE OF route_number, pickup_point ON bus_holders
+                  WHEN new.route_number IS NOT old.route_number OR new.pickup_point IS NOT old.pickup_point BEGIN
+                  {BUS_SEAT_CHECKS}
+                  END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS bus_seats_check_route_change BEFORE UPDATE OF route_number ON bus_holders
+                  WHEN new.route_number IS NOT old.route_number BEGIN
+                  {BUS_ROUTE_FULL}
+                  END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS bus_seats_insert AFTER INSERT ON bus_holders BEGIN
+                 UPDATE bus_routes SET riders = riders + 1 WHERE route_number = new.route_number;
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS bus_seats_delete AFTER DELETE ON bus_holders BEGIN
+                 UPDATE bus_routes SET riders = riders - 1 WHERE route_number = old.route_number;
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS bus_seats_update AFTER UPDATE OF route_number ON bus_holders
+                 WHEN new.route_number IS NOT old.route_number BEGIN
+                 UPDATE bus_routes SET riders = riders - 1 WHERE route_number = old.route_number;
+                 UPDATE bus_routes SET riders = riders + 1 WHERE route_number = new.route_number;
+                 END''')
+
+def migration_hashed_passwords(c):
+    # Hashes the plaintext passwords and links each student user to its
+    # student directly, replacing the student_id LIKE scan at login.
+    # Student usernames are "student" plus the first 8 characters of the ID.
+    # Hashing at full cost would hold up startup for minutes on a large
+    # school, so the plaintext is only replaced by a LEGACY_PASSWORD_ITERATIONS
+    # hash here and brought up to full cost on each user's next login.
+    # Passwords still at their issued value are flagged to be changed.
+    c.execute("ALTER TABLE users ADD COLUMN student_id TEXT")
+    c.execute("ALTER TABLE users ADD COLUMN must_change_password INTEGER NOT NULL DEFAULT 0")
+    students = {student_id[:8]: student_id for student_id, in c.execute("SELECT student_id FROM students")}
+    updates = []
+    for username, password, role in c.execute("SELECT username, password, role FROM users").fetchall():
+        student_id = students.get(username[len("student"):]) if role == 'student' else None
+        issued = False
+        if password is not None and not is_password_hash(password):
+            issued = (password == initial_password(student_id) if student_id
+                      else (username, password) == ('admin', 'admin'))
+            password = hash_password(password, LEGACY_PASSWORD_ITERATIONS)
+        updates.append((password, student_id, int(issued), username))
+    c.executemany("UPDATE users SET password=?, student_id=?, must_change_password=? WHERE username=?", updates)
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_student_id ON users(student_id)")
+
+def migration_dashboard_version(c):
+    # A counter bumped by every change to fees and to students' classes, from
+    # any process, so the student dashboard cache can tell its tuition fees
+    # and classes are stale.
+    c.execute('''CREATE TABLE IF NOT EXISTS cache_versions (
+                 name TEXT PRIMARY KEY,
+                 version INTEGER) WITHOUT ROWID''')
+    c.execute("INSERT OR IGNORE INTO cache_versions (name, version) VALUES ('student_dashboard', 0)")
+    bump = "UPDATE cache_versions SET version = version + 1 WHERE name = 'student_dashboard';"
+    for name, event in (("fees_insert", "AFTER INSERT ON fees"), ("fees_update", "AFTER UPDATE ON fees"),
+                        ("fees_delete", "AFTER DELETE ON fees"),
+                        ("student_class", "AFTER UPDATE OF class ON students"),
+                        ("student_delete", "AFTER DELETE ON students")):
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS student_dashboard_{name} {event} BEGIN
+                      {bump}
+                      END''')
+# STUDENT_DUES_SQL for fee_balances keyed by students.id.
+STUDENT_DUES_BY_ID_SQL = '''INSERT INTO fee_balances (student, fee_type, amount_due, amount_paid) VALUES
+    (new.id, 'Class', COALESCE((SELECT amount FROM fees WHERE class = new.class), 0), 0),
+    (new.id, 'Hostel', CASE WHEN new.hostel_status = 'Yes'
+        THEN COALESCE((SELECT amount FROM service_fees WHERE fee_type = 'Hostel'), 0) ELSE 0 END, 0),
+    (new.id, 'Bus', CASE WHEN new.bus_status = 'Yes'
+        THEN COALESCE((SELECT amount FROM service_fees WHERE fee_type = 'Bus'), 0) ELSE 0 END, 0)
+    ON CONFLICT(student, fee_type) DO UPDATE SET amount_due = excluded.amount_due;'''
+
+# table: (integer-keyed definition, copy from the old table)
+INTEGER_KEY_TABLES = {
+    "students": ('''CREATE TABLE students_new (
+                    id INTEGER PRIMARY KEY,
+                    student_id TEXT UNIQUE,
+                    name TEXT,
+                    class TEXT,
+                    hostel_status TEXT,
+                    bus_status TEXT,
+                    created_at TEXT,
+                    gender TEXT,
+                    pickup_point TEXT)''',
+                 '''INSERT INTO students_new (id, student_id, name, class, hostel_status, bus_status, created_at,
+                                             gender, pickup_point)
+                    SELECT rowid, student_id, name, class, hostel_status, bus_status, created_at, gender, pickup_point
+                    FROM students'''),
+    "fee_transactions": ('''CREATE TABLE fee_transactions_new (
+                            id INTEGER PRIMARY KEY,
+                            transaction_id TEXT UNIQUE,
+                            student INTEGER,
+                            fee_type TEXT,
+                            amount REAL,
+                            payment_date TEXT,
+                            FOREIGN KEY(student) REFERENCES students(id))''',
+                         '''INSERT INTO fee_transactions_new (id, transaction_id, student, fee_type, amount, payment_date)
+                            SELECT t.rowid, t.transaction_id, s.id, t.fee_type, t.amount, t.payment_date
+                            FROM fee_transactions t LEFT JOIN students s ON s.student_id = t.student_id'''),
+    "report_cards": ('''CREATE TABLE report_cards_new (
+                        id INTEGER PRIMARY KEY,
+                        report_id TEXT UNIQUE,
+                        student INTEGER,
+                        subject TEXT,
+                        marks INTEGER,
+                        created_at TEXT,
+                        FOREIGN KEY(student) REFERENCES students(id))''',
+                     '''INSERT INTO report_cards_new (id, report_id, student, subject, marks, created_at)
+                        SELECT r.rowid, r.report_id, s.id, r.subject, r.marks, r.created_at
+                        FROM report_cards r LEFT JOIN students s ON s.student_id = r.student_id'''),
+    "fee_balances": ('''CREATE TABLE fee_balances_new (
+                        student INTEGER,
+                        fee_type TEXT,
+                        amount_due REAL,
+                        amount_paid REAL,
+                        PRIMARY KEY (student, fee_type),
+                        FOREIGN KEY(student) REFERENCES students(id)) WITHOUT ROWID''',
+                     '''INSERT INTO fee_balances_new (student, fee_type, amount_due, amount_paid)
+                        SELECT s.id, b.fee_type, b.amount_due, b.amount_paid
+                        FROM fee_balances b JOIN students s ON s.student_id = b.student_id'''),
+}
+
+def migration_integer_keys(c):
+    # students gets an INTEGER PRIMARY KEY holding its current rowids, so the
+    # FTS index stays valid (and now survives VACUUM), with student_id kept
+    # as the unique external ID used by the UI, logins and exports. The
+    # tables that grow every year reference students by that integer instead
+    # of repeating the 36-character UUID in every row and index entry.
+    # Payments and marks whose student no longer exists keep a NULL student.
+    # Each table is rebuilt; legacy_alter_table stops the rename from
+    # rewriting triggers on other tables, which keep naming "students".
+    # Triggers and indexes of the rebuilt tables that don't use the old
+    # column are recreated as they were, the rest in integer-keyed form.
+    rewritten = ("fee_balances_student_insert", "fee_balances_student_update", "fee_balances_student_delete",
+                 "fee_balances_payment_insert", "fee_balances_payment_delete", "fee_balances_payment_update",
+                 "fee_balances_class_fee_insert", "fee_balances_class_fee_update", "fee_balances_class_fee_delete",
+                 "fee_balances_service_fee", "idx_fee_transactions_student", "idx_report_cards_student_subject",
+                 "idx_fee_balances_outstanding")
+    tables = ", ".join("?" * len(INTEGER_KEY_TABLES))
+    names = ", ".join("?" * len(rewritten))
+    kept = [sql for sql, in c.execute(f'''SELECT sql FROM sqlite_master
+                                          WHERE type IN ('index', 'trigger') AND sql IS NOT NULL
+                                          AND tbl_name IN ({tables}) AND name NOT IN ({names})''',
+                                       list(INTEGER_KEY_TABLES) + list(rewritten))]
+    for name in rewritten:
+        c.execute(f"DROP TRIGGER IF EXISTS {name}")
+    c.execute("PRAGMA legacy_alter_table=ON")
+    for table, (create, copy) in INTEGER_KEY_TABLES.items():
+        c.execute(create)
+        c.execute(copy)
+        c.execute(f"DROP TABLE {table}")
+        c.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+    c.execute("PRAGMA legacy_alter_table=OFF")
+    for sql in kept:
+        c.execute(sql)
+    
+    c.execute("CREATE INDEX IF NOT EXISTS idx_fee_transactions_student ON fee_transactions(student, amount)")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_report_cards_student_subject ON report_cards(student, subject)")
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_fee_balances_outstanding ON fee_balances(student, fee_type)
+                 WHERE amount_paid < amount_due''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS fee_balances_student_insert AFTER INSERT ON students BEGIN
+                  {STUDENT_DUES_BY_ID_SQL}
+                  END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS fee_balances_student_update
+                  AFTER UPDATE OF class, hostel_status, bus_status ON students BEGIN
+                  {STUDENT_DUES_BY_ID_SQL}
+                  END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS fee_balances_student_delete AFTER DELETE ON students BEGIN
+                 DELETE FROM fee_balances WHERE student = old.id;
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS fee_balances_payment_insert AFTER INSERT ON fee_transactions BEGIN
+                 INSERT INTO fee_balances (student, fee_type, amount_due, amount_paid)
+                 VALUES (new.student, new.fee_type, 0, new.amount)
+                 ON CONFLICT(student, fee_type) DO UPDATE SET amount_paid = amount_paid + excluded.amount_paid;
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS fee_balances_payment_delete AFTER DELETE ON fee_transactions BEGIN
+                 UPDATE fee_balances SET amount_paid = amount_paid - old.amount
+                 WHERE student = old.student AND fee_type = old.fee_type;
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS fee_balances_payment_update
+                 AFTER UPDATE OF student, fee_type, amount ON fee_transactions BEGIN
+                 UPDATE fee_balances SET amount_paid = amount_paid - old.amount
+                 WHERE student = old.student AND fee_type = old.fee_type;
+                 INSERT INTO fee_balances (student, fee_type, amount_due, amount_paid)
+                 VALUES (new.student, new.fee_type, 0, new.amount)
+                 ON CONFLICT(student, fee_type) DO UPDATE SET amount_paid = amount_paid + excluded.amount_paid;
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS fee_balances_class_fee_insert AFTER INSERT ON fees BEGIN
+                 UPDATE fee_balances SET amount_due = new.amount WHERE fee_type = 'Class'
+                 AND student IN (SELECT id FROM students WHERE class = new.class);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS fee_balances_class_fee_update AFTER UPDATE OF class, amount ON fees BEGIN
+                 UPDATE fee_balances SET amount_due = 0 WHERE fee_type = 'Class'
+                 AND student IN (SELECT id FROM students WHERE class = old.class);
+                 UPDATE fee_balances SET amount_due = new.amount WHERE fee_type = 'Class'
+                 AND student IN (SELECT id FROM students WHERE class = new.class);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS fee_balances_class_fee_delete AFTER DELETE ON fees BEGIN
+                 UPDATE fee_balances SET amount_due = 0 WHERE fee_type = 'Class'
+                 AND student IN (SELECT id FROM students WHERE class = old.class);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS fee_balances_service_fee AFTER UPDATE OF amount ON service_fees BEGIN
+                 UPDATE fee_balances SET amount_due = new.amount WHERE fee_type = new.fee_type
+                 AND student IN (SELECT id FROM students WHERE
+                     CASE new.fee_type WHEN 'Hostel' THEN hostel_status WHEN 'Bus' THEN bus_status END = 'Yes');
+                 END''')
+    if c.execute("SELECT 1 FROM sqlite_master WHERE name='students_fts'").fetchone():
+        rebuild_search_index(c)
+
+MIGRATIONS = [
+    migration_lookup_indexes,
+    migration_student_search,
+    migration_fee_ledger,
+    migration_unique_marks,
+    migration_payroll,
+    migration_dashboard_stats,
+    migration_hostel_rooms,
+    migration_bus_routes,
+    migration_hashed_passwords,
+    migration_dashboard_version,
+    migration_integer_keys,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def migrate(c):
+    version = c.execute("PRAGMA user_version").fetchone()[0]
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(f"Database schema version {version} is newer than this application ({SCHEMA_VERSION})")
+    for number in range(version + 1, SCHEMA_VERSION + 1):
+        MIGRATIONS[number - 1](c)
+        c.execute(f"PRAGMA user_version={number}")
+    return version
+
+# Student Search
+def student_search_enabled(db):
+    if not hasattr(db, 'fts_enabled'):
+        db.fts_enabled = db.fetchone("SELECT 1 FROM sqlite_master WHERE name='students_fts'") is not None
+    return db.fts_enabled
+
+def rebuild_search_index(c):
+    # Repopulates the index from students. Its rowid is the id column since
+    # migration_integer_keys, so a VACUUM no longer renumbers it.
+    c.execute("INSERT INTO students_fts(students_fts) VALUES ('rebuild')")
+
+def fts_query(term):
+    # Every whitespace-separated token becomes a quoted prefix query, so
+    # "mee sha" matches "Meera Sharma" and user input can't inject FTS syntax.
+    tokens = term.split()
+    return " ".join('"' + token.replace('"', '""') + '"*' for token in tokens)
+
+def student_search_query(term, use_fts=True):
+    term = term.strip()
+    columns = "s.student_id, s.name, s.class, s.hostel_status, s.bus_status"
+    if not term:
+        return KeysetQuery(f"SELECT s.name AS sort_name, s.rowid AS sort_rowid, {columns} FROM students s",
+                           keys=("sort_name", "sort_rowid"))
+    if use_fts:
+        return KeysetQuery(f'''SELECT bm25(students_fts, 2.0, 1.0) AS score, s.rowid AS sort_rowid, {columns}
+                              FROM students_fts JOIN students s ON s.rowid = students_fts.rowid
+                              WHERE students_fts MATCH ?''',
+                           (fts_query(term),), keys=("score", "sort_rowid"))
+    return KeysetQuery(f"SELECT s.rowid AS sort_rowid, {columns} FROM students s WHERE s.name LIKE ? OR s.class LIKE ?",
+                       (f"%{term}%", f"%{term}%"), keys=("sort_rowid",))
+
+def search_students(conn, term, limit=-1, use_fts=True):
+    query = student_search_query(term, use_fts)
+    return [query.values(row) for row in query.page(conn, limit=limit)]
+
+# Fee Ledger
+FEE_TYPES = ("Class", "Hostel", "Bus")
+PAYMENT_INSERT_SQL = '''INSERT INTO fee_transactions (transaction_id, student, fee_type, amount, payment_date)
+                        VALUES (?, (SELECT id FROM students WHERE student_id = ?), ?, ?, ?)'''
+
+def normalize_fee_type(fee_type):
+    for known in FEE_TYPES:
+        if fee_type.strip().lower() == known.lower():
+            return known
+    raise ValueError(f"Fee type must be one of {', '.join(FEE_TYPES)}")
+
+def set_class_fee(db, class_, amount):
+    with db.transaction() as c:
+        c.execute("INSERT INTO fees (class, amount) VALUES (?, ?) "
+                  "ON CONFLICT(class) DO UPDATE SET amount = excluded.amount", (class_, amount))
+
+def set_service_fee(db, fee_type, amount):
+    fee_type = normalize_fee_type(fee_type)
+    if fee_type == 'Class':
+        raise ValueError("Class fees are set per class")
+    with db.transaction() as c:
+        c.execute("UPDATE service_fees SET amount = ? WHERE fee_type = ?", (amount, fee_type))
+
+def service_fees(db):
+    return dict(db.fetchall("SELECT fee_type, amount FROM service_fees"))
+
+def class_fees_query():
+    return KeysetQuery("SELECT class AS sort_class, class, amount FROM fees", keys=("sort_class",))
+
+STUDENT_DUES_QUERY = '''SELECT fee_type, amount_due - amount_paid FROM fee_balances
+                        WHERE student = (SELECT id FROM students WHERE student_id = ?) AND amount_paid < amount_due'''
+
+def pending_dues(db, student_id):
+    return db.fetchall(STUDENT_DUES_QUERY, (student_id,))
+
+def outstanding_dues_query(class_=None):
+    sql = '''SELECT b.student AS sort_student, b.fee_type AS sort_type,
+                    s.student_id, s.name, s.class, b.fee_type, b.amount_due - b.amount_paid
+             FROM fee_balances b JOIN students s ON s.id = b.student
+             WHERE b.amount_paid < b.amount_due'''
+    params = ()
+    if class_:
+        sql += " AND s.class = ?"
+        params = (class_,)
+    return KeysetQuery(sql, params, keys=("sort_student", "sort_type"))
+
+# Marks and Report Cards
+# Writes take the student's UUID and store its integer id.
+MARKS_UPSERT_SQL = '''INSERT INTO report_cards (report_id, student, subject, marks, created_at)
+                       VALUES (?, (SELECT id FROM students WHERE student_id = ?), ?, ?, ?)
+                       ON CONFLICT(student, subject) DO UPDATE SET marks = excluded.marks, created_at = excluded.created_at'''
+GRADE_BANDS = ((90, "A+"), (80, "A"), (70, "B"), (60, "C"), (50, "D"))
+REPORT_CARD_FETCH_ROWS = 500
+
+def parse_marks(value):
+    try:
+        marks = int(value)
+        if marks < 0 or marks > 100:
+            raise ValueError
+    except ValueError:
+        raise ValueError("Marks must be a number between 0 and 100")
+    return marks
+
+def save_class_marks(db, entries):
+    # entries: (student_id, subject, marks), all upserted in one transaction.
+    created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with db.transaction() as c:
+        c.executemany(MARKS_UPSERT_SQL, [(str(uuid.uuid4()), student_id, subject, marks, created_at)
+                                         for student_id, subject, marks in entries])
+        db.after_commit(lambda: student_dashboards.invalidate({student_id for student_id, _, _ in entries}))
+
+def grade_for(average):
+    if average is None:
+        return "-"
+    for floor, grade in GRADE_BANDS:
+        if average >= floor:
+            return grade
+    return "F"
+
+def report_card_text(student_id, name, class_, marks, total, average, rank, class_size, date):
+    lines = [
+        "Report Card",
+        f"Student ID: {student_id}",
+        f"Name: {name}",
+        f"Class: {class_}",
+        f"Date: {date}",
+        "",
+        f"{'Subject':<24}{'Marks':>6}",
+    ]
+    lines.extend(f"{subject:<24}{mark:>6}" for subject, mark in marks)
+    lines.append("")
+    if total is None:
+        lines.append("No marks recorded")
+    else:
+        lines.append(f"Total: {total}  Average: {average:.2f}  Grade: {grade_for(average)}")
+        lines.append(f"Class Rank: {rank} of {class_size}")
+    return "\n".join(lines) + "\n"
+
+def generate_report_cards(db, class_, output, progress=None):
+    # Totals, averages and class rank for the whole class come from one
+    # windowed query; its rows arrive grouped by student, so each card is
+    # written as soon as its rows have been read.
+    sql = '''WITH totals AS (
+                 SELECT s.id, s.student_id, s.name, SUM(r.marks) AS total, AVG(r.marks) AS average
+                 FROM students s LEFT JOIN report_cards r ON r.student = s.id
+                 WHERE s.class = ?
+                 GROUP BY s.id),
+             ranked AS (
+                 SELECT *, RANK() OVER (ORDER BY total DESC) AS position FROM totals)
+             SELECT k.student_id, k.name, k.total, k.average, k.position, r.subject, r.marks
+             FROM ranked k LEFT JOIN report_cards r ON r.student = k.id
+             ORDER BY k.position, k.name, k.student_id, r.subject'''
+    date = datetime.now().strftime('%Y-%m-%d')
+    documents = DocumentWriter(output)
+    done = 0
+    try:
+        with csv_manifest(documents, "class_summary.csv",
+                          ["rank", "student_id", "name", "total", "average", "grade"]) as summary, \
+                db.reader() as conn:
+            conn.execute("BEGIN")
+            try:
+                class_size = conn.execute("SELECT COUNT(*) FROM students WHERE class=?", (class_,)).fetchone()[0]
+                cur = conn.execute(sql, (class_,))
+                rows = itertools.chain.from_iterable(iter(lambda: cur.fetchmany(REPORT_CARD_FETCH_ROWS), []))
+                for student_id, group in itertools.groupby(rows, key=lambda row: row[0]):
+                    group = list(group)
+                    _, name, total, average, rank = group[0][:5]
+                    marks = [(row[5], row[6]) for row in group if row[5] is not None]
+                    documents.write(f"report_card_{student_id}.txt",
+                                    report_card_text(student_id, name, class_, marks, total, average,
+                                                     rank, class_size, date))
+                    summary.writerow([rank if total is not None else "", student_id, name,
+                                      total if total is not None else "",
+                                      f"{average:.2f}" if average is not None else "", grade_for(average)])
+                    done += 1
+                    if progress:
+                        progress(done, class_size)
+            finally:
+                conn.execute("COMMIT")
+    finally:
+        documents.close()
+    return done
+
+# Payroll
+# A random version 4 UUID built in SQL, for set-based inserts.
+SQL_UUID4 = ("lower(hex(randomblob(4)) || '-' || hex(randomblob(2)) || '-4' || substr(hex(randomblob(2)), 2) || '-' || "
+             "substr('89ab', 1 + abs(random()) % 4, 1) || substr(hex(randomblob(2)), 2) || '-' || hex(randomblob(6)))")
+
+def parse_month(value):
+    try:
+        return datetime.strptime(value.strip(), "%Y-%m").strftime("%Y-%m")
+    except ValueError:
+        raise ValueError("Month must be YYYY-MM")
+
+def run_payroll(db, month):
+    # Issues a slip at the current salary for every active employee in one
+    # statement. The unique (employee_id, month) index makes it idempotent:
+    # re-running after an interruption only fills in the missing slips.
+    month = parse_month(month)
+    issued_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with db.transaction() as c:
+        c.execute(f'''INSERT INTO salary_slips (slip_id, employee_id, month, amount, issued_date)
+                      SELECT {SQL_UUID4}, employee_id, ?, salary, ? FROM employees
+                      WHERE status = 'Active' AND salary IS NOT NULL
+                      ON CONFLICT(employee_id, month) DO NOTHING''', (month, issued_date))
+        issued = c.rowcount
+        total = c.execute("SELECT COUNT(*) FROM salary_slips WHERE month=?", (month,)).fetchone()[0]
+    return issued, total - issued
+
+def export_payroll(db, month, path):
+    month = parse_month(month)
+    count = 0
+    total = 0.0
+    with db.reader() as conn, open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(["slip_id", "employee_id", "name", "designation", "month", "amount", "issued_date"])
+        cur = conn.execute('''SELECT p.slip_id, p.employee_id, e.name, e.designation, p.month, p.amount, p.issued_date
+                              FROM salary_slips p JOIN employees e ON e.employee_id = p.employee_id
+                              WHERE p.month = ? ORDER BY e.name''', (month,))
+        while True:
+            rows = cur.fetchmany(EXPORT_FETCH_ROWS)
+            if not rows:
+                break
+            writer.writerows(rows)
+            count += len(rows)
+            total += sum(row[5] for row in rows)
+        writer.writerow([])
+        writer.writerow(["Total", "", f"{count} slips", "", month, total, ""])
+    return count, total
+
+# Hostel Rooms
+GENDERS = {"m": "M", "male": "M", "f": "F", "female": "F"}
+
+def normalize_gender(value):
+    # Gender is optional; an empty value means "not recorded".
+    value = (value or '').strip()
+    if not value:
+        return None
+    if value.lower() not in GENDERS:
+        raise ValueError("Gender must be M or F")
+    return GENDERS[value.lower()]
+
+def save_room(db, room_number, block, capacity, gender=None, class_=None):
+    with db.transaction() as c:
+        occupied = c.execute("SELECT occupied FROM hostel_rooms WHERE room_number=?", (room_number,)).fetchone()
+        if occupied and capacity < occupied[0]:
+            raise ValueError(f"Room {room_number} already has {occupied[0]} occupants")
+        c.execute('''INSERT INTO hostel_rooms (room_number, block, capacity, occupied, gender, class) VALUES (?, ?, ?, 0, ?, ?)
+                     ON CONFLICT(room_number) DO UPDATE SET block = excluded.block, capacity = excluded.capacity,
+                         gender = excluded.gender, class = excluded.class''',
+                  (room_number, block, capacity, gender, class_))
+
+def next_free_room(conn, gender=None, class_=None):
+    return conn.execute('''SELECT room_number FROM hostel_rooms
+                           WHERE occupied < capacity AND (gender IS NULL OR gender = ?) AND (class IS NULL OR class = ?)
+                           ORDER BY gender IS NULL, class IS NULL, room_number LIMIT 1''', (gender, class_)).fetchone()
+
+def room_occupants(conn, room_number):
+    return conn.execute('''SELECT s.student_id, s.name, s.class, h.joining_date
+                           FROM hostelers h JOIN students s ON s.student_id = h.student_id
+                           WHERE h.room_number = ? ORDER BY s.name''', (room_number,)).fetchall()
+
+def allocate_beds(db, class_=None, joining_date=None):
+    # Assigns a bed to every hosteler without one, in one transaction. Free
+    # rooms are loaded once and grouped by (gender, class) block; each student
+    # takes the first room of the most specific block they fit (their gender
+    # and class, then gender only, then class only, then open rooms), filling
+    # rooms in order. Returns the allocations and the students left unplaced.
+    joining_date = joining_date or datetime.now().strftime("%Y-%m-%d")
+    with db.transaction() as c:
+        free = {}
+        for room_number, gender, room_class, beds in c.execute(
+                '''SELECT room_number, gender, class, capacity - occupied FROM hostel_rooms
+                   WHERE occupied < capacity ORDER BY room_number'''):
+            free.setdefault((gender, room_class), collections.deque()).append([room_number, beds])
+        
+        sql = '''SELECT s.student_id, s.gender, s.class FROM students s
+                 WHERE s.hostel_status = 'Yes' AND NOT EXISTS (SELECT 1 FROM hostelers h WHERE h.student_id = s.student_id)'''
+        params = ()
+        if class_:
+            sql += " AND s.class = ?"
+            params = (class_,)
+        allocations = []
+        unplaced = []
+        for student_id, gender, student_class in c.execute(sql + " ORDER BY s.class, s.name", params).fetchall():
+            for block in ((gender, student_class), (gender, None), (None, student_class), (None, None)):
+                rooms = free.get(block)
+                if not rooms:
+                    continue
+                room = rooms[0]
+                room[1] -= 1
+                if not room[1]:
+                    rooms.popleft()
+                allocations.append((str(uuid.uuid4()), student_id, room[0], joining_date))
+                break
+            else:
+                unplaced.append(student_id)
+        c.executemany("INSERT INTO hostelers (hosteler_id, student_id, room_number, joining_date) VALUES (?, ?, ?, ?)",
+                      allocations)
+    return allocations, unplaced
+
+# Bus Routes
+def parse_stops(value):
+    stops = []
+    for stop in value.split(','):
+        stop = stop.strip()
+        if stop and stop not in stops:
+            stops.append(stop)
+    if not stops:
+        raise ValueError("At least one pickup point is required")
+    return stops
+
+def save_route(db, route_number, capacity, stops):
+    # Replaces the route's stops in order. Riders already booked at a stop
+    # that is dropped keep their seat.
+    with db.transaction() as c:
+        riders = c.execute("SELECT riders FROM bus_routes WHERE route_number=?", (route_number,)).fetchone()
+        if riders and capacity < riders[0]:
+            raise ValueError(f"Route {route_number} already has {riders[0]} riders")
+        c.execute('''INSERT INTO bus_routes (route_number, capacity, riders) VALUES (?, ?, 0)
+                     ON CONFLICT(route_number) DO UPDATE SET capacity = excluded.capacity''', (route_number, capacity))
+        c.execute("DELETE FROM bus_stops WHERE route_number=?", (route_number,))
+        c.executemany("INSERT INTO bus_stops (pickup_point, route_number, stop_order) VALUES (?, ?, ?)",
+                      [(stop, route_number, order) for order, stop in enumerate(stops, 1)])
+
+def route_riders(conn, route_number):
+    return conn.execute('''SELECT s.student_id, s.name, s.class, b.pickup_point
+                           FROM bus_holders b JOIN students s ON s.student_id = b.student_id
+                           LEFT JOIN bus_stops t ON t.pickup_point = b.pickup_point AND t.route_number = b.route_number
+                           WHERE b.route_number = ? ORDER BY t.stop_order, s.name''', (route_number,)).fetchall()
+
+def assign_bus_routes(db, class_=None):
+    # Seats every bus student without a bus_holders row on a route that
+    # stops at their pickup point, in one transaction. Seats left on each
+    # route are loaded once; each student takes the route serving their stop
+    # with the most free seats, so load spreads across overlapping routes.
+    # Returns the assignments and the overflow as (student_id, name,
+    # pickup_point, reason).
+    with db.transaction() as c:
+        seats = dict(c.execute("SELECT route_number, capacity - riders FROM bus_routes"))
+        routes_at = {}
+        for pickup_point, route_number in c.execute("SELECT pickup_point, route_number FROM bus_stops"):
+            routes_at.setdefault(pickup_point, []).append(route_number)
+        
+        sql = '''SELECT s.student_id, s.name, s.pickup_point FROM students s
+                 WHERE s.bus_status = 'Yes' AND NOT EXISTS (SELECT 1 FROM bus_holders b WHERE b.student_id = s.student_id)'''
+        params = ()
+        if class_:
+            sql += " AND s.class = ?"
+            params = (class_,)
+        assignments = []
+        overflow = []
+        for student_id, name, pickup_point in c.execute(sql + " ORDER BY s.pickup_point, s.name", params).fetchall():
+            if not pickup_point:
+                overflow.append((student_id, name, pickup_point, "No pickup point recorded"))
+                continue
+            routes = routes_at.get(pickup_point)
+            if not routes:
+                overflow.append((student_id, name, pickup_point, "No route stops here"))
+                continue
+            route_number = max(routes, key=seats.get)
+            if seats[route_number] <= 0:
+                overflow.append((student_id, name, pickup_point, "All routes through this stop are full"))
+                continue
+            seats[route_number] -= 1
+            assignments.append((str(uuid.uuid4()), student_id, route_number, pickup_point))
+        c.executemany("INSERT INTO bus_holders (bus_holder_id, student_id, route_number, pickup_point) VALUES (?, ?, ?, ?)",
+                      assignments)
+    return assignments, overflow
+
+# Dashboard Aggregates
+# table: (key column, query recomputing it from the base tables)
+DASHBOARD_AGGREGATES = {
+    "class_stats": ("class", '''SELECT class, COUNT(*), SUM(hostel_status = 'Yes'), SUM(bus_status = 'Yes')
+                               FROM students GROUP BY class'''),
+    "route_stats": ("route_number", "SELECT route_number, COUNT(*) FROM bus_holders GROUP BY route_number"),
+    "monthly_collections": ("month", '''SELECT substr(payment_date, 1, 7), COUNT(*), SUM(amount)
+                                       FROM fee_transactions GROUP BY substr(payment_date, 1, 7)'''),
+    "dashboard_totals": ("name", '''SELECT 'hostelers', COUNT(*) FROM hostelers
+                                  UNION ALL
+                                  SELECT 'beds', COALESCE(SUM(capacity), 0) FROM hostel_rooms
+                                  UNION ALL
+                                  SELECT 'outstanding_dues', COALESCE(SUM(amount_due - amount_paid), 0)
+                                  FROM fee_balances WHERE amount_paid < amount_due'''),
+}
+
+def rebuild_dashboard(c):
+    for table, (_, query) in DASHBOARD_AGGREGATES.items():
+        c.execute(f"DELETE FROM {table}")
+        c.execute(f"INSERT INTO {table} {query}")
+
+def aggregate_rows(rows):
+    # Rows whose counters are all zero are left behind by deletes and are
+    # equivalent to missing rows.
+    return {row[0]: tuple(round(value or 0, 2) for value in row[1:])
+            for row in rows if any(row[1:])}
+
+def verify_dashboard(db):
+    # Returns (table, key, stored, expected) for every aggregate that has
+    # drifted from the base tables. Runs in one read snapshot.
+    mismatches = []
+    with db.reader() as conn:
+        conn.execute("BEGIN")
+        try:
+            for table, (key, query) in DASHBOARD_AGGREGATES.items():
+                stored = aggregate_rows(conn.execute(f"SELECT * FROM {table}"))
+                expected = aggregate_rows(conn.execute(query))
+                for name in sorted(set(stored) | set(expected), key=str):
+                    if stored.get(name) != expected.get(name):
+                        mismatches.append((table, name, stored.get(name), expected.get(name)))
+        finally:
+            conn.execute("COMMIT")
+    return mismatches
+
+def dashboard_summary(db):
+    month = datetime.now().strftime("%Y-%m")
+    with db.reader() as conn:
+        conn.execute("BEGIN")
+        try:
+            totals = dict(conn.execute("SELECT name, value FROM dashboard_totals"))
+            classes = conn.execute("SELECT class, students, hostel, bus FROM class_stats "
+                                   "WHERE students > 0 ORDER BY class").fetchall()
+            routes = conn.execute('''SELECT s.route_number, s.riders, COALESCE(r.capacity, '')
+                                     FROM route_stats s LEFT JOIN bus_routes r ON r.route_number = s.route_number
+                                     WHERE s.riders > 0 ORDER BY s.route_number''').fetchall()
+            monthly = conn.execute("SELECT month, payments, amount FROM monthly_collections "
+                                   "WHERE payments > 0 ORDER BY month DESC LIMIT 12").fetchall()
+        finally:
+            conn.execute("COMMIT")
+    this_month = next((amount for name, _, amount in monthly if name == month), 0.0)
+    return {
+        "students": sum(row[1] for row in classes),
+        "hostel_students": sum(row[2] for row in classes),
+        "hostelers": int(totals.get("hostelers", 0)),
+        "beds": int(totals.get("beds", 0)),
+        "bus_riders": sum(row[1] for row in routes),
+        "collected_this_month": this_month,
+        "outstanding_dues": totals.get("outstanding_dues", 0.0),
+        "classes": classes,
+        "routes": routes,
+        "collections": monthly,
+    }
+
+# Keyset Pagination
+# A SELECT whose key columns form a unique sort order, paged with row-value
+# comparisons against the last key seen instead of OFFSET, so every page
+# costs the same however deep the user scrolls.
+class KeysetQuery:
+    def __init__(self, sql, params=(), keys=("rowid",)):
+        self.sql = sql
+        self.params = tuple(params)
+        self.keys = keys
+
+    def page(self, conn, after=None, before=None, limit=VIRTUAL_PAGE_ROWS):
+        columns = ", ".join(self.keys)
+        placeholders = ", ".join("?" * len(self.keys))
+        sql = f"SELECT * FROM ({self.sql})"
+        params = list(self.params)
+        if after is not None:
+            sql += f" WHERE ({columns}) > ({placeholders})"
+            params.extend(after)
+        elif before is not None:
+            sql += f" WHERE ({columns}) < ({placeholders})"
+            params.extend(before)
+        direction = " DESC" if before is not None else ""
+        sql += " ORDER BY " + ", ".join(key + direction for key in self.keys) + " LIMIT ?"
+        rows = conn.execute(sql, params + [limit]).fetchall()
+        if before is not None:
+            rows.reverse()
+        return rows
+
+    def key(self, row):
+        return row[:len(self.keys)]
+
+    def values(self, row):
+        return row[len(self.keys):]
+
+# Background Query Worker
+# Runs the most recently submitted query on a pooled reader connection.
+# Submitting a new query interrupts the one in flight, and chunks from
+# superseded queries are never posted, so the UI only sees the latest one.
+# Results are read from .results by the Tk loop via root.after polling.
+class QueryWorker:
+    def __init__(self, db):
+        self.db = db
+        self.results = queue.Queue()
+        self.generation = 0
+        self.pending = None
+        self.conn = None
+        self.stopped = False
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, query):
+        # query(conn) must return an iterable of row chunks.
+        with self.cond:
+            self.generation += 1
+            self.pending = (self.generation, query)
+            if self.conn is not None:
+                self.conn.interrupt()
+            self.cond.notify()
+            return self.generation
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            if self.conn is not None:
+                self.conn.interrupt()
+            self.cond.notify()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.pending is None and not self.stopped:
+                    self.cond.wait()
+                if self.stopped:
+                    return
+                generation, query = self.pending
+                self.pending = None
+            with self.db.reader() as conn:
+                with self.cond:
+                    self.conn = conn
+                chunks = None
+                try:
+                    chunks = query(conn)
+                    for rows in chunks:
+                        if generation != self.generation:
+                            break
+                        self.results.put((generation, 'rows', rows))
+                    else:
+                        self.results.put((generation, 'done', None))
+                except sqlite3.Error as e:
+                    if generation == self.generation:
+                        self.results.put((generation, 'error', e))
+                finally:
+                    if hasattr(chunks, 'close'):
+                        chunks.close()
+                    with self.cond:
+                        self.conn = None
+
+# Task Executor
+# Runs the database work of UI handlers off the Tk thread. Writes go to a
+# single writer thread and run one at a time in submission order; reads run
+# on a small pool. Completions are queued and delivered by poll(), which the
+# Tk loop calls via root.after, so callbacks always run on the Tk thread.
+class TaskExecutor:
+    def __init__(self, readers=2):
+        self.events = queue.Queue()
+        self.callbacks = {}
+        self.ids = itertools.count()
+        self.writes = queue.Queue()
+        self.reads = queue.Queue()
+        self.threads = [threading.Thread(target=self.run, args=(self.writes,), daemon=True)]
+        self.threads += [threading.Thread(target=self.run, args=(self.reads,), daemon=True) for _ in range(readers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, work, on_done, on_error, write=True):
+        task_id = next(self.ids)
+        self.callbacks[task_id] = (on_done, on_error)
+        (self.writes if write else self.reads).put((task_id, work))
+        return task_id
+
+    def run(self, tasks):
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            task_id, work = task
+            try:
+                self.events.put((task_id, True, work()))
+            except Exception as e:
+                self.events.put((task_id, False, e))
+
+    def pending(self):
+        return len(self.callbacks)
+
+    def poll(self):
+        while True:
+            try:
+                task_id, ok, payload = self.events.get_nowait()
+            except queue.Empty:
+                return
+            on_done, on_error = self.callbacks.pop(task_id)
+            (on_done if ok else on_error)(payload)
+
+    def stop(self):
+        # Queued writes are finished before the threads exit.
+        self.writes.put(None)
+        for _ in self.threads[1:]:
+            self.reads.put(None)
+        for thread in self.threads:
+            thread.join()
+
+# Group Commit
+# An asyncio front end for many concurrent callers. Reads run on a thread
+# pool against the reader connections. Writes queue up while the previous
+# batch commits, then up to GROUP_COMMIT_MAX_OPS of them run in a single
+# transaction on one writer thread, each inside its own savepoint. An
+# operation that fails rolls back alone and its caller gets the exception;
+# the rest commit together, so N concurrent fee payments cost one commit
+# instead of N. Callers without an event loop use start_thread() and call().
+GROUP_COMMIT_MAX_OPS = 256
+
+class GroupCommitEngine:
+    def __init__(self, db, readers=4, max_ops=GROUP_COMMIT_MAX_OPS):
+        self.db = db
+        self.readers = readers
+        self.max_ops = max_ops
+        self.loop = None
+        self.thread = None
+        self.batches = 0
+        self.operations = 0
+
+    async def start(self):
+        import asyncio  # only the API and benchmarks need it; keeps startup light
+        from concurrent.futures import ThreadPoolExecutor
+        self.loop = asyncio.get_running_loop()
+        self.pending = asyncio.Queue()
+        self.writer = ThreadPoolExecutor(1, thread_name_prefix="group-commit")
+        self.read_pool = ThreadPoolExecutor(self.readers, thread_name_prefix="group-read")
+        self.committer = self.loop.create_task(self.commit_loop())
+
+    async def stop(self):
+        # Operations queued before stop() are still committed.
+        await self.pending.put(None)
+        await self.committer
+        self.writer.shutdown()
+        self.read_pool.shutdown()
+
+    async def write(self, work):
+        future = self.loop.create_future()
+        await self.pending.put((work, future))
+        return await future
+
+    async def read(self, query):
+        def run():
+            with self.db.reader() as conn:
+                return query(conn)
+        return await self.loop.run_in_executor(self.read_pool, run)
+
+    async def commit_loop(self):
+        stopping = False
+        while not stopping:
+            batch = [await self.pending.get()]
+            while len(batch) < self.max_ops and not self.pending.empty():
+                batch.append(self.pending.get_nowait())
+            stopping = None in batch
+            batch = [operation for operation in batch if operation is not None]
+            if not batch:
+                continue
+            try:
+                results = await self.loop.run_in_executor(self.writer, self.commit, [work for work, _ in batch])
+            except Exception as e:
+                # The batch itself failed to commit, so nothing in it was saved.
+                results = [(False, e)] * len(batch)
+            for (_, future), (ok, payload) in zip(batch, results):
+                if future.cancelled():
+                    continue
+                if ok:
+                    future.set_result(payload)
+                else:
+                    future.set_exception(payload)
+
+    def commit(self, works):
+        results = []
+        with self.db.transaction():
+            for work in works:
+                try:
+                    with self.db.transaction():
+                        results.append((True, work()))
+                except Exception as e:
+                    results.append((False, e))
+        self.batches += 1
+        self.operations += len(works)
+        return results
+
+    def start_thread(self):
+        import asyncio
+        started = threading.Event()
+        
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self.start())
+            started.set()
+            loop.run_forever()
+            loop.close()
+        
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        started.wait()
+
+    def call(self, work):
+        # Blocking write from a thread other than the engine's.
+        import asyncio
+        return asyncio.run_coroutine_threadsafe(self.write(work), self.loop).result()
+
+    def stop_thread(self):
+        import asyncio
+        asyncio.run_coroutine_threadsafe(self.stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+# Virtual List
+# A Treeview that holds at most VIRTUAL_MAX_PAGES pages of a KeysetQuery.
+# Pages are fetched on a QueryWorker as the user nears either end of the
+# list, and the page furthest from the viewport is dropped, so memory and
+# render time stay flat however large the result set is. The worker thread
+# and the poll loop only exist while a page is loading and the list is on
+# screen.
+class VirtualTreeview(ttk.Frame):
+    def __init__(self, parent, db, columns, headings, empty_text="No results",
+                 page_size=VIRTUAL_PAGE_ROWS, max_pages=VIRTUAL_MAX_PAGES):
+        super().__init__(parent)
+        self.tree = ttk.Treeview(self, columns=columns, show="headings")
+        for column, heading in zip(columns, headings):
+            self.tree.heading(column, text=heading)
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.on_scroll)
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+        self.empty_label = tk.Label(self, text=empty_text, font=("Arial", 12), fg="red")
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.db = db
+        self.worker = None
+        self.polling = None
+        self.query = None
+        self.pages = []  # (first_key, last_key, item_ids) in display order
+        self.more_above = False
+        self.more_below = False
+        self.loading = None
+        self.bind("<Destroy>", self.on_destroy)
+
+    def on_destroy(self, event):
+        if event.widget is self:
+            if self.polling is not None:
+                self.after_cancel(self.polling)
+                self.polling = None
+            self.stop_loading()
+
+    def stop_loading(self):
+        self.loading = None
+        if self.worker is not None:
+            self.worker.stop()
+            self.worker = None
+
+    def set_query(self, query):
+        self.query = query
+        self.load('reset')
+
+    def clear(self):
+        self.query = None
+        self.loading = None
+        self.pages = []
+        self.more_above = False
+        self.more_below = False
+        self.tree.delete(*self.tree.get_children())
+        self.empty_label.pack_forget()
+
+    def load(self, direction):
+        query = self.query
+        limit = self.page_size
+        after = self.pages[-1][1] if direction == 'below' else None
+        before = self.pages[0][0] if direction == 'above' else None
+        if self.worker is None:
+            self.worker = QueryWorker(self.db)
+        generation = self.worker.submit(lambda conn: [query.page(conn, after, before, limit)])
+        self.loading = (generation, direction)
+        if self.polling is None:
+            self.polling = self.after(TASK_POLL_MS, self.poll)
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if self.loading is not None or not self.pages:
+            return
+        if float(last) > 0.9 and self.more_below:
+            self.load('below')
+        elif float(first) < 0.1 and self.more_above:
+            self.load('above')
+
+    def poll(self):
+        self.polling = None
+        if not self.winfo_viewable():
+            # A list packed since the load started is only mapped at idle.
+            self.update_idletasks()
+        if not self.winfo_viewable():
+            # Hidden mid-load: the page is dropped, and the next load
+            # (a refresh, a new search or a scroll) starts over.
+            self.stop_loading()
+            return
+        while self.loading is not None:
+            try:
+                generation, kind, payload = self.worker.results.get_nowait()
+            except queue.Empty:
+                break
+            if generation != self.loading[0]:
+                continue
+            if kind == 'rows':
+                self.apply(self.loading[1], payload)
+            elif kind == 'error':
+                messagebox.showerror("Error", f"Query failed: {payload}")
+            self.stop_loading()
+        if self.loading is not None:
+            self.polling = self.after(TASK_POLL_MS, self.poll)
+
+    def apply(self, direction, rows):
+        if direction == 'reset':
+            self.tree.delete(*self.tree.get_children())
+            self.tree.yview_moveto(0)
+            self.pages = []
+            self.more_above = False
+            if rows:
+                self.empty_label.pack_forget()
+            else:
+                self.empty_label.pack(before=self.tree, side="top", pady=10)
+        if direction == 'above':
+            self.more_above = len(rows) == self.page_size
+        else:
+            self.more_below = len(rows) == self.page_size
+        if not rows:
+            return
+        page_keys = (self.query.key(rows[0]), self.query.key(rows[-1]))
+        if direction == 'above':
+            items = [self.tree.insert("", index, values=self.query.values(row)) for index, row in enumerate(rows)]
+            self.pages.insert(0, page_keys + (items,))
+            anchor = items[-1]
+            if len(self.pages) > self.max_pages:
+                self.tree.delete(*self.pages.pop()[2])
+                self.more_below = True
+        else:
+            items = [self.tree.insert("", "end", values=self.query.values(row)) for row in rows]
+            self.pages.append(page_keys + (items,))
+            anchor = items[0]
+            if len(self.pages) > self.max_pages:
+                self.tree.delete(*self.pages.pop(0)[2])
+                self.more_above = True
+        if direction != 'reset':
+            self.tree.see(anchor)
+
+# Audit Log
+# log_action only appends to an in-memory buffer. A writer thread flushes the
+# buffer in one transaction once AUDIT_FLUSH_ROWS entries are waiting or
+# AUDIT_FLUSH_SECONDS have passed, and drains it completely on close(). A
+# full buffer blocks callers until the writer catches up, so entries are
+# never dropped. With file_path set, entries are appended to a JSONL file
+# instead of system_logs. If the final drain on close() cannot reach
+# system_logs, the rest goes to a JSONL file next to the database; entries
+# that cannot be stored anywhere make flush() and close() raise.
+AUDIT_BUFFER_ROWS = 10000
+AUDIT_FLUSH_ROWS = 256
+AUDIT_FLUSH_SECONDS = 0.5
+AUDIT_WRITE_RETRIES = 3
+AUDIT_COLUMNS = ("log_id", "action", "username", "timestamp")
+AUDIT_FALLBACK_SUFFIX = ".audit.jsonl"
+
+def append_jsonl(path, batch):
+    with open(path, 'a', encoding='utf-8') as f:
+        f.writelines(json.dumps(dict(zip(AUDIT_COLUMNS, entry))) + "\n" for entry in batch)
+
+class AuditLog:
+    def __init__(self, db, file_path=None):
+        self.db = db
+        self.file_path = file_path
+        self.buffer = collections.deque()
+        self.cond = threading.Condition()
+        self.queued = 0
+        self.written = 0
+        self.failed = 0
+        self.error = None
+        self.retries = 0
+        self.flush_requested = False
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def record(self, action, username):
+        entry = (str(uuid.uuid4()), action, username, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        with self.cond:
+            if self.closed:
+                raise RuntimeError("Audit log is closed")
+            # The writer empties the buffer within AUDIT_WRITE_RETRIES cycles,
+            # falling back to the JSONL file, so this wait is bounded.
+            while len(self.buffer) >= AUDIT_BUFFER_ROWS and self.thread.is_alive():
+                self.cond.notify_all()
+                self.cond.wait(AUDIT_FLUSH_SECONDS)
+            self.buffer.append(entry)
+            self.queued += 1
+            if len(self.buffer) >= AUDIT_FLUSH_ROWS:
+                self.cond.notify_all()
+
+    def flush(self):
+        # Blocks until everything recorded so far has been written.
+        with self.cond:
+            target = self.queued
+            self.flush_requested = True
+            self.cond.notify_all()
+            while self.written + self.failed < target and self.thread.is_alive():
+                self.cond.wait(0.1)
+            self.check()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.thread.join()
+        with self.cond:
+            self.check()
+
+    def check(self):
+        if self.failed:
+            raise RuntimeError(f"{self.failed} audit entries could not be written: {self.error}")
+
+    def run(self):
+        while True:
+            with self.cond:
+                deadline = time.monotonic() + AUDIT_FLUSH_SECONDS
+                while len(self.buffer) < AUDIT_FLUSH_ROWS and not (self.closed or self.flush_requested):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+                batch = list(self.buffer)
+                self.buffer.clear()
+                self.flush_requested = False
+                closed = self.closed
+                self.cond.notify_all()
+            written = len(batch)
+            if batch:
+                try:
+                    self.write(batch)
+                except (sqlite3.Error, OSError) as e:
+                    if not closed and self.retries < AUDIT_WRITE_RETRIES:
+                        # Put the batch back and retry on the next cycle.
+                        self.retries += 1
+                        with self.cond:
+                            self.buffer.extendleft(reversed(batch))
+                            self.cond.wait_for(lambda: self.closed, AUDIT_FLUSH_SECONDS)
+                        continue
+                    written = self.write_fallback(batch, e)
+                self.retries = 0
+            with self.cond:
+                self.written += written
+                if written < len(batch):
+                    self.failed += len(batch) - written
+                self.cond.notify_all()
+                if closed and not self.buffer:
+                    return
+
+    def write(self, batch):
+        if self.file_path:
+            append_jsonl(self.file_path, batch)
+        else:
+            with self.db.transaction() as c:
+                c.executemany("INSERT INTO system_logs (log_id, action, username, timestamp) VALUES (?, ?, ?, ?)",
+                              batch)
+
+    def write_fallback(self, batch, error):
+        # Returns how many entries were stored.
+        if not self.file_path:
+            try:
+                append_jsonl(self.db.path + AUDIT_FALLBACK_SUFFIX, batch)
+                return len(batch)
+            except OSError as e:
+                error = e
+        self.error = error
+        return 0
+
+_audit_log = None
+_audit_file = None
+_audit_lock = threading.Lock()
+
+def get_audit_log():
+    global _audit_log
+    with _audit_lock:
+        if _audit_log is None:
+            _audit_log = AuditLog(get_db(), _audit_file)
+        return _audit_log
+
+def configure_audit_log(file_path=None):
+    global _audit_file
+    close_audit_log()
+    _audit_file = file_path
+
+def close_audit_log():
+    global _audit_log
+    with _audit_lock:
+        audit_log, _audit_log = _audit_log, None
+    if audit_log is not None:
+        audit_log.close()
+
+atexit.register(close_audit_log)
 
 # Log Action
 def log_action(action, username):
-    conn = sqlite3.connect('school_management.db')
-    c = conn.cursor()
-    log_id = str(uuid.uuid4())
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    c.execute("INSERT INTO system_logs (log_id, action, username, timestamp) VALUES (?, ?, ?, ?)",
-              (log_id, action, username, timestamp))
-    conn.commit()
-    conn.close()
+    get_audit_log().record(action, username)
+
+# Bulk Import
+# Streams a CSV or Excel file, validates each row and inserts the valid ones
+# with executemany, one transaction per IMPORT_BATCH_ROWS. If a batch still
+# fails at insert time it is retried row by row, so a bad row is reported
+# instead of aborting the import.
+IMPORT_BATCH_ROWS = 1000
+IMPORT_MAX_ERRORS = 1000
+ISSUED_PASSWORD_BYTES = 9
+
+# The usernames handed out so far in a batch, and the batch's issued
+# passwords with their hashes. The hashes are computed up front, on a thread
+# pool since PBKDF2 releases the GIL, so that work stays outside the write
+# transaction.
+class IssuedCredentials:
+    def __init__(self, count=0):
+        self.usernames = set()
+        passwords = [secrets.token_urlsafe(ISSUED_PASSWORD_BYTES) for _ in range(count)]
+        self.hashes = collections.deque()
+        if passwords:
+            import concurrent.futures  # deferred like in generate_no_dues_batch
+            with concurrent.futures.ThreadPoolExecutor() as pool:
+                self.hashes.extend(zip(passwords, pool.map(hash_password, passwords)))
+
+    def issue(self):
+        # (password, hash)
+        if self.hashes:
+            return self.hashes.popleft()
+        password = secrets.token_urlsafe(ISSUED_PASSWORD_BYTES)
+        return password, hash_password(password)
+
+def new_student_credentials(c, issued):
+    while True:
+        student_id = str(uuid.uuid4())
+        username = f"student{student_id[:8]}"
+        if username in issued.usernames:
+            continue
+        if not c.execute("SELECT 1 FROM users WHERE username=?", (username,)).fetchone():
+            issued.usernames.add(username)
+            return student_id, username
+
+def initial_password(student_id):
+    # The password schema version 0 issued, which anyone who knew the
+    # student ID could guess. Only the upgrade still needs it.
+    return student_id[:8]
+
+def required(row, *fields):
+    values = []
+    for field in fields:
+        value = row.get(field, '')
+        if not value:
+            raise ValueError(f"{field} is required")
+        values.append(value)
+    return values
+
+def yes_no(value, field):
+    value = value.capitalize()
+    if value not in ("Yes", "No"):
+        raise ValueError(f"{field} must be Yes or No")
+    return value
+
+def prepare_student(row, c, issued):
+    name, class_, hostel, bus = required(row, 'name', 'class', 'hostel', 'bus')
+    hostel = yes_no(hostel, 'hostel')
+    bus = yes_no(bus, 'bus')
+    gender = normalize_gender(row.get('gender'))
+    pickup_point = (row.get('pickup_point') or '').strip() or None
+    student_id, username = new_student_credentials(c, issued)
+    password, password_hash = issued.issue()
+    created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # The issued password comes last, after the rows the statements insert,
+    # for the credentials file.
+    return ((student_id, name, class_, hostel, bus, created_at, gender, pickup_point),
+            (username, password_hash, 'student', student_id, 1),
+            password)
+
+def prepare_hosteler(row, c, issued):
+    student_id, room_number, joining_date = required(row, 'student_id', 'room_number', 'joining_date')
+    try:
+        datetime.strptime(joining_date, "%Y-%m-%d")
+    except ValueError:
+        raise ValueError("joining_date must be YYYY-MM-DD")
+    if not c.execute("SELECT 1 FROM students WHERE student_id=? AND hostel_status='Yes'", (student_id,)).fetchone():
+        raise ValueError("Student not found or not a hosteler")
+    return ((str(uuid.uuid4()), student_id, room_number, joining_date),)
+
+def prepare_bus_holder(row, c, issued):
+    student_id, route_number, pickup_point = required(row, 'student_id', 'route_number', 'pickup_point')
+    if not c.execute("SELECT 1 FROM students WHERE student_id=? AND bus_status='Yes'", (student_id,)).fetchone():
+        raise ValueError("Student not found or not a bus holder")
+    return ((str(uuid.uuid4()), student_id, route_number, pickup_point),)
+
+def prepare_marks(row, c, issued):
+    student_id, subject, marks = required(row, 'student_id', 'subject', 'marks')
+    marks = parse_marks(marks)
+    if not c.execute("SELECT 1 FROM students WHERE student_id=?", (student_id,)).fetchone():
+        raise ValueError("Student not found")
+    created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return ((str(uuid.uuid4()), student_id, subject, marks, created_at),)
+
+def prepare_employee(row, c, issued):
+    name, designation, salary = required(row, 'name', 'designation', 'salary')
+    try:
+        salary = float(salary)
+    except ValueError:
+        raise ValueError("Invalid salary amount")
+    created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return ((str(uuid.uuid4()), name, designation, salary, created_at),)
+
+# kind: (required columns, insert statements, prepare function)
+IMPORT_SPECS = {
+    "Students": (
+        ('name', 'class', 'hostel', 'bus'),
+        ("INSERT INTO students (student_id, name, class, hostel_status, bus_status, created_at, gender, pickup_point) "
+         "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+         "INSERT INTO users (username, password, role, student_id, must_change_password) VALUES (?, ?, ?, ?, ?)"),
+        prepare_student),
+    "Hostelers": (
+        ('student_id', 'room_number', 'joining_date'),
+        ("INSERT INTO hostelers (hosteler_id, student_id, room_number, joining_date) VALUES (?, ?, ?, ?)",),
+        prepare_hosteler),
+    "Bus Holders": (
+        ('student_id', 'route_number', 'pickup_point'),
+        ("INSERT INTO bus_holders (bus_holder_id, student_id, route_number, pickup_point) VALUES (?, ?, ?, ?)",),
+        prepare_bus_holder),
+    "Employees": (
+        ('name', 'designation', 'salary'),
+        ("INSERT INTO employees (employee_id, name, designation, salary, created_at) VALUES (?, ?, ?, ?, ?)",),
+        prepare_employee),
+    "Marks": (
+        ('student_id', 'subject', 'marks'),
+        (MARKS_UPSERT_SQL,),
+        prepare_marks),
+}
+
+def import_header(values):
+    return [str(value or '').strip().lower().replace(' ', '_') for value in values]
+
+def read_import_rows(path):
+    # Yields (line number, row dict, fraction of the file read).
+    if path.lower().endswith(('.xlsx', '.xlsm')):
+        try:
+            import openpyxl
+        except ImportError:
+            raise RuntimeError("Excel import needs the openpyxl package; install it or save the sheet as CSV")
+        workbook = openpyxl.load_workbook(path, read_only=True)
+        try:
+            sheet = workbook.active
+            total = sheet.max_row or 0
+            rows = sheet.iter_rows(values_only=True)
+            header = import_header(next(rows, ()))
+            for number, values in enumerate(rows, start=2):
+                if any(value is not None for value in values):
+                    row = {key: '' if value is None else str(value).strip() for key, value in zip(header, values)}
+                    yield number, row, number / total if total else 0
+        finally:
+            workbook.close()
+        return
+    size = os.path.getsize(path) or 1
+    read = 0
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        def lines():
+            nonlocal read
+            for line in iter(f.readline, ''):
+                read += len(line)
+                yield line
+        reader = csv.reader(lines())
+        header = import_header(next(reader, []))
+        for values in reader:
+            if any(values):
+                yield reader.line_num, dict(zip(header, (value.strip() for value in values))), min(read / size, 1)
+
+def bulk_import(db, kind, path, progress=None, cancel=None, credentials_path=None):
+    columns, statements, prepare = IMPORT_SPECS[kind]
+    result = {'imported': 0, 'failed': 0, 'errors': [], 'cancelled': False}
+
+    def fail(line, message):
+        result['failed'] += 1
+        if len(result['errors']) < IMPORT_MAX_ERRORS:
+            result['errors'].append((line, message))
+
+    def insert_batch(batch):
+        inserted = []
+        issued = IssuedCredentials(len(batch) if kind == "Students" else 0)
+        with db.transaction() as c:
+            prepared = []
+            for line, row in batch:
+                try:
+                    prepared.append((line, prepare(row, c, issued)))
+                except ValueError as e:
+                    fail(line, str(e))
+            try:
+                with db.transaction() as nested:
+                    for index, sql in enumerate(statements):
+                        nested.executemany(sql, [params[index] for _, params in prepared])
+                inserted = prepared
+            except sqlite3.DatabaseError:
+                for line, params in prepared:
+                    try:
+                        with db.transaction() as nested:
+                            for sql, values in zip(statements, params):
+                                nested.execute(sql, values)
+                        inserted.append((line, params))
+                    except sqlite3.DatabaseError as e:
+                        fail(line, str(e))
+        result['imported'] += len(inserted)
+        return inserted
+
+    rows = read_import_rows(path)
+    first = next(rows, None)
+    missing = [column for column in columns if first is not None and column not in first[1]]
+    if first is None or missing:
+        rows.close()
+        raise ValueError(f"{kind} import needs the columns: {', '.join(columns)}")
+
+    credentials = None
+    if credentials_path:
+        credentials = open(credentials_path, 'w', newline='')
+        csv.writer(credentials).writerow(["student_id", "name", "class", "username", "password"])
+    try:
+        batch = []
+        processed = 0
+        for line, row, fraction in itertools.chain([first], rows):
+            batch.append((line, row))
+            processed += 1
+            if len(batch) < IMPORT_BATCH_ROWS:
+                continue
+            inserted = insert_batch(batch)
+            batch = []
+            if credentials is not None:
+                write_credentials(credentials, inserted)
+            if progress:
+                progress(processed, fraction)
+            if cancel is not None and cancel.is_set():
+                result['cancelled'] = True
+                break
+        else:
+            if batch:
+                inserted = insert_batch(batch)
+                if credentials is not None:
+                    write_credentials(credentials, inserted)
+            if progress:
+                progress(processed, 1)
+    finally:
+        rows.close()
+        if credentials is not None:
+            credentials.close()
+        if kind == "Marks":
+            student_dashboards.invalidate()
+    return result
+
+def write_credentials(f, inserted):
+    writer = csv.writer(f)
+    for _, (student, user, password) in inserted:
+        writer.writerow([student[0], student[1], student[2], user[0], password])
+
+# Bulk Export
+# Rows are streamed from a pooled reader connection with fetchmany straight
+# to disk, so memory stays constant however large the table is. The export
+# runs inside one read transaction and sees a consistent snapshot while
+# other connections keep writing.
+EXPORT_FETCH_ROWS = 1000
+
+# table: (rows as exported, date column, class filter). Students are
+# exported by their UUID, never by the internal integer key.
+EXPORT_SPECS = {
+    "students": ('''SELECT student_id, name, class, hostel_status, bus_status, created_at, gender, pickup_point
+                    FROM students''', "created_at", "class = ?"),
+    "fee_transactions": ('''SELECT t.transaction_id, s.student_id, t.fee_type, t.amount, t.payment_date
+                            FROM fee_transactions t LEFT JOIN students s ON s.id = t.student''',
+                         "payment_date", "student_id IN (SELECT student_id FROM students WHERE class = ?)"),
+    "report_cards": ('''SELECT r.report_id, s.student_id, r.subject, r.marks, r.created_at
+                        FROM report_cards r LEFT JOIN students s ON s.id = r.student''',
+                     "created_at", "student_id IN (SELECT student_id FROM students WHERE class = ?)"),
+    "salary_slips": ("SELECT * FROM salary_slips", "issued_date", None),
+    "system_logs": ("SELECT * FROM system_logs", "timestamp", None),
+}
+
+def export_query(table, class_=None, date_from=None, date_to=None):
+    query, date_column, class_filter = EXPORT_SPECS[table]
+    where = []
+    params = []
+    if class_:
+        if class_filter is None:
+            raise ValueError(f"{table} cannot be filtered by class")
+        where.append(class_filter)
+        params.append(class_)
+    for value, condition in ((date_from, f"{date_column} >= ?"), (date_to, f"{date_column} < date(?, '+1 day')")):
+        if value:
+            try:
+                datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                raise ValueError("Dates must be YYYY-MM-DD")
+            where.append(condition)
+            params.append(value)
+    sql = f"SELECT * FROM ({query})"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql, params
+
+def export_table(db, table, path, fmt='csv', class_=None, date_from=None, date_to=None,
+                 progress=None, cancel=None):
+    sql, params = export_query(table, class_, date_from, date_to)
+    written = 0
+    cancelled = False
+    with db.reader() as conn:
+        conn.execute("BEGIN")
+        try:
+            total = conn.execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
+            cur = conn.execute(sql, params)
+            columns = [column[0] for column in cur.description]
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                if fmt == 'csv':
+                    writer.writerow(columns)
+                while True:
+                    rows = cur.fetchmany(EXPORT_FETCH_ROWS)
+                    if not rows:
+                        break
+                    if fmt == 'csv':
+                        writer.writerows(rows)
+                    else:
+                        f.writelines(json.dumps(dict(zip(columns, row))) + "\n" for row in rows)
+                    written += len(rows)
+                    if progress:
+                        progress(written, total)
+                    if cancel is not None and cancel.is_set():
+                        cancelled = True
+                        break
+        finally:
+            conn.execute("COMMIT")
+    if cancelled:
+        os.remove(path)
+    return written, cancelled
+
+# Generated Documents
+class DocumentWriter:
+    # Writes generated documents into a folder, or into a single archive when
+    # the output path ends in .zip. write() may be called from several threads.
+    def __init__(self, output):
+        self.lock = threading.Lock()
+        self.archive = None
+        self.directory = None
+        if output.endswith('.zip'):
+            import zipfile  # only batch document runs need it; keeps startup light
+            self.archive = zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED)
+        else:
+            os.makedirs(output, exist_ok=True)
+            self.directory = output
+
+    def write(self, name, content):
+        if self.archive is not None:
+            with self.lock:
+                self.archive.writestr(name, content)
+        else:
+            with open(os.path.join(self.directory, name), 'w', newline='') as f:
+                f.write(content)
+
+    def write_file(self, name, path):
+        if self.archive is not None:
+            with self.lock:
+                self.archive.write(path, name)
+        else:
+            shutil.copyfile(path, os.path.join(self.directory, name))
+
+    def close(self):
+        if self.archive is not None:
+            self.archive.close()
+
+@contextmanager
+def csv_manifest(documents, name, header):
+    # Streams a CSV to a temporary file and adds it to the output at the end.
+    with tempfile.NamedTemporaryFile('w', newline='', suffix='.csv', delete=False) as f:
+        path = f.name
+        writer = csv.writer(f)
+        writer.writerow(header)
+        try:
+            yield writer
+        except BaseException:
+            f.close()
+            os.remove(path)
+            raise
+    try:
+        documents.write_file(name, path)
+    finally:
+        os.remove(path)
+
+# No Dues Certificates
+NO_DUES_FETCH_ROWS = 500
+
+def no_dues_certificate(student_id, name, date=None):
+    return (
+        f"No Dues Certificate\n"
+        f"Student ID: {student_id}\n"
+        f"Name: {name}\n"
+        f"Date: {date or datetime.now().strftime('%Y-%m-%d')}\n"
+        "This certifies that the student has no pending dues."
+    )
+
+def generate_no_dues_batch(db, output, class_=None, progress=None, cancel=None):
+    # One query classifies every student in scope as eligible or not using
+    # the fee ledger. Rows are streamed in NO_DUES_FETCH_ROWS chunks and each
+    # chunk's certificates are rendered and written on a thread pool, into a
+    # folder or a .zip archive along with manifest.csv.
+    sql = '''SELECT s.student_id, s.name, s.class,
+                    (SELECT group_concat(b.fee_type || ' ' || printf('%.2f', b.amount_due - b.amount_paid), '; ')
+                     FROM fee_balances b WHERE b.student = s.id AND b.amount_paid < b.amount_due)
+             FROM students s'''
+    params = ()
+    if class_:
+        sql += " WHERE s.class = ?"
+        params = (class_,)
+    import concurrent.futures  # deferred like zipfile; pulls in logging at import
+    date = datetime.now().strftime('%Y-%m-%d')
+    result = {'issued': 0, 'skipped': 0, 'cancelled': False}
+    documents = DocumentWriter(output)
+
+    def render(row):
+        file_name = f"no_dues_{row[0]}.txt"
+        documents.write(file_name, no_dues_certificate(row[0], row[1], date))
+        return file_name
+
+    try:
+        with csv_manifest(documents, "manifest.csv",
+                          ["student_id", "name", "class", "status", "pending_dues", "file"]) as manifest, \
+                db.reader() as conn, concurrent.futures.ThreadPoolExecutor() as pool:
+            conn.execute("BEGIN")
+            try:
+                total = conn.execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
+                cur = conn.execute(sql, params)
+                done = 0
+                while True:
+                    rows = cur.fetchmany(NO_DUES_FETCH_ROWS)
+                    if not rows:
+                        break
+                    eligible = [row for row in rows if row[3] is None]
+                    for row, file_name in zip(eligible, pool.map(render, eligible)):
+                        manifest.writerow([row[0], row[1], row[2], "issued", "", file_name])
+                    for row in rows:
+                        if row[3] is not None:
+                            manifest.writerow([row[0], row[1], row[2], "skipped", row[3], ""])
+                    result['issued'] += len(eligible)
+                    result['skipped'] += len(rows) - len(eligible)
+                    done += len(rows)
+                    if progress:
+                        progress(done, total)
+                    if cancel is not None and cancel.is_set():
+                        result['cancelled'] = True
+                        break
+            finally:
+                conn.execute("COMMIT")
+    finally:
+        documents.close()
+    return result
+
+# Online Backup
+# Backups go through the SQLite backup API from a pooled reader connection
+# that pins one read snapshot, so the copy is consistent and other
+# connections can keep reading and writing while it runs.
+BACKUP_PAGES_PER_STEP = 256
+
+def backup_to_file(db, path, compress=False, progress=None):
+    partial = path + '.partial'
+    if os.path.exists(partial):
+        os.remove(partial)
+    report = (lambda status, remaining, total: progress(total - remaining, total)) if progress else None
+    with db.reader() as source:
+        target = sqlite3.connect(partial)
+        try:
+            source.execute("BEGIN")
+            source.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+            source.backup(target, pages=BACKUP_PAGES_PER_STEP, progress=report)
+        finally:
+            source.execute("COMMIT")
+            target.close()
+    if compress:
+        with open(partial, 'rb') as src, gzip.open(path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.remove(partial)
+    else:
+        os.replace(partial, path)
+
+# Tables every version of the application has created; a file without all
+# of them is not one of its databases.
+CORE_TABLES = ("users", "students", "hostelers", "bus_holders", "employees", "fee_transactions",
+               "salary_slips", "report_cards", "system_logs", "fees")
+
+def check_restore_source(source):
+    # Runs before the backup copies anything: a refused file leaves the live
+    # database untouched.
+    tables = {name for name, in source.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    missing = [table for table in CORE_TABLES if table not in tables]
+    if missing:
+        raise ValueError(f"Not a School Management System database (missing {', '.join(missing)})")
+    version = source.execute("PRAGMA user_version").fetchone()[0]
+    if version > SCHEMA_VERSION:
+        raise ValueError(f"Backup schema version {version} is newer than this application ({SCHEMA_VERSION})")
+
+def restore_from_file(db, path, progress=None):
+    # Restores into the live connection, so handlers and pooled readers see
+    # the restored data without reopening anything.
+    decompressed = None
+    if path.endswith('.gz'):
+        fd, decompressed = tempfile.mkstemp(suffix='.db')
+        with os.fdopen(fd, 'wb') as dst, gzip.open(path, 'rb') as src:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        path = decompressed
+    report = (lambda status, remaining, total: progress(total - remaining, total)) if progress else None
+    try:
+        source = sqlite3.connect(path)
+        try:
+            check_restore_source(source)
+            with db.lock:
+                source.backup(db.conn, pages=BACKUP_PAGES_PER_STEP, progress=report)
+        finally:
+            source.close()
+    finally:
+        if decompressed:
+            os.remove(decompressed)
+    if hasattr(db, 'fts_enabled'):
+        del db.fts_enabled
+    # Backups taken by older versions are brought up to the current schema.
+    init_db(db)
+    student_dashboards.invalidate()
+
+# Scheduled Snapshots
+# Each snapshot is a consistent backup split into SNAPSHOT_CHUNK_BYTES chunks
+# stored gzip-compressed under their SHA-256, so a snapshot only writes the
+# chunks that changed since any retained snapshot and an unchanged database
+# costs one index entry. index.json lists every snapshot with its chunks, so
+# restore can offer points in time without scanning the directory. Chunks an
+# unfinished take or a running restore needs are pinned, so retention on
+# another thread never collects them.
+SNAPSHOT_CHUNK_BYTES = 1024 * 1024
+SNAPSHOT_INTERVALS = {'hourly': 3600, 'daily': 86400}
+SNAPSHOT_RETENTION = {'hourly': 24, 'daily': 7}
+SNAPSHOT_STARTUP_DELAY = 120  # seconds; keeps a due snapshot off the startup path
+
+class SnapshotStore:
+    def __init__(self, directory):
+        self.directory = directory
+        self.chunk_dir = os.path.join(directory, 'chunks')
+        self.index_path = os.path.join(directory, 'index.json')
+        self.lock = threading.Lock()
+        self.pinned = {}  # digest: number of takes and restores using it
+        os.makedirs(self.chunk_dir, exist_ok=True)
+
+    def snapshots(self):
+        # Newest first.
+        with self.lock:
+            return list(reversed(self.load_index()))
+
+    def load_index(self):
+        if not os.path.exists(self.index_path):
+            return []
+        with open(self.index_path) as f:
+            return json.load(f)
+
+    def save_index(self, snapshots):
+        partial = self.index_path + '.partial'
+        with open(partial, 'w') as f:
+            json.dump(snapshots, f, indent=1)
+        os.replace(partial, self.index_path)
+
+    def chunk_path(self, digest):
+        return os.path.join(self.chunk_dir, digest[:2], digest)
+
+    def pin(self, digests):
+        # Called with self.lock held.
+        for digest in digests:
+            self.pinned[digest] = self.pinned.get(digest, 0) + 1
+
+    def unpin(self, digests):
+        with self.lock:
+            for digest in digests:
+                self.pinned[digest] -= 1
+                if not self.pinned[digest]:
+                    del self.pinned[digest]
+
+    def take(self, db, tier, retention=SNAPSHOT_RETENTION):
+        fd, backup_path = tempfile.mkstemp(suffix='.db', dir=self.directory)
+        os.close(fd)
+        chunks = []
+        try:
+            backup_to_file(db, backup_path)
+            new_chunks = 0
+            whole = hashlib.sha256()
+            with open(backup_path, 'rb') as f:
+                for block in iter(lambda: f.read(SNAPSHOT_CHUNK_BYTES), b''):
+                    whole.update(block)
+                    digest = hashlib.sha256(block).hexdigest()
+                    path = self.chunk_path(digest)
+                    with self.lock:
+                        self.pin([digest])
+                        chunks.append(digest)
+                        if not os.path.exists(path):
+                            os.makedirs(os.path.dirname(path), exist_ok=True)
+                            with gzip.open(path + '.partial', 'wb') as out:
+                                out.write(block)
+                            os.replace(path + '.partial', path)
+                            new_chunks += 1
+            size = os.path.getsize(backup_path)
+        except BaseException:
+            self.unpin(chunks)
+            raise
+        finally:
+            os.remove(backup_path)
+        now = datetime.now()
+        snapshot = {
+            'id': f"{now.strftime('%Y%m%d-%H%M%S-%f')}-{tier}",
+            'tier': tier,
+            'created': now.strftime("%Y-%m-%d %H:%M:%S"),
+            'created_ts': now.timestamp(),
+            'size': size,
+            'sha256': whole.hexdigest(),
+            'new_chunks': new_chunks,
+            'chunks': chunks,
+        }
+        try:
+            with self.lock:
+                snapshots = self.load_index()
+                snapshots.append(snapshot)
+                snapshots = self.apply_retention(snapshots, retention)
+                self.save_index(snapshots)
+                self.collect_garbage(snapshots)
+        finally:
+            self.unpin(chunks)
+        return snapshot
+
+    def apply_retention(self, snapshots, retention):
+        kept = []
+        counts = {}
+        for snapshot in reversed(snapshots):
+            counts[snapshot['tier']] = counts.get(snapshot['tier'], 0) + 1
+            if counts[snapshot['tier']] <= retention.get(snapshot['tier'], 0):
+                kept.append(snapshot)
+        kept.reverse()
+        return kept
+
+    def collect_garbage(self, snapshots):
+        # Called with self.lock held. .partial files belong to a take that
+        # is writing them.
+        live = {digest for snapshot in snapshots for digest in snapshot['chunks']}
+        for prefix in os.listdir(self.chunk_dir):
+            for name in os.listdir(os.path.join(self.chunk_dir, prefix)):
+                if name not in live and name not in self.pinned and not name.endswith('.partial'):
+                    os.remove(os.path.join(self.chunk_dir, prefix, name))
+
+    def latest_by_tier(self):
+        latest = {}
+        for snapshot in self.snapshots():
+            latest.setdefault(snapshot['tier'], snapshot['created_ts'])
+        return latest
+
+    def restore(self, db, snapshot_id, progress=None):
+        with self.lock:
+            snapshot = next((s for s in self.load_index() if s['id'] == snapshot_id), None)
+            if snapshot is None:
+                raise ValueError(f"Snapshot {snapshot_id} not found")
+            self.pin(snapshot['chunks'])
+        try:
+            fd, path = tempfile.mkstemp(suffix='.db', dir=self.directory)
+            try:
+                whole = hashlib.sha256()
+                with os.fdopen(fd, 'wb') as out:
+                    for digest in snapshot['chunks']:
+                        with gzip.open(self.chunk_path(digest), 'rb') as chunk:
+                            block = chunk.read()
+                        whole.update(block)
+                        out.write(block)
+                if whole.hexdigest() != snapshot['sha256']:
+                    raise ValueError(f"Snapshot {snapshot_id} is corrupt")
+                restore_from_file(db, path, progress)
+            finally:
+                os.remove(path)
+        finally:
+            self.unpin(snapshot['chunks'])
+
+class SnapshotScheduler:
+    RETRY_SECONDS = 300
+
+    def __init__(self, db, store, intervals=SNAPSHOT_INTERVALS, retention=SNAPSHOT_RETENTION,
+                 initial_delay=SNAPSHOT_STARTUP_DELAY):
+        self.db = db
+        self.store = store
+        self.intervals = intervals
+        self.retention = retention
+        self.initial_delay = initial_delay
+        self.last_error = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        self.stopped.wait(self.initial_delay)
+        while not self.stopped.is_set():
+            self.stopped.wait(self.run_due())
+
+    def run_due(self):
+        # Takes every tier whose interval has elapsed and returns the number
+        # of seconds until the next one is due.
+        latest = self.store.latest_by_tier()
+        waits = []
+        for tier, interval in self.intervals.items():
+            wait = latest.get(tier, 0) + interval - time.time()
+            if wait <= 0:
+                try:
+                    self.store.take(self.db, tier, self.retention)
+                    self.last_error = None
+                    wait = interval
+                except Exception as e:
+                    self.last_error = e
+                    wait = self.RETRY_SECONDS
+            waits.append(wait)
+        return max(min(waits), 1)
+
+def snapshot_dir(db):
+    return os.path.join(os.path.dirname(os.path.abspath(db.path)), 'snapshots')
+
+# Credentials
+# Passwords are stored as salted PBKDF2 hashes, "pbkdf2_sha256$iterations$
+# salt$digest", at PASSWORD_ITERATIONS. Hashes below that cost (the ones the
+# upgrade wrote at LEGACY_PASSWORD_ITERATIONS) are upgraded on the next
+# successful login. Passwords the system hands out are flagged in
+# users.must_change_password, and users signing in with one have to change
+# it before doing anything else.
+PASSWORD_ITERATIONS = 200000
+LEGACY_PASSWORD_ITERATIONS = 1
+LOGIN_CACHE_SIZE = 4096
+LOGIN_MAX_FAILURES = 5
+LOGIN_LOCKOUT_SECONDS = 300
+
+def hash_password(password, iterations=PASSWORD_ITERATIONS):
+    salt = os.urandom(16)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+    return f"pbkdf2_sha256${iterations}${salt.hex()}${digest.hex()}"
+
+def is_password_hash(value):
+    return value is not None and value.startswith("pbkdf2_sha256$")
+
+def check_password(password, stored):
+    # (matches, should be rehashed at the current cost)
+    try:
+        scheme, iterations, salt, digest = stored.split("$")
+        iterations = int(iterations)
+        salt = bytes.fromhex(salt)
+    except (AttributeError, ValueError):
+        return False, False
+    if scheme != "pbkdf2_sha256":
+        return False, False
+    actual = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations).hex()
+    matches = hmac.compare_digest(actual, digest)
+    return matches, matches and iterations < PASSWORD_ITERATIONS
+
+# Checking a hash is deliberately slow, so successful verifications are kept
+# in an LRU cache as an HMAC of the password and the stored hash under a
+# per-process key: repeat logins and API requests skip PBKDF2, and changing
+# the password changes the stored hash, which invalidates the entry. After
+# LOGIN_MAX_FAILURES failed attempts in a row a username is locked out for
+# LOGIN_LOCKOUT_SECONDS from the client that made them (the API passes the
+# remote address; the desktop UI has only one), so someone guessing from
+# elsewhere can't lock the real user out. Failures for unknown usernames are
+# counted separately, so spraying made-up names can't evict the counters of
+# real accounts.
+class CredentialVerifier:
+    def __init__(self, cache_size=LOGIN_CACHE_SIZE):
+        self.key = os.urandom(32)
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        self.failures = collections.OrderedDict()
+        self.unknown_failures = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.dummy_hash = None
+        self.hits = 0
+        self.misses = 0
+
+    def verify(self, username, password, stored, client=None):
+        # stored is None for unknown users; they still pay for one hash, so
+        # response times don't reveal which usernames exist.
+        failures = self.failures if stored is not None else self.unknown_failures
+        self.check_lockout(failures, (username, client))
+        token = hmac.new(self.key, f"{stored}\0{password}".encode(), 'sha256').digest()
+        with self.lock:
+            if stored is not None and self.cache.get(username) == token:
+                self.cache.move_to_end(username)
+                self.hits += 1
+                return True, False
+            self.misses += 1
+        if stored is None:
+            if self.dummy_hash is None:
+                self.dummy_hash = hash_password(os.urandom(16).hex())
+            check_password(password, self.dummy_hash)
+            matches, rehash = False, False
+        else:
+            matches, rehash = check_password(password, stored)
+        with self.lock:
+            if matches:
+                failures.pop((username, client), None)
+                if not rehash:
+                    self.cache[username] = token
+                    self.cache.move_to_end(username)
+                    if len(self.cache) > self.cache_size:
+                        self.cache.popitem(last=False)
+            else:
+                count, _ = failures.pop((username, client), (0, 0))
+                failures[username, client] = (count + 1, time.monotonic())
+                if len(failures) > self.cache_size:
+                    failures.popitem(last=False)
+        return matches, rehash
+
+    def check_lockout(self, failures, key):
+        with self.lock:
+            count, last = failures.get(key, (0, 0))
+            if count < LOGIN_MAX_FAILURES:
+                return
+            remaining = LOGIN_LOCKOUT_SECONDS - (time.monotonic() - last)
+            if remaining <= 0:
+                del failures[key]
+                return
+        raise ValueError(f"Too many failed attempts. Try again in {int(remaining) + 1} seconds")
+
+    def forget(self, username):
+        with self.lock:
+            self.cache.pop(username, None)
+
+credentials = CredentialVerifier()
+
+# Student Dashboard
+# Everything the student dashboard shows comes from one query per student,
+# cached by student ID. Results only change at exam time, so a results-day
+# login spike is served from memory. Writes in this process invalidate the
+# entries they touch once they commit (marks for their students, everything
+# on a restore). Changes to fees or classes, from any process, bump the
+# cache_versions counter, which the cache checks at most every
+# STUDENT_DASHBOARD_VERSION_CHECK seconds and which clears it. Only marks
+# entered from another terminal wait for the STUDENT_DASHBOARD_TTL expiry.
+STUDENT_DASHBOARD_SQL = '''SELECT s.class, f.amount, r.subject, r.marks
+                           FROM students s
+                           LEFT JOIN fees f ON f.class = s.class
+                           LEFT JOIN report_cards r ON r.student = s.id
+                           WHERE s.student_id = ?
+                           ORDER BY r.subject'''
+STUDENT_DASHBOARD_CACHE_SIZE = 10000
+STUDENT_DASHBOARD_TTL = 900
+STUDENT_DASHBOARD_VERSION_CHECK = 1.0
+
+def student_dashboard(conn, student_id):
+    rows = conn.execute(STUDENT_DASHBOARD_SQL, (student_id,)).fetchall()
+    if not rows:
+        return None
+    return {
+        "class": rows[0][0],
+        "tuition_fee": rows[0][1],
+        "results": [(subject, marks) for _, _, subject, marks in rows if subject is not None],
+    }
+
+class StudentDashboardCache:
+    def __init__(self, size=STUDENT_DASHBOARD_CACHE_SIZE, ttl=STUDENT_DASHBOARD_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.version = None
+        self.version_checked = None
+        self.hits = 0
+        self.misses = 0
+
+    def check_version(self, db, now):
+        with db.reader() as conn:
+            version = conn.execute("SELECT version FROM cache_versions WHERE name = 'student_dashboard'").fetchone()
+        with self.lock:
+            if self.version is not None and version != self.version:
+                self.generation += 1
+                self.entries.clear()
+            self.version = version
+            self.version_checked = now
+
+    def get(self, db, student_id):
+        now = time.monotonic()
+        if self.version_checked is None or now - self.version_checked >= STUDENT_DASHBOARD_VERSION_CHECK:
+            self.check_version(db, now)
+        with self.lock:
+            entry = self.entries.get(student_id)
+            if entry is not None and now - entry[0] < self.ttl:
+                self.entries.move_to_end(student_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self.generation
+        with db.reader() as conn:
+            dashboard = student_dashboard(conn, student_id)
+        with self.lock:
+            # If anything was invalidated while the query ran, it may have
+            # read the old data, so it isn't cached.
+            if dashboard is not None and generation == self.generation:
+                self.entries[student_id] = (now, dashboard)
+                self.entries.move_to_end(student_id)
+                if len(self.entries) > self.size:
+                    self.entries.popitem(last=False)
+        return dashboard
+
+    def invalidate(self, student_ids=None):
+        with self.lock:
+            self.generation += 1
+            if student_ids is None:
+                self.entries.clear()
+            else:
+                for student_id in student_ids:
+                    self.entries.pop(student_id, None)
+
+student_dashboards = StudentDashboardCache()
+
+# Services
+# The operations behind the screens, without any Tk, so the desktop UI and
+# the HTTP API share one implementation. Write services take a dict of field
+# values keyed like the bulk import columns, and new records go through the
+# same prepare functions as imported rows, so a form, an API call and a CSV
+# row are validated alike. Errors the user can fix are raised as ValueError,
+# and NotFoundError when the record asked for doesn't exist.
+class NotFoundError(ValueError):
+    pass
+
+def log_committed(db, action, actor):
+    # Logged once the caller's transaction commits. The GroupCommitEngine
+    # runs services inside its batch transaction; logging there would hold
+    # the database lock while a full audit buffer waits for it, and would
+    # log actions whose batch is rolled back.
+    db.after_commit(lambda: log_action(action, actor))
+
+def add_record(db, kind, row, issued=None):
+    _, statements, prepare = IMPORT_SPECS[kind]
+    if issued is None:
+        issued = IssuedCredentials(1 if kind == "Students" else 0)
+    with db.transaction() as c:
+        params = prepare(row, c, issued)
+        for sql, values in zip(statements, params):
+            c.execute(sql, values)
+    return params
+
+def add_student(db, row, actor, issued=None):
+    student, user, password = add_record(db, "Students", row, issued)
+    log_committed(db, f"Added student: {student[1]}", actor)
+    return {"student_id": student[0], "username": user[0], "password": password}
+
+def add_hosteler(db, row, actor):
+    hosteler, = add_record(db, "Hostelers", row)
+    log_committed(db, f"Added hosteler: {hosteler[1]}", actor)
+    return {"hosteler_id": hosteler[0]}
+
+def add_bus_holder(db, row, actor):
+    bus_holder, = add_record(db, "Bus Holders", row)
+    log_committed(db, f"Added bus holder: {bus_holder[1]}", actor)
+    return {"bus_holder_id": bus_holder[0]}
+
+def add_employee(db, row, actor):
+    employee, = add_record(db, "Employees", row)
+    log_committed(db, f"Added employee: {employee[1]}", actor)
+    return {"employee_id": employee[0]}
+
+def add_marks(db, row, actor):
+    marks, = add_record(db, "Marks", row)
+    db.after_commit(lambda: student_dashboards.invalidate([marks[1]]))
+    log_committed(db, f"Added report card for student: {marks[1]}", actor)
+    return {"student_id": marks[1], "subject": marks[2], "marks": marks[3]}
+
+def record_fee_payment(db, row, actor):
+    student_id, fee_type, amount = required(row, 'student_id', 'fee_type', 'amount')
+    fee_type = normalize_fee_type(fee_type)
+    try:
+        amount = float(amount)
+        if amount <= 0:
+            raise ValueError
+    except ValueError:
+        raise ValueError("Invalid amount")
+    transaction_id = str(uuid.uuid4())
+    payment_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with db.transaction() as c:
+        if not c.execute("SELECT 1 FROM students WHERE student_id=?", (student_id,)).fetchone():
+            raise ValueError("Student not found")
+        c.execute(PAYMENT_INSERT_SQL, (transaction_id, student_id, fee_type, amount, payment_date))
+    log_committed(db, f"Recorded payment for student: {student_id}", actor)
+    return {"transaction_id": transaction_id}
+
+def salary_slip_fields(row):
+    employee_id, month, amount = required(row, 'employee_id', 'month', 'amount')
+    month = parse_month(month)
+    try:
+        amount = float(amount)
+    except ValueError:
+        raise ValueError("Invalid amount")
+    return employee_id, month, amount
+
+def unissued_salary(conn, employee_id, month):
+    # The employee's salary, if no slip has been issued for month yet.
+    employee = conn.execute("SELECT salary FROM employees WHERE employee_id=?", (employee_id,)).fetchone()
+    if not employee:
+        raise ValueError("Employee not found")
+    if conn.execute("SELECT 1 FROM salary_slips WHERE employee_id=? AND month=?", (employee_id, month)).fetchone():
+        raise ValueError(f"A salary slip for {month} has already been issued")
+    return employee[0]
+
+def issue_salary_slip(db, row, actor):
+    employee_id, month, amount = salary_slip_fields(row)
+    slip_id = str(uuid.uuid4())
+    issued_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with db.transaction() as c:
+        unissued_salary(c, employee_id, month)
+        c.execute("INSERT INTO salary_slips (slip_id, employee_id, month, amount, issued_date) VALUES (?, ?, ?, ?, ?)",
+                  (slip_id, employee_id, month, amount, issued_date))
+    log_committed(db, f"Generated salary slip for employee: {employee_id}", actor)
+    return {"slip_id": slip_id}
+
+def issue_payroll(db, row, actor):
+    month = parse_month(required(row, 'month')[0])
+    issued, existing = run_payroll(db, month)
+    log_committed(db, f"Ran payroll for {month}: {issued} slips", actor)
+    return {"month": month, "issued": issued, "existing": existing}
+
+def change_password(db, row, actor):
+    current_password, new_password, confirm_password = required(row, 'current_password', 'new_password',
+                                                                 'confirm_password')
+    if new_password != confirm_password:
+        raise ValueError("New passwords do not match")
+    if new_password == current_password:
+        raise ValueError("Choose a password different from the current one")
+    stored = db.fetchone("SELECT password FROM users WHERE username=?", (actor,))
+    if not credentials.verify(actor, current_password, stored[0] if stored else None)[0]:
+        raise ValueError("Current password is incorrect")
+    new_hash = hash_password(new_password)
+    with db.transaction() as c:
+        c.execute("UPDATE users SET password=?, must_change_password=0 WHERE username=?", (new_hash, actor))
+    credentials.forget(actor)
+    log_committed(db, "Changed password", actor)
+    return {}
+
+def authenticate(db, username, password, role, client=None):
+    # Read-only, so logins run on a reader. Returns the student ID (None for
+    # admins), whether the password is an issued one that must be changed,
+    # and, if the stored hash is below the current cost, "rehash": the write
+    # that upgrades it, for the caller to hand to its writer.
+    with db.reader() as conn:
+        user = conn.execute("SELECT password, student_id, must_change_password FROM users WHERE username=? AND role=?",
+                            (username, role)).fetchone()
+    matches, rehash = credentials.verify(username, password, user[0] if user else None, client)
+    if not matches:
+        raise ValueError(f"Invalid {role} username or password")
+    if role == 'student' and user[1] is None:
+        raise ValueError("Student ID not found")
+    login = {"student_id": user[1], "must_change_password": bool(user[2]), "rehash": None}
+    if rehash:
+        new_hash = hash_password(password)
+        login["rehash"] = lambda: store_password_hash(db, username, user[0], new_hash)
+    return login
+
+def store_password_hash(db, username, old_hash, new_hash):
+    # Does nothing if the password was changed in the meantime.
+    with db.transaction() as c:
+        c.execute("UPDATE users SET password=? WHERE username=? AND password=?", (new_hash, username, old_hash))
+
+def no_dues_document(conn, student_id):
+    student = conn.execute("SELECT name FROM students WHERE student_id=?", (student_id,)).fetchone()
+    if not student:
+        raise NotFoundError("Student not found")
+    dues = conn.execute(STUDENT_DUES_QUERY, (student_id,)).fetchall()
+    if dues:
+        details = "\n".join(f"{fee_type}: ${amount:.2f}" for fee_type, amount in dues)
+        raise ValueError(f"Student has pending dues\n{details}")
+    return no_dues_certificate(student_id, student[0])
+
+def student_record(conn, student_id):
+    student = conn.execute("SELECT student_id, name, class, hostel_status, bus_status, gender, pickup_point "
+                           "FROM students WHERE student_id=?", (student_id,)).fetchone()
+    if not student:
+        raise NotFoundError("Student not found")
+    record = dict(zip(("student_id", "name", "class", "hostel", "bus", "gender", "pickup_point"), student))
+    dashboard = student_dashboard(conn, student_id)
+    record["tuition_fee"] = dashboard["tuition_fee"]
+    record["results"] = dashboard["results"]
+    record["dues"] = conn.execute(STUDENT_DUES_QUERY, (student_id,)).fetchall()
+    return record
+
+# HTTP API
+# python "SMS2025(2).py" --serve [HOST:]PORT serves the services as JSON so
+# several front-desk terminals and scripts can share one database. Requests
+# carry HTTP Basic admin credentials, except POST /login. Every connection
+# gets its own thread: reads run there on a pooled reader connection, while
+# writes are handed to a GroupCommitEngine, so request threads never contend
+# for the SQLite write lock and concurrent writes share one commit.
+API_ADDRESS = ('127.0.0.1', 8765)
+API_MAX_BODY = 1024 * 1024
+API_MAX_SEARCH_ROWS = VIRTUAL_PAGE_ROWS * 10
+
+def api_search_students(db, params, actor):
+    try:
+        limit = int(params.get('limit', VIRTUAL_PAGE_ROWS))
+    except ValueError:
+        raise ValueError("limit must be a number")
+    if not 1 <= limit <= API_MAX_SEARCH_ROWS:
+        raise ValueError(f"limit must be between 1 and {API_MAX_SEARCH_ROWS}")
+    with db.reader() as conn:
+        rows = search_students(conn, params.get('q', ''), limit, student_search_enabled(db))
+    return [dict(zip(("student_id", "name", "class", "hostel", "bus"), row)) for row in rows]
+
+def api_student(db, params, actor):
+    with db.reader() as conn:
+        return student_record(conn, params['student_id'])
+
+def api_no_dues(db, params, actor):
+    with db.reader() as conn:
+        return {"certificate": no_dues_document(conn, params['student_id'])}
+
+def api_dashboard(db, params, actor):
+    return dashboard_summary(db)
+
+# (method, path pattern, service, write, needs admin credentials)
+API_ROUTES = [
+    ("POST", r"/login", "login", False, False),
+    ("GET", r"/students", api_search_students, False, True),
+    ("POST", r"/students", "add_student", False, True),
+    ("GET", r"/students/(?P<student_id>[^/]+)", api_student, False, True),
+    ("GET", r"/students/(?P<student_id>[^/]+)/no-dues", api_no_dues, False, True),
+    ("POST", r"/hostelers", add_hosteler, True, True),
+    ("POST", r"/bus-holders", add_bus_holder, True, True),
+    ("POST", r"/employees", add_employee, True, True),
+    ("POST", r"/fee-payments", record_fee_payment, True, True),
+    ("POST", r"/salary-slips", issue_salary_slip, True, True),
+    ("POST", r"/payroll", issue_payroll, True, True),
+    ("POST", r"/marks", add_marks, True, True),
+    ("GET", r"/dashboard", api_dashboard, False, True),
+]
+
+class ApiServer:
+    def __init__(self, db, address=API_ADDRESS):
+        from http.server import ThreadingHTTPServer  # only --serve needs it; keeps startup light
+        self.db = db
+        self.engine = GroupCommitEngine(db)
+        self.engine.start_thread()
+        self.httpd = ThreadingHTTPServer(address, api_handler(self))
+        self.address = self.httpd.server_address
+
+    def handle(self, method, path, params, credentials, client=None):
+        # Returns (HTTP status, JSON-serialisable payload). client is the
+        # remote address, which failed logins are counted against.
+        for route_method, pattern, service, write, admin in API_ROUTES:
+            match = re.fullmatch(pattern, path)
+            if match and route_method == method:
+                break
+        else:
+            return 404, {"error": "Not found"}
+        params.update(match.groupdict())
+        if isinstance(service, str):
+            # Served by the ApiServer itself, which also gets the client.
+            served = getattr(self, service)
+            service = lambda db, params, actor: served(db, params, actor, client)
+        try:
+            actor = self.authorize(credentials, client) if admin else None
+            if write:
+                return 200, self.engine.call(lambda: service(self.db, params, actor))
+            return 200, service(self.db, params, actor)
+        except PermissionError as e:
+            return 401, {"error": str(e)}
+        except NotFoundError as e:
+            return 404, {"error": str(e)}
+        except ValueError as e:
+            return 400, {"error": str(e)}
+        except sqlite3.IntegrityError as e:
+            return 409, {"error": str(e)}
+
+    def authenticate(self, username, password, role, client):
+        login = authenticate(self.db, username, password, role, client)
+        if login["rehash"]:
+            self.engine.call(login["rehash"])
+        return login
+
+    def add_student(self, db, params, actor, client):
+        # The issued password is hashed here, before the insert goes to the
+        # writer, so the PBKDF2 work doesn't hold up everyone's commit.
+        issued = IssuedCredentials(1)
+        return self.engine.call(lambda: add_student(db, params, actor, issued))
+
+    def login(self, db, params, actor, client):
+        username, password, role = required(params, 'username', 'password', 'role')
+        try:
+            login = self.authenticate(username, password, role, client)
+        except ValueError as e:
+            raise PermissionError(str(e))
+        return {"username": username, "role": role, "student_id": login["student_id"],
+                "must_change_password": login["must_change_password"]}
+
+    def authorize(self, credentials, client):
+        if credentials:
+            username, password = credentials
+            try:
+                login = self.authenticate(username, password, 'admin', client)
+            except ValueError:
+                pass
+            else:
+                if login["must_change_password"]:
+                    raise PermissionError("Change the issued password before using the API")
+                return username
+        raise PermissionError("Admin credentials required")
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.engine.stop_thread()
+
+def api_handler(server):
+    import base64
+    from http.server import BaseHTTPRequestHandler
+    from urllib.parse import parse_qsl, urlsplit
+
+    class ApiHandler(BaseHTTPRequestHandler):
+        # HTTP/1.1 keeps connections open, so a terminal reuses one socket;
+        # without Nagle the body isn't held back behind the headers.
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            self.dispatch("GET")
+
+        def do_POST(self):
+            self.dispatch("POST")
+
+        def dispatch(self, method):
+            url = urlsplit(self.path)
+            params = dict(parse_qsl(url.query))
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                if length > API_MAX_BODY:
+                    raise ValueError("Request body is too large")
+                if length:
+                    body = json.loads(self.rfile.read(length))
+                    if not isinstance(body, dict):
+                        raise ValueError("Request body must be a JSON object")
+                    # Services expect form values, as typed into an Entry.
+                    params.update((key, str(value)) for key, value in body.items() if value is not None)
+            except ValueError as e:
+                self.reply(400, {"error": str(e)})
+                return
+            try:
+                status, payload = server.handle(method, url.path.rstrip("/") or "/", params, self.credentials(),
+                                                self.client_address[0])
+            except Exception as e:
+                status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+            self.reply(status, payload)
+
+        def credentials(self):
+            scheme, _, encoded = (self.headers.get("Authorization") or "").partition(" ")
+            if scheme.lower() != "basic":
+                return None
+            try:
+                username, _, password = base64.b64decode(encoded).decode().partition(":")
+            except ValueError:
+                return None
+            return username, password
+
+        def reply(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            if status == 401:
+                self.send_header("WWW-Authenticate", 'Basic realm="School Management"')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Writes are already recorded in the audit log.
+            pass
+
+    return ApiHandler
 
 # Main Application
 class SchoolManagementSystem:
@@ -120,9 +3138,28 @@ class SchoolManagementSystem:
         self.current_user = None
         self.current_role = None
         self.current_student_id = None
+        self.password_change_required = False
+        self.db = get_db()
+        self.screens = {}
+        self.current_screen = None
+        self.screen_timings = collections.defaultdict(lambda: collections.deque(maxlen=SCREEN_TIMING_SAMPLES))
+        self.tasks = TaskExecutor()
+        self.polling_tasks = False
+        self.busy_tasks = 0
+        self.busy_label = tk.Label(self.root, text="", anchor="w", fg="gray")
+        self.busy_label.pack(side="bottom", fill="x")
         init_db()
+        self.snapshots = SnapshotStore(snapshot_dir(self.db))
+        self.snapshot_scheduler = SnapshotScheduler(self.db, self.snapshots)
+        self.root.protocol("WM_DELETE_WINDOW", self.shutdown)
         self.show_login_screen()
 
+    def shutdown(self):
+        self.tasks.stop()
+        self.snapshot_scheduler.stop()
+        close_audit_log()
+        self.root.destroy()
+
     # Navigation helpers
     def go_back_to_login(self):
         self.current_user = None
@@ -130,32 +3167,36 @@ class SchoolManagementSystem:
         self.show_login_screen()
 
     def go_back_to_main_menu(self):
-        self.show_main_menu()
+        if self.current_role == 'student':
+            self.show_student_dashboard()
+        else:
+            self.show_main_menu()
 
     def confirm_logout(self):
         if messagebox.askyesno("Confirm Logout", "Are you sure you want to logout?"):
             self.show_login_screen()
 
     def show_login_screen(self):
-        self.clear_screen()
-        
-        tk.Label(self.root, text="School Management System", font=("Arial", 20)).pack(pady=20)
+        self.show_screen("login_screen")
+
+    def build_login_screen(self, frame):
+        tk.Label(frame, text="School Management System", font=("Arial", 20)).pack(pady=20)
         
-        tk.Label(self.root, text="User Type").pack()
-        self.user_type = ttk.Combobox(self.root, values=["Admin", "Student"], state="readonly")
+        tk.Label(frame, text="User Type").pack()
+        self.user_type = ttk.Combobox(frame, values=["Admin", "Student"], state="readonly")
         self.user_type.current(0)
         self.user_type.pack(pady=5)
         
-        tk.Label(self.root, text="Username").pack()
-        self.username_entry = tk.Entry(self.root)
+        tk.Label(frame, text="Username").pack()
+        self.username_entry = tk.Entry(frame)
         self.username_entry.pack(pady=5)
         
-        tk.Label(self.root, text="Password").pack()
-        self.password_entry = tk.Entry(self.root, show="*")
+        tk.Label(frame, text="Password").pack()
+        self.password_entry = tk.Entry(frame, show="*")
         self.password_entry.pack(pady=5)
         
-        tk.Button(self.root, text="Login", command=self.validate_login, font=("Arial", 12)).pack(pady=20)
-        tk.Button(self.root, text="Back", command=self.root.destroy, font=("Arial", 12)).pack(pady=5)
+        tk.Button(frame, text="Login", command=self.validate_login, font=("Arial", 12)).pack(pady=20)
+        tk.Button(frame, text="Back", command=self.shutdown, font=("Arial", 12)).pack(pady=5)
 
     def validate_login(self):
         user_type = self.user_type.get()
@@ -168,113 +3209,104 @@ class SchoolManagementSystem:
         
         if user_type == "Student":
             self.student_login(username, password)
-        else:
-            conn = sqlite3.connect('school_management.db')
-            c = conn.cursor()
-            c.execute("SELECT username, password, role FROM users WHERE username=? AND password=? AND role=?",
-                      (username, password, 'admin'))
-            user = c.fetchone()
-            conn.close()
-            
-            if user:
-                self.current_user = username
-                self.current_role = 'admin'
-                log_action("Admin logged in", username)
+            return
+        
+        def done(login):
+            self.store_rehash(login)
+            self.current_user = username
+            self.current_role = 'admin'
+            log_action("Admin logged in", username)
+            if not self.require_password_change(login):
                 self.show_main_menu()
-            else:
-                messagebox.showerror("Error", "Invalid admin username or password")
+        
+        self.run_task(lambda: authenticate(self.db, username, password, 'admin'), done, write=False)
 
     def student_login(self, username, password):
-        conn = sqlite3.connect('school_management.db')
-        c = conn.cursor()
-        c.execute("SELECT username, password, role FROM users WHERE username=? AND password=? AND role=?",
-                  (username, password, 'student'))
-        user = c.fetchone()
-        conn.close()
-        
-        if user:
+        def done(login):
+            self.store_rehash(login)
             self.current_user = username
             self.current_role = 'student'
-            # Extract student_id from username
-            student_id_prefix = username.replace("student", "")
-            conn = sqlite3.connect('school_management.db')
-            c = conn.cursor()
-            c.execute("SELECT student_id FROM students WHERE student_id LIKE ?",
-                      (f"%{student_id_prefix}%",))
-            student = c.fetchone()
-            conn.close()
-            
-            if student:
-                self.current_student_id = student[0]
-                log_action("Student logged in", username)
+            self.current_student_id = login["student_id"]
+            log_action("Student logged in", username)
+            if not self.require_password_change(login):
                 self.show_student_dashboard()
-            else:
-                messagebox.showerror("Error", "Student ID not found")
-        else:
-            messagebox.showerror("Error", "Invalid student username or password")
+        
+        self.run_task(lambda: authenticate(self.db, username, password, 'student'), done, write=False)
+
+    def require_password_change(self, login):
+        # Until an issued password is replaced, the change password screen
+        # is the only one on offer: it has Logout instead of Back.
+        self.password_change_required = login["must_change_password"]
+        if not self.password_change_required:
+            return False
+        messagebox.showinfo("Change Password", "You signed in with an issued password. Please choose your own.")
+        self.show_change_password()
+        return True
+
+    def store_rehash(self, login):
+        # Logins verify on a reader; upgrading the stored hash is a write.
+        if login["rehash"]:
+            self.run_task(login["rehash"], lambda result: None)
 
     def show_student_dashboard(self):
-        self.clear_screen()
-        
-        tk.Label(self.root, text=f"Welcome, {self.current_user}", font=("Arial", 16)).pack(pady=10)
-        tk.Button(self.root, text="Logout", command=self.confirm_logout, 
+        self.show_screen("student_dashboard")
+
+    def build_student_dashboard(self, frame):
+        self.welcome_label = tk.Label(frame, font=("Arial", 16))
+        self.welcome_label.pack(pady=10)
+        tk.Button(frame, text="Logout", command=self.confirm_logout, 
                   font=("Arial", 14, "bold"), bg="red", fg="white", padx=10, pady=10).pack(pady=10)
+        tk.Button(frame, text="Change Password", command=self.show_change_password, font=("Arial", 12)).pack(pady=5)
         
-        notebook = ttk.Notebook(self.root)
+        notebook = ttk.Notebook(frame)
         notebook.pack(pady=10, fill="both", expand=True)
         
+        # A student has a handful of subjects, so a plain Treeview is enough.
         results_frame = ttk.Frame(notebook)
         notebook.add(results_frame, text="Results")
-        self.show_results(results_frame)
-        
-        fee_frame = ttk.Frame(notebook)
-        notebook.add(fee_frame, text="Tuition Fee")
-        self.show_tuition_fee(fee_frame)
-
-    def show_results(self, frame):
-        tree = ttk.Treeview(frame, columns=("Subject", "Marks"), show="headings")
-        tree.heading("Subject", text="Subject")
-        tree.heading("Marks", text="Marks")
-        tree.pack(pady=10, fill="both", expand=True)
-        
-        conn = sqlite3.connect('school_management.db')
-        c = conn.cursor()
-        c.execute("SELECT subject, marks FROM report_cards WHERE student_id=?", (self.current_student_id,))
-        results = c.fetchall()
-        conn.close()
-        
-        if results:
-            for result in results:
-                tree.insert("", "end", values=(result[0], result[1]))
-        else:
-            tk.Label(frame, text="No results available", font=("Arial", 12), fg="red").pack(pady=10)
+        self.results_tree = ttk.Treeview(results_frame, columns=("Subject", "Marks"), show="headings")
+        self.results_tree.heading("Subject", text="Subject")
+        self.results_tree.heading("Marks", text="Marks")
+        self.results_tree.pack(pady=10, fill="both", expand=True)
+        self.no_results_label = tk.Label(results_frame, text="No results available", font=("Arial", 12), fg="red")
+        
+        self.fee_frame = ttk.Frame(notebook)
+        notebook.add(self.fee_frame, text="Tuition Fee")
+
+    def refresh_student_dashboard(self):
+        # The frame is shared by every student who logs in on this machine.
+        self.welcome_label.config(text=f"Welcome, {self.current_user}")
+        self.results_tree.delete(*self.results_tree.get_children())
+        self.no_results_label.pack_forget()
+        for widget in self.fee_frame.winfo_children():
+            widget.destroy()
+        student_id = self.current_student_id
+        self.run_task(lambda: student_dashboards.get(self.db, student_id), self.show_student_data, write=False)
 
-    def show_tuition_fee(self, frame):
-        conn = sqlite3.connect('school_management.db')
-        c = conn.cursor()
-        c.execute("SELECT class FROM students WHERE student_id=?", (self.current_student_id,))
-        student_class = c.fetchone()
+    def show_student_data(self, dashboard):
+        if dashboard is None:
+            tk.Label(self.fee_frame, text="Student class not found", font=("Arial", 12), fg="red").pack(pady=20)
+            self.no_results_label.pack(pady=10)
+            return
         
-        if student_class:
-            c.execute("SELECT amount FROM fees WHERE class=?", (student_class[0],))
-            fee = c.fetchone()
-            
-            if fee:
-                tk.Label(frame, text=f"Tuition Fee for {student_class[0]}: ${fee[0]}", 
-                         font=("Arial", 14)).pack(pady=20)
-            else:
-                tk.Label(frame, text="Fee not set", font=("Arial", 12), fg="red").pack(pady=20)
-        else:
-            tk.Label(frame, text="Student class not found", font=("Arial", 12), fg="red").pack(pady=20)
+        for subject, marks in dashboard["results"]:
+            self.results_tree.insert("", "end", values=(subject, marks))
+        if not dashboard["results"]:
+            self.no_results_label.pack(pady=10)
         
-        conn.close()
+        if dashboard["tuition_fee"] is not None:
+            tk.Label(self.fee_frame, text=f"Tuition Fee for {dashboard['class']}: ${dashboard['tuition_fee']}", 
+                     font=("Arial", 14)).pack(pady=20)
+        else:
+            tk.Label(self.fee_frame, text="Fee not set", font=("Arial", 12), fg="red").pack(pady=20)
 
     def show_main_menu(self):
-        self.clear_screen()
-        
+        self.show_screen("main_menu")
+
+    def build_main_menu(self, frame):
         # Create a canvas with a scrollbar
-        canvas = tk.Canvas(self.root)
-        scrollbar = ttk.Scrollbar(self.root, orient="vertical", command=canvas.yview)
+        canvas = tk.Canvas(frame)
+        scrollbar = ttk.Scrollbar(frame, orient="vertical", command=canvas.yview)
         scrollable_frame = ttk.Frame(canvas)
         
         scrollable_frame.bind(
@@ -292,441 +3324,1041 @@ class SchoolManagementSystem:
         tk.Label(scrollable_frame, text="Admin Panel", font=("Arial", 20)).pack(pady=20)
         tk.Button(scrollable_frame, text="Logout", command=self.confirm_logout, 
                   font=("Arial", 14, "bold"), bg="red", fg="white", padx=10, pady=10).pack(pady=10)
+        tk.Button(scrollable_frame, text="Dashboard", command=self.show_dashboard, font=("Arial", 12)).pack(pady=10)
         tk.Button(scrollable_frame, text="Add Student", command=self.show_add_student, font=("Arial", 12)).pack(pady=10)
         tk.Button(scrollable_frame, text="Add Hosteler", command=self.show_add_hosteler, font=("Arial", 12)).pack(pady=10)
+        tk.Button(scrollable_frame, text="Hostel Rooms", command=self.show_hostel_rooms, font=("Arial", 12)).pack(pady=10)
         tk.Button(scrollable_frame, text="Add Bus Holder", command=self.show_add_bus_holder, font=("Arial", 12)).pack(pady=10)
+        tk.Button(scrollable_frame, text="Bus Routes", command=self.show_bus_routes, font=("Arial", 12)).pack(pady=10)
         tk.Button(scrollable_frame, text="Add Employee", command=self.show_add_employee, font=("Arial", 12)).pack(pady=10)
+        tk.Button(scrollable_frame, text="Bulk Import", command=self.show_bulk_import, font=("Arial", 12)).pack(pady=10)
+        tk.Button(scrollable_frame, text="Export Data", command=self.show_export, font=("Arial", 12)).pack(pady=10)
         tk.Button(scrollable_frame, text="Record Fee Payment", command=self.show_fee_payment, font=("Arial", 12)).pack(pady=10)
         tk.Button(scrollable_frame, text="Generate Salary Slip", command=self.show_salary_slip, font=("Arial", 12)).pack(pady=10)
         tk.Button(scrollable_frame, text="Generate Report Card", command=self.show_report_card, font=("Arial", 12)).pack(pady=10)
+        tk.Button(scrollable_frame, text="Bulk Marks Entry", command=self.show_bulk_marks, font=("Arial", 12)).pack(pady=10)
         tk.Button(scrollable_frame, text="Search Students", command=self.show_search_students, font=("Arial", 12)).pack(pady=10)
         tk.Button(scrollable_frame, text="Generate No Dues", command=self.show_no_dues, font=("Arial", 12)).pack(pady=10)
+        tk.Button(scrollable_frame, text="Students With Dues", command=self.show_outstanding_dues, font=("Arial", 12)).pack(pady=10)
+        tk.Button(scrollable_frame, text="Fee Settings", command=self.show_fee_settings, font=("Arial", 12)).pack(pady=10)
         tk.Button(scrollable_frame, text="Change Password", command=self.show_change_password, font=("Arial", 12)).pack(pady=10)
         tk.Button(scrollable_frame, text="Backup Database", command=self.backup_database, font=("Arial", 12)).pack(pady=10)
         tk.Button(scrollable_frame, text="Restore Database", command=self.restore_database, font=("Arial", 12)).pack(pady=10)
+        tk.Button(scrollable_frame, text="Restore Snapshot", command=self.show_snapshots, font=("Arial", 12)).pack(pady=10)
 
-    def show_add_student(self):
-        self.clear_screen()
+    def show_dashboard(self):
+        self.show_screen("dashboard")
+
+    def build_dashboard(self, frame):
+        tk.Label(frame, text="Dashboard", font=("Arial", 16)).pack(pady=20)
+        self.dashboard_labels = {}
+        for key in ("students", "hostel", "bus", "collected", "dues"):
+            self.dashboard_labels[key] = tk.Label(frame, font=("Arial", 12))
+            self.dashboard_labels[key].pack()
+        
+        tables = tk.Frame(frame)
+        tables.pack(pady=10, fill="both", expand=True)
+        self.dashboard_trees = {}
+        for key, title, columns in (("classes", "Students per Class", ("Class", "Students", "Hostel", "Bus")),
+                                    ("routes", "Bus Route Load", ("Route", "Riders", "Seats")),
+                                    ("collections", "Fees Collected", ("Month", "Payments", "Amount"))):
+            table = tk.Frame(tables)
+            table.pack(side="left", fill="both", expand=True, padx=10)
+            tk.Label(table, text=title, font=("Arial", 12, "bold")).pack()
+            tree = ttk.Treeview(table, columns=columns, show="headings", height=12)
+            for column in columns:
+                tree.heading(column, text=column)
+                tree.column(column, width=90)
+            tree.pack(fill="both", expand=True)
+            self.dashboard_trees[key] = tree
+        
+        tk.Button(frame, text="Verify Aggregates", command=self.verify_dashboard, font=("Arial", 12)).pack(pady=5)
+        tk.Button(frame, text="Back", command=self.go_back_to_main_menu, font=("Arial", 12)).pack(pady=5)
+
+    def refresh_dashboard(self):
+        self.run_task(lambda: dashboard_summary(self.db), self.show_dashboard_summary, write=False)
+
+    def show_dashboard_summary(self, summary):
+        summary["collections"] = [(month, payments, f"{amount:.2f}") for month, payments, amount in summary["collections"]]
+        labels = self.dashboard_labels
+        labels["students"].config(text=f"Students: {summary['students']}")
+        labels["hostel"].config(text=f"Hostel occupancy: {summary['hostelers']} of {summary['beds']} beds "
+                                     f"({summary['hostel_students']} hostel students)")
+        labels["bus"].config(text=f"Bus riders: {summary['bus_riders']}")
+        labels["collected"].config(text=f"Fees collected this month: ${summary['collected_this_month']:.2f}")
+        labels["dues"].config(text=f"Outstanding dues: ${summary['outstanding_dues']:.2f}")
+        for key, tree in self.dashboard_trees.items():
+            tree.delete(*tree.get_children())
+            for row in summary[key]:
+                tree.insert("", "end", values=row)
+
+    def verify_dashboard(self):
+        self.run_task(lambda: verify_dashboard(self.db), self.dashboard_verified, write=False)
+
+    def dashboard_verified(self, mismatches):
+        if not mismatches:
+            messagebox.showinfo("Dashboard", "All aggregates match the base tables.")
+            return
+        
+        details = "\n".join(f"{table} [{key}]: stored {stored}, expected {expected}"
+                            for table, key, stored, expected in mismatches[:10])
+        if not messagebox.askyesno("Dashboard", f"{len(mismatches)} aggregates are out of date:\n{details}\n\nRebuild them now?"):
+            return
+        
+        def work():
+            with self.db.transaction() as c:
+                rebuild_dashboard(c)
         
-        tk.Label(self.root, text="Add Student", font=("Arial", 16)).pack(pady=20)
+        def done(result):
+            log_action("Rebuilt dashboard aggregates", self.current_user)
+            self.show_dashboard()
         
-        tk.Label(self.root, text="Name").pack()
-        self.name_entry = tk.Entry(self.root)
+        self.run_task(work, done)
+
+    def show_add_student(self):
+        self.show_screen("add_student")
+
+    def build_add_student(self, frame):
+        tk.Label(frame, text="Add Student", font=("Arial", 16)).pack(pady=20)
+        
+        tk.Label(frame, text="Name").pack()
+        self.name_entry = tk.Entry(frame)
         self.name_entry.pack(pady=5)
         
-        tk.Label(self.root, text="Class").pack()
-        self.class_entry = tk.Entry(self.root)
+        tk.Label(frame, text="Class").pack()
+        self.class_entry = tk.Entry(frame)
         self.class_entry.pack(pady=5)
         
-        tk.Label(self.root, text="Hostel (Yes/No)").pack()
-        self.hostel_entry = tk.Entry(self.root)
+        tk.Label(frame, text="Hostel (Yes/No)").pack()
+        self.hostel_entry = tk.Entry(frame)
         self.hostel_entry.pack(pady=5)
         
-        tk.Label(self.root, text="Bus (Yes/No)").pack()
-        self.bus_entry = tk.Entry(self.root)
+        tk.Label(frame, text="Bus (Yes/No)").pack()
+        self.bus_entry = tk.Entry(frame)
         self.bus_entry.pack(pady=5)
         
-        tk.Button(self.root, text="Save", command=self.save_student, font=("Arial", 12)).pack(pady=20)
-        tk.Button(self.root, text="Back", command=self.go_back_to_main_menu, font=("Arial", 12)).pack(pady=5)
-
-    def save_student(self):
-        name = self.name_entry.get()
-        class_ = self.class_entry.get()
-        hostel = self.hostel_entry.get()
-        bus = self.bus_entry.get()
+        tk.Label(frame, text="Gender (M/F, optional)").pack()
+        self.gender_entry = tk.Entry(frame)
+        self.gender_entry.pack(pady=5)
         
-        if not all([name, class_, hostel, bus]):
-            messagebox.showerror("Error", "All fields are required")
-            return
+        tk.Label(frame, text="Pickup Point (bus students, optional)").pack()
+        self.student_pickup_entry = tk.Entry(frame)
+        self.student_pickup_entry.pack(pady=5)
         
-        student_id = str(uuid.uuid4())
-        created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        tk.Button(frame, text="Save", command=self.save_student, font=("Arial", 12)).pack(pady=20)
+        tk.Button(frame, text="Back", command=self.go_back_to_main_menu, font=("Arial", 12)).pack(pady=5)
+
+    def save_student(self):
+        row = {'name': self.name_entry.get(), 'class': self.class_entry.get(), 'hostel': self.hostel_entry.get(),
+               'bus': self.bus_entry.get(), 'gender': self.gender_entry.get(),
+               'pickup_point': self.student_pickup_entry.get()}
         
-        username = f"student{student_id[:8]}"
-        password = student_id[:8]
-        
-        conn = sqlite3.connect('school_management.db')
-        c = conn.cursor()
-        c.execute("INSERT INTO students (student_id, name, class, hostel_status, bus_status, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-                  (student_id, name, class_, hostel, bus, created_at))
-        c.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
-                  (username, password, 'student'))
-        conn.commit()
-        conn.close()
+        def done(student):
+            messagebox.showinfo("Success", "Student added successfully.\n"
+                                           f"Username: {student['username']}\nPassword: {student['password']}")
+            self.show_main_menu()
         
-        log_action(f"Added student: {name}", self.current_user)
-        messagebox.showinfo("Success", f"Student added successfully.\nUsername: {username}\nPassword: {password}")
-        self.show_main_menu()
+        self.run_task(lambda: add_student(self.db, row, self.current_user), done)
 
     def show_add_hosteler(self):
-        self.clear_screen()
-        
-        tk.Label(self.root, text="Add Hosteler", font=("Arial", 16)).pack(pady=20)
+        self.show_screen("add_hosteler")
+
+    def build_add_hosteler(self, frame):
+        tk.Label(frame, text="Add Hosteler", font=("Arial", 16)).pack(pady=20)
         
-        tk.Label(self.root, text="Student ID").pack()
-        self.hostel_student_id_entry = tk.Entry(self.root)
+        tk.Label(frame, text="Student ID").pack()
+        self.hostel_student_id_entry = tk.Entry(frame)
         self.hostel_student_id_entry.pack(pady=5)
         
-        tk.Label(self.root, text="Room Number").pack()
-        self.room_number_entry = tk.Entry(self.root)
+        tk.Label(frame, text="Room Number").pack()
+        self.room_number_entry = tk.Entry(frame)
         self.room_number_entry.pack(pady=5)
         
-        tk.Label(self.root, text="Joining Date (YYYY-MM-DD)").pack()
-        self.joining_date_entry = tk.Entry(self.root)
+        tk.Label(frame, text="Joining Date (YYYY-MM-DD)").pack()
+        self.joining_date_entry = tk.Entry(frame)
         self.joining_date_entry.pack(pady=5)
         
-        tk.Button(self.root, text="Save", command=self.save_hosteler, font=("Arial", 12)).pack(pady=20)
-        tk.Button(self.root, text="Back", command=self.go_back_to_main_menu, font=("Arial", 12)).pack(pady=5)
+        tk.Button(frame, text="Save", command=self.save_hosteler, font=("Arial", 12)).pack(pady=20)
+        tk.Button(frame, text="Back", command=self.go_back_to_main_menu, font=("Arial", 12)).pack(pady=5)
 
     def save_hosteler(self):
-        student_id = self.hostel_student_id_entry.get()
-        room_number = self.room_number_entry.get()
-        joining_date = self.joining_date_entry.get()
+        row = {'student_id': self.hostel_student_id_entry.get(), 'room_number': self.room_number_entry.get(),
+               'joining_date': self.joining_date_entry.get()}
+        
+        def done(result):
+            messagebox.showinfo("Success", "Hosteler added successfully")
+            self.show_main_menu()
         
-        if not all([student_id, room_number, joining_date]):
-            messagebox.showerror("Error", "All fields are required")
+        self.run_task(lambda: add_hosteler(self.db, row, self.current_user), done)
+
+    def show_hostel_rooms(self):
+        self.show_screen("hostel_rooms")
+
+    def build_hostel_rooms(self, frame):
+        tk.Label(frame, text="Hostel Rooms", font=("Arial", 16)).pack(pady=20)
+        
+        form = tk.Frame(frame)
+        form.pack(pady=5)
+        self.room_entries = {}
+        for column, label in enumerate(("Room Number", "Block", "Capacity", "Gender (optional)", "Class (optional)")):
+            tk.Label(form, text=label).grid(row=0, column=column, padx=5)
+            entry = tk.Entry(form, width=16)
+            entry.grid(row=1, column=column, padx=5)
+            self.room_entries[label] = entry
+        tk.Button(frame, text="Save Room", command=self.save_room, font=("Arial", 12)).pack(pady=5)
+        
+        allocate = tk.Frame(frame)
+        allocate.pack(pady=5)
+        tk.Label(allocate, text="Class to allocate (optional)").pack(side="left")
+        self.allocate_class_entry = tk.Entry(allocate)
+        self.allocate_class_entry.pack(side="left", padx=5)
+        tk.Button(allocate, text="Auto-Allocate Beds", command=self.allocate_beds, font=("Arial", 12)).pack(side="left")
+        tk.Button(frame, text="Back", command=self.go_back_to_main_menu, font=("Arial", 12)).pack(pady=5)
+        
+        columns = ("Room", "Block", "Gender", "Class", "Occupied", "Capacity")
+        self.rooms_tree = ttk.Treeview(frame, columns=columns, show="headings", height=10)
+        for column in columns:
+            self.rooms_tree.heading(column, text=column)
+            self.rooms_tree.column(column, width=110)
+        self.rooms_tree.pack(pady=5, fill="both", expand=True)
+        self.rooms_tree.bind("<<TreeviewSelect>>", lambda event: self.show_room_occupants())
+        
+        self.occupants_list = tk.Listbox(frame, width=100, height=8)
+        self.occupants_list.pack(pady=5, fill="both")
+
+    def refresh_hostel_rooms(self):
+        self.load_rooms()
+
+    def load_rooms(self):
+        def done(rows):
+            self.rooms_tree.delete(*self.rooms_tree.get_children())
+            for row in rows:
+                self.rooms_tree.insert("", "end", iid=row[0], values=[value if value is not None else "" for value in row])
+        
+        self.run_read(lambda conn: conn.execute("SELECT room_number, block, gender, class, occupied, capacity "
+                                                "FROM hostel_rooms ORDER BY room_number").fetchall(), done)
+
+    def show_room_occupants(self):
+        self.occupants_list.delete(0, "end")
+        selection = self.rooms_tree.selection()
+        if not selection:
             return
         
-        conn = sqlite3.connect('school_management.db')
-        c = conn.cursor()
-        c.execute("SELECT * FROM students WHERE student_id=? AND hostel_status='Yes'", (student_id,))
-        student = c.fetchone()
+        def done(occupants):
+            for student_id, name, class_, joining_date in occupants:
+                self.occupants_list.insert("end", f"{name} ({class_}) - {student_id} - since {joining_date}")
+            if not occupants:
+                self.occupants_list.insert("end", "Room is empty")
         
-        if not student:
-            messagebox.showerror("Error", "Student not found or not a hosteler")
-            conn.close()
+        self.run_read(lambda conn: room_occupants(conn, selection[0]), done)
+
+    def save_room(self):
+        values = {label: entry.get().strip() for label, entry in self.room_entries.items()}
+        room_number, block, capacity = values["Room Number"], values["Block"], values["Capacity"]
+        if not all([room_number, block, capacity]):
+            messagebox.showerror("Error", "Room number, block and capacity are required")
             return
         
-        hosteler_id = str(uuid.uuid4())
-        c.execute("INSERT INTO hostelers (hosteler_id, student_id, room_number, joining_date) VALUES (?, ?, ?, ?)",
-                  (hosteler_id, student_id, room_number, joining_date))
-        conn.commit()
-        conn.close()
+        try:
+            capacity = int(capacity)
+            if capacity < 1:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("Error", "Capacity must be a positive whole number")
+            return
         
-        log_action(f"Added hosteler: {student_id}", self.current_user)
-        messagebox.showinfo("Success", "Hosteler added successfully")
-        self.show_main_menu()
+        try:
+            gender = normalize_gender(values["Gender (optional)"])
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        
+        def done(result):
+            log_action(f"Saved hostel room: {room_number}", self.current_user)
+            self.load_rooms()
+        
+        self.run_task(lambda: save_room(self.db, room_number, block, capacity, gender, values["Class (optional)"] or None),
+                      done)
 
-    def show_add_bus_holder(self):
-        self.clear_screen()
+    def allocate_beds(self):
+        class_ = self.allocate_class_entry.get().strip() or None
+        if not messagebox.askyesno("Confirm", "Assign beds to every hosteler without a room"
+                                              + (f" in {class_}?" if class_ else "?")):
+            return
         
-        tk.Label(self.root, text="Add Bus Holder", font=("Arial", 16)).pack(pady=20)
+        def done(result):
+            allocations, unplaced = result
+            log_action(f"Allocated {len(allocations)} hostel beds", self.current_user)
+            message = f"{len(allocations)} beds allocated."
+            if unplaced:
+                message += f"\n{len(unplaced)} students could not be placed (no free bed in a matching block):\n"
+                message += "\n".join(unplaced[:10])
+            messagebox.showinfo("Allocation Complete", message)
+            self.load_rooms()
+        
+        self.run_task(lambda: allocate_beds(self.db, class_), done)
+
+    def show_add_bus_holder(self):
+        self.show_screen("add_bus_holder")
+
+    def build_add_bus_holder(self, frame):
+        tk.Label(frame, text="Add Bus Holder", font=("Arial", 16)).pack(pady=20)
         
-        tk.Label(self.root, text="Student ID").pack()
-        self.bus_student_id_entry = tk.Entry(self.root)
+        tk.Label(frame, text="Student ID").pack()
+        self.bus_student_id_entry = tk.Entry(frame)
         self.bus_student_id_entry.pack(pady=5)
         
-        tk.Label(self.root, text="Route Number").pack()
-        self.route_number_entry = tk.Entry(self.root)
+        tk.Label(frame, text="Route Number").pack()
+        self.route_number_entry = tk.Entry(frame)
         self.route_number_entry.pack(pady=5)
         
-        tk.Label(self.root, text="Pickup Point").pack()
-        self.pickup_point_entry = tk.Entry(self.root)
-        self.pickup_point_entry.pack(pady=5)
+        tk.Label(frame, text="Pickup Point").pack()
+        self.pickup_point_entry = tk.Entry(frame)
+        self.pickup_point_entry.pack(pady=5)
+        
+        tk.Button(frame, text="Save", command=self.save_bus_holder, font=("Arial", 12)).pack(pady=20)
+        tk.Button(frame, text="Back", command=self.go_back_to_main_menu, font=("Arial", 12)).pack(pady=5)
+
+    def save_bus_holder(self):
+        row = {'student_id': self.bus_student_id_entry.get(), 'route_number': self.route_number_entry.get(),
+               'pickup_point': self.pickup_point_entry.get()}
+        
+        def done(result):
+            messagebox.showinfo("Success", "Bus holder added successfully")
+            self.show_main_menu()
+        
+        self.run_task(lambda: add_bus_holder(self.db, row, self.current_user), done)
+
+    def show_bus_routes(self):
+        self.show_screen("bus_routes")
+
+    def build_bus_routes(self, frame):
+        tk.Label(frame, text="Bus Routes", font=("Arial", 16)).pack(pady=20)
+        
+        form = tk.Frame(frame)
+        form.pack(pady=5)
+        tk.Label(form, text="Route Number").grid(row=0, column=0, padx=5)
+        self.route_entry = tk.Entry(form, width=16)
+        self.route_entry.grid(row=1, column=0, padx=5)
+        tk.Label(form, text="Seats").grid(row=0, column=1, padx=5)
+        self.route_capacity_entry = tk.Entry(form, width=10)
+        self.route_capacity_entry.grid(row=1, column=1, padx=5)
+        tk.Label(form, text="Pickup Points in order (comma separated)").grid(row=0, column=2, padx=5)
+        self.route_stops_entry = tk.Entry(form, width=60)
+        self.route_stops_entry.grid(row=1, column=2, padx=5)
+        tk.Button(frame, text="Save Route", command=self.save_route, font=("Arial", 12)).pack(pady=5)
+        
+        assign = tk.Frame(frame)
+        assign.pack(pady=5)
+        tk.Label(assign, text="Class to assign (optional)").pack(side="left")
+        self.assign_class_entry = tk.Entry(assign)
+        self.assign_class_entry.pack(side="left", padx=5)
+        tk.Button(assign, text="Assign Students", command=self.assign_bus_routes, font=("Arial", 12)).pack(side="left")
+        tk.Button(frame, text="Back", command=self.go_back_to_main_menu, font=("Arial", 12)).pack(pady=5)
+        
+        columns = ("Route", "Riders", "Seats", "Stops")
+        self.routes_tree = ttk.Treeview(frame, columns=columns, show="headings", height=10)
+        for column, width in zip(columns, (100, 80, 80, 500)):
+            self.routes_tree.heading(column, text=column)
+            self.routes_tree.column(column, width=width)
+        self.routes_tree.pack(pady=5, fill="both", expand=True)
+        self.routes_tree.bind("<<TreeviewSelect>>", lambda event: self.show_route_riders())
+        
+        self.riders_list = tk.Listbox(frame, width=100, height=8)
+        self.riders_list.pack(pady=5, fill="both")
+
+    def refresh_bus_routes(self):
+        self.load_routes()
+
+    def load_routes(self):
+        def done(rows):
+            self.routes_tree.delete(*self.routes_tree.get_children())
+            for route_number, riders, capacity, stops in rows:
+                self.routes_tree.insert("", "end", iid=route_number, values=(route_number, riders, capacity, stops or ""))
+        
+        self.run_read(lambda conn: conn.execute(
+            '''SELECT r.route_number, r.riders, r.capacity,
+                      (SELECT group_concat(pickup_point, ', ') FROM
+                          (SELECT pickup_point FROM bus_stops WHERE route_number = r.route_number ORDER BY stop_order))
+               FROM bus_routes r ORDER BY r.route_number''').fetchall(), done)
+
+    def show_route_riders(self):
+        self.riders_list.delete(0, "end")
+        selection = self.routes_tree.selection()
+        if not selection:
+            return
+        
+        def done(riders):
+            for student_id, name, class_, pickup_point in riders:
+                self.riders_list.insert("end", f"{pickup_point}: {name} ({class_}) - {student_id}")
+            if not riders:
+                self.riders_list.insert("end", "No riders on this route")
         
-        tk.Button(self.root, text="Save", command=self.save_bus_holder, font=("Arial", 12)).pack(pady=20)
-        tk.Button(self.root, text="Back", command=self.go_back_to_main_menu, font=("Arial", 12)).pack(pady=5)
+        self.run_read(lambda conn: route_riders(conn, selection[0]), done)
 
-    def save_bus_holder(self):
-        student_id = self.bus_student_id_entry.get()
-        route_number = self.route_number_entry.get()
-        pickup_point = self.pickup_point_entry.get()
+    def save_route(self):
+        route_number = self.route_entry.get().strip()
+        capacity = self.route_capacity_entry.get().strip()
+        if not all([route_number, capacity]):
+            messagebox.showerror("Error", "Route number and seats are required")
+            return
+        
+        try:
+            capacity = int(capacity)
+            if capacity < 1:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("Error", "Seats must be a positive whole number")
+            return
         
-        if not all([student_id, route_number, pickup_point]):
-            messagebox.showerror("Error", "All fields are required")
+        try:
+            stops = parse_stops(self.route_stops_entry.get())
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
             return
         
-        conn = sqlite3.connect('school_management.db')
-        c = conn.cursor()
-        c.execute("SELECT * FROM students WHERE student_id=? AND bus_status='Yes'", (student_id,))
-        student = c.fetchone()
+        def done(result):
+            log_action(f"Saved bus route: {route_number}", self.current_user)
+            self.load_routes()
         
-        if not student:
-            messagebox.showerror("Error", "Student not found or not a bus holder")
-            conn.close()
+        self.run_task(lambda: save_route(self.db, route_number, capacity, stops), done)
+
+    def assign_bus_routes(self):
+        class_ = self.assign_class_entry.get().strip() or None
+        if not messagebox.askyesno("Confirm", "Assign a route to every bus student without one"
+                                              + (f" in {class_}?" if class_ else "?")):
             return
         
-        bus_holder_id = str(uuid.uuid4())
-        c.execute("INSERT INTO bus_holders (bus_holder_id, student_id, route_number, pickup_point) VALUES (?, ?, ?, ?)",
-                  (bus_holder_id, student_id, route_number, pickup_point))
-        conn.commit()
-        conn.close()
+        self.run_task(lambda: assign_bus_routes(self.db, class_), self.bus_routes_assigned)
+
+    def bus_routes_assigned(self, result):
+        assignments, overflow = result
+        log_action(f"Assigned {len(assignments)} students to bus routes", self.current_user)
+        self.load_routes()
+        if not overflow:
+            messagebox.showinfo("Assignment Complete", f"{len(assignments)} students assigned to routes.")
+            return
         
-        log_action(f"Added bus holder: {student_id}", self.current_user)
-        messagebox.showinfo("Success", "Bus holder added successfully")
-        self.show_main_menu()
+        if not messagebox.askyesno("Assignment Complete", f"{len(assignments)} students assigned to routes.\n"
+                                                          f"{len(overflow)} students could not be placed.\n\n"
+                                                          "Save the overflow report?"):
+            return
+        file_path = filedialog.asksaveasfilename(defaultextension=".csv", initialfile="bus_overflow.csv",
+                                                 filetypes=[("CSV files", "*.csv")])
+        if file_path:
+            with open(file_path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(["student_id", "name", "pickup_point", "reason"])
+                writer.writerows(overflow)
 
     def show_add_employee(self):
-        self.clear_screen()
-        
-        tk.Label(self.root, text="Add Employee", font=("Arial", 16)).pack(pady=20)
+        self.show_screen("add_employee")
+
+    def build_add_employee(self, frame):
+        tk.Label(frame, text="Add Employee", font=("Arial", 16)).pack(pady=20)
         
-        tk.Label(self.root, text="Name").pack()
-        self.emp_name_entry = tk.Entry(self.root)
+        tk.Label(frame, text="Name").pack()
+        self.emp_name_entry = tk.Entry(frame)
         self.emp_name_entry.pack(pady=5)
         
-        tk.Label(self.root, text="Designation").pack()
-        self.designation_entry = tk.Entry(self.root)
+        tk.Label(frame, text="Designation").pack()
+        self.designation_entry = tk.Entry(frame)
         self.designation_entry.pack(pady=5)
         
-        tk.Label(self.root, text="Salary").pack()
-        self.salary_entry = tk.Entry(self.root)
+        tk.Label(frame, text="Salary").pack()
+        self.salary_entry = tk.Entry(frame)
         self.salary_entry.pack(pady=5)
         
-        tk.Button(self.root, text="Save", command=self.save_employee, font=("Arial", 12)).pack(pady=20)
-        tk.Button(self.root, text="Back", command=self.go_back_to_main_menu, font=("Arial", 12)).pack(pady=5)
+        tk.Button(frame, text="Save", command=self.save_employee, font=("Arial", 12)).pack(pady=20)
+        tk.Button(frame, text="Back", command=self.go_back_to_main_menu, font=("Arial", 12)).pack(pady=5)
 
     def save_employee(self):
-        name = self.emp_name_entry.get()
-        designation = self.designation_entry.get()
-        salary = self.salary_entry.get()
+        row = {'name': self.emp_name_entry.get(), 'designation': self.designation_entry.get(),
+               'salary': self.salary_entry.get()}
+        
+        def done(result):
+            messagebox.showinfo("Success", "Employee added successfully")
+            self.show_main_menu()
         
-        if not all([name, designation, salary]):
-            messagebox.showerror("Error", "All fields are required")
+        self.run_task(lambda: add_employee(self.db, row, self.current_user), done)
+
+    def show_bulk_import(self):
+        self.show_screen("bulk_import")
+
+    def build_bulk_import(self, frame):
+        tk.Label(frame, text="Bulk Import", font=("Arial", 16)).pack(pady=20)
+        
+        tk.Label(frame, text="Import Type").pack()
+        self.import_kind = ttk.Combobox(frame, values=list(IMPORT_SPECS), state="readonly")
+        self.import_kind.current(0)
+        self.import_kind.pack(pady=5)
+        self.import_kind.bind("<<ComboboxSelected>>", lambda event: self.update_import_columns())
+        
+        self.import_columns_label = tk.Label(frame, fg="gray")
+        self.import_columns_label.pack(pady=5)
+        self.update_import_columns()
+        
+        self.import_path = None
+        self.import_file_label = tk.Label(frame, text="No file selected")
+        self.import_file_label.pack(pady=5)
+        tk.Button(frame, text="Choose File", command=self.choose_import_file, font=("Arial", 12)).pack(pady=5)
+        
+        self.import_button = tk.Button(frame, text="Import", command=self.start_import, font=("Arial", 12))
+        self.import_button.pack(pady=10)
+        self.import_cancel_button = tk.Button(frame, text="Cancel Import", command=self.cancel_import,
+                                              font=("Arial", 12), state="disabled")
+        self.import_cancel_button.pack(pady=5)
+        tk.Button(frame, text="Back", command=self.go_back_to_main_menu, font=("Arial", 12)).pack(pady=5)
+        
+        self.import_progress = ttk.Progressbar(frame, length=400, maximum=100)
+        self.import_progress.pack(pady=10)
+        self.import_status = tk.Label(frame, text="")
+        self.import_status.pack()
+        self.import_errors = tk.Listbox(frame, width=100, height=10)
+        self.import_errors.pack(pady=10, fill="both", expand=True)
+
+    def refresh_bulk_import(self):
+        self.update_import_columns()
+        if str(self.import_button["state"]) == "disabled":
+            return  # an import is still running; keep its progress on screen
+        self.import_path = None
+        self.import_file_label.config(text="No file selected")
+        self.import_progress["value"] = 0
+        self.import_status.config(text="")
+
+    def update_import_columns(self):
+        columns = IMPORT_SPECS[self.import_kind.get()][0]
+        self.import_columns_label.config(text=f"Columns: {', '.join(columns)}")
+
+    def choose_import_file(self):
+        file_path = filedialog.askopenfilename(filetypes=[("CSV or Excel files", "*.csv *.xlsx *.xlsm"),
+                                                          ("All files", "*.*")])
+        if file_path:
+            self.import_path = file_path
+            self.import_file_label.config(text=file_path)
+
+    def start_import(self):
+        kind = self.import_kind.get()
+        if not self.import_path:
+            messagebox.showerror("Error", "Choose a file to import")
             return
         
+        credentials_path = None
+        if kind == "Students":
+            credentials_path = filedialog.asksaveasfilename(title="Save generated student credentials",
+                                                            defaultextension=".csv", filetypes=[("CSV files", "*.csv")])
+            if not credentials_path:
+                return
+        
+        self.import_button.config(state="disabled")
+        self.import_cancel_button.config(state="normal")
+        self.import_errors.delete(0, "end")
+        self.import_progress["value"] = 0
+        self.import_status.config(text="Importing...")
+        self.import_cancel = threading.Event()
+        path = self.import_path
+        
+        def progress(rows, fraction):
+            if self.import_progress.winfo_exists():
+                self.import_progress["value"] = fraction * 100
+                self.import_status.config(text=f"{rows} rows processed")
+        
+        def done(result):
+            log_action(f"Bulk imported {result['imported']} {kind.lower()}", self.current_user)
+            if not self.import_progress.winfo_exists():
+                return
+            self.import_button.config(state="normal")
+            self.import_cancel_button.config(state="disabled")
+            for line, message in result['errors']:
+                self.import_errors.insert("end", f"Line {line}: {message}")
+            status = "cancelled" if result['cancelled'] else "finished"
+            self.import_status.config(text=f"Import {status}: {result['imported']} imported, {result['failed']} failed")
+        
+        def failed(error):
+            if self.import_progress.winfo_exists():
+                self.import_button.config(state="normal")
+                self.import_cancel_button.config(state="disabled")
+                self.import_status.config(text="")
+            messagebox.showerror("Error", f"Import failed: {error}")
+        
+        self.run_in_background(
+            lambda report: bulk_import(self.db, kind, path, progress=report, cancel=self.import_cancel,
+                                       credentials_path=credentials_path),
+            progress, done, failed)
+
+    def cancel_import(self):
+        self.import_cancel.set()
+
+    def show_export(self):
+        self.show_screen("export")
+
+    def build_export(self, frame):
+        tk.Label(frame, text="Export Data", font=("Arial", 16)).pack(pady=20)
+        
+        tk.Label(frame, text="Table").pack()
+        self.export_table = ttk.Combobox(frame, values=list(EXPORT_SPECS), state="readonly")
+        self.export_table.current(0)
+        self.export_table.pack(pady=5)
+        
+        tk.Label(frame, text="Format").pack()
+        self.export_format = ttk.Combobox(frame, values=["CSV", "JSONL"], state="readonly")
+        self.export_format.current(0)
+        self.export_format.pack(pady=5)
+        
+        tk.Label(frame, text="Class (optional)").pack()
+        self.export_class_entry = tk.Entry(frame)
+        self.export_class_entry.pack(pady=5)
+        
+        tk.Label(frame, text="From Date (YYYY-MM-DD, optional)").pack()
+        self.export_from_entry = tk.Entry(frame)
+        self.export_from_entry.pack(pady=5)
+        
+        tk.Label(frame, text="To Date (YYYY-MM-DD, optional)").pack()
+        self.export_to_entry = tk.Entry(frame)
+        self.export_to_entry.pack(pady=5)
+        
+        self.export_button = tk.Button(frame, text="Export", command=self.start_export, font=("Arial", 12))
+        self.export_button.pack(pady=10)
+        self.export_cancel_button = tk.Button(frame, text="Cancel Export", command=self.cancel_export,
+                                              font=("Arial", 12), state="disabled")
+        self.export_cancel_button.pack(pady=5)
+        tk.Button(frame, text="Back", command=self.go_back_to_main_menu, font=("Arial", 12)).pack(pady=5)
+        
+        self.export_progress = ttk.Progressbar(frame, length=400, maximum=100)
+        self.export_progress.pack(pady=10)
+        self.export_status = tk.Label(frame, text="")
+        self.export_status.pack()
+
+    def refresh_export(self):
+        if str(self.export_button["state"]) == "disabled":
+            return  # an export is still running; keep its progress on screen
+        self.export_progress["value"] = 0
+        self.export_status.config(text="")
+
+    def start_export(self):
+        table = self.export_table.get()
+        fmt = self.export_format.get().lower()
+        filters = {
+            'class_': self.export_class_entry.get().strip() or None,
+            'date_from': self.export_from_entry.get().strip() or None,
+            'date_to': self.export_to_entry.get().strip() or None,
+        }
         try:
-            salary = float(salary)
-        except ValueError:
-            messagebox.showerror("Error", "Invalid salary amount")
+            export_query(table, **filters)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        
+        file_path = filedialog.asksaveasfilename(defaultextension=f".{fmt}", initialfile=f"{table}.{fmt}",
+                                                 filetypes=[(f"{fmt.upper()} files", f"*.{fmt}")])
+        if not file_path:
             return
         
-        employee_id = str(uuid.uuid4())
-        created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.export_button.config(state="disabled")
+        self.export_cancel_button.config(state="normal")
+        self.export_progress["value"] = 0
+        self.export_status.config(text="Exporting...")
+        self.export_cancel = threading.Event()
+        
+        def progress(written, total):
+            if self.export_progress.winfo_exists():
+                self.export_progress["value"] = written * 100 / total if total else 100
+                self.export_status.config(text=f"{written} of {total} rows written")
+        
+        def done(result):
+            written, cancelled = result
+            if not cancelled:
+                log_action(f"Exported {written} rows from {table}", self.current_user)
+            if self.export_progress.winfo_exists():
+                self.export_button.config(state="normal")
+                self.export_cancel_button.config(state="disabled")
+                self.export_status.config(text="Export cancelled" if cancelled else f"Exported {written} rows")
+        
+        def failed(error):
+            if self.export_progress.winfo_exists():
+                self.export_button.config(state="normal")
+                self.export_cancel_button.config(state="disabled")
+                self.export_status.config(text="")
+            messagebox.showerror("Error", f"Export failed: {error}")
+        
+        self.run_in_background(
+            lambda report: export_table(self.db, table, file_path, fmt, progress=report,
+                                        cancel=self.export_cancel, **filters),
+            progress, done, failed)
+
+    def cancel_export(self):
+        self.export_cancel.set()
+
+    def run_in_background(self, work, on_progress, on_done, on_error):
+        # work(report) runs on a worker thread; report(*args) and the result
+        # are handed back to the callbacks on the Tk thread via root.after.
+        events = queue.Queue()
         
-        conn = sqlite3.connect('school_management.db')
-        c = conn.cursor()
-        c.execute("INSERT INTO employees (employee_id, name, designation, salary, created_at) VALUES (?, ?, ?, ?, ?)",
-                  (employee_id, name, designation, salary, created_at))
-        conn.commit()
-        conn.close()
+        def run():
+            try:
+                events.put(('done', work(lambda *args: events.put(('progress', args)))))
+            except Exception as e:
+                events.put(('error', e))
         
-        log_action(f"Added employee: {name}", self.current_user)
-        messagebox.showinfo("Success", "Employee added successfully")
-        self.show_main_menu()
+        threading.Thread(target=run, daemon=True).start()
+        self.root.after(TASK_POLL_MS, self.poll_background, events, on_progress, on_done, on_error)
+
+    def poll_background(self, events, on_progress, on_done, on_error):
+        while True:
+            try:
+                event, payload = events.get_nowait()
+            except queue.Empty:
+                break
+            if event == 'progress':
+                on_progress(*payload)
+            elif event == 'done':
+                on_done(payload)
+                return
+            else:
+                on_error(payload)
+                return
+        self.root.after(TASK_POLL_MS, self.poll_background, events, on_progress, on_done, on_error)
 
     def show_fee_payment(self):
-        self.clear_screen()
-        
-        tk.Label(self.root, text="Record Fee Payment", font=("Arial", 16)).pack(pady=20)
+        self.show_screen("fee_payment")
+
+    def build_fee_payment(self, frame):
+        tk.Label(frame, text="Record Fee Payment", font=("Arial", 16)).pack(pady=20)
         
-        tk.Label(self.root, text="Student ID").pack()
-        self.student_id_entry = tk.Entry(self.root)
+        tk.Label(frame, text="Student ID").pack()
+        self.student_id_entry = tk.Entry(frame)
         self.student_id_entry.pack(pady=5)
         
-        tk.Label(self.root, text="Fee Type (Class/Hostel/Bus)").pack()
-        self.fee_type_entry = tk.Entry(self.root)
+        tk.Label(frame, text="Fee Type (Class/Hostel/Bus)").pack()
+        self.fee_type_entry = tk.Entry(frame)
         self.fee_type_entry.pack(pady=5)
         
-        tk.Label(self.root, text="Amount").pack()
-        self.amount_entry = tk.Entry(self.root)
+        tk.Label(frame, text="Amount").pack()
+        self.amount_entry = tk.Entry(frame)
         self.amount_entry.pack(pady=5)
         
-        tk.Button(self.root, text="Save Payment", command=self.save_fee_payment, font=("Arial", 12)).pack(pady=20)
-        tk.Button(self.root, text="Back", command=self.go_back_to_main_menu, font=("Arial", 12)).pack(pady=5)
+        tk.Button(frame, text="Save Payment", command=self.save_fee_payment, font=("Arial", 12)).pack(pady=20)
+        tk.Button(frame, text="Back", command=self.go_back_to_main_menu, font=("Arial", 12)).pack(pady=5)
 
     def save_fee_payment(self):
-        student_id = self.student_id_entry.get()
-        fee_type = self.fee_type_entry.get()
-        amount = self.amount_entry.get()
-        
-        if not all([student_id, fee_type, amount]):
-            messagebox.showerror("Error", "All fields are required")
-            return
-        
-        try:
-            amount = float(amount)
-        except ValueError:
-            messagebox.showerror("Error", "Invalid amount")
-            return
-        
-        conn = sqlite3.connect('school_management.db')
-        c = conn.cursor()
-        c.execute("SELECT * FROM students WHERE student_id=?", (student_id,))
-        student = c.fetchone()
+        row = {'student_id': self.student_id_entry.get(), 'fee_type': self.fee_type_entry.get(),
+               'amount': self.amount_entry.get()}
         
-        if not student:
-            messagebox.showerror("Error", "Student not found")
-            conn.close()
-            return
-        
-        transaction_id = str(uuid.uuid4())
-        payment_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        c.execute("INSERT INTO fee_transactions (transaction_id, student_id, fee_type, amount, payment_date) VALUES (?, ?, ?, ?, ?)",
-                  (transaction_id, student_id, fee_type, amount, payment_date))
-        conn.commit()
-        conn.close()
+        def done(payment):
+            messagebox.showinfo("Success", f"Payment recorded. Transaction ID: {payment['transaction_id']}")
+            self.show_main_menu()
         
-        log_action(f"Recorded payment for student: {student_id}", self.current_user)
-        messagebox.showinfo("Success", f"Payment recorded. Transaction ID: {transaction_id}")
-        self.show_main_menu()
+        self.run_task(lambda: record_fee_payment(self.db, row, self.current_user), done)
 
     def show_salary_slip(self):
-        self.clear_screen()
-        
-        tk.Label(self.root, text="Generate Salary Slip", font=("Arial", 16)).pack(pady=20)
+        self.show_screen("salary_slip")
+
+    def build_salary_slip(self, frame):
+        tk.Label(frame, text="Generate Salary Slip", font=("Arial", 16)).pack(pady=20)
         
-        tk.Label(self.root, text="Employee ID").pack()
-        self.employee_id_entry = tk.Entry(self.root)
+        tk.Label(frame, text="Employee ID").pack()
+        self.employee_id_entry = tk.Entry(frame)
         self.employee_id_entry.pack(pady=5)
         
-        tk.Label(self.root, text="Month (e.g., 2025-04)").pack()
-        self.month_entry = tk.Entry(self.root)
+        tk.Label(frame, text="Month (e.g., 2025-04)").pack()
+        self.month_entry = tk.Entry(frame)
         self.month_entry.pack(pady=5)
         
-        tk.Label(self.root, text="Amount").pack()
-        self.salary_amount_entry = tk.Entry(self.root)
+        tk.Label(frame, text="Amount").pack()
+        self.salary_amount_entry = tk.Entry(frame)
         self.salary_amount_entry.pack(pady=5)
         
-        tk.Button(self.root, text="Generate Slip", command=self.save_salary_slip, font=("Arial", 12)).pack(pady=20)
-        tk.Button(self.root, text="Back", command=self.go_back_to_main_menu, font=("Arial", 12)).pack(pady=5)
-
-    def save_salary_slip(self):
-        employee_id = self.employee_id_entry.get()
-        month = self.month_entry.get()
-        amount = self.salary_amount_entry.get()
+        tk.Button(frame, text="Generate Slip", command=self.save_salary_slip, font=("Arial", 12)).pack(pady=20)
         
-        if not all([employee_id, month, amount]):
-            messagebox.showerror("Error", "All fields are required")
+        tk.Label(frame, text="Payroll for all active employees uses the Month above").pack()
+        tk.Button(frame, text="Run Payroll", command=self.run_payroll, font=("Arial", 12)).pack(pady=5)
+        tk.Button(frame, text="Export Payroll", command=self.export_payroll, font=("Arial", 12)).pack(pady=5)
+        tk.Button(frame, text="Back", command=self.go_back_to_main_menu, font=("Arial", 12)).pack(pady=5)
+
+    def run_payroll(self):
+        try:
+            month = parse_month(self.month_entry.get())
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        if not messagebox.askyesno("Confirm Payroll", f"Generate salary slips for all active employees for {month}?"):
             return
         
+        def done(result):
+            messagebox.showinfo("Success", f"{result['issued']} salary slips generated for {month}.\n"
+                                           f"{result['existing']} employees already had a slip.")
+        
+        self.run_task(lambda: issue_payroll(self.db, {'month': month}, self.current_user), done)
+
+    def export_payroll(self):
         try:
-            amount = float(amount)
-        except ValueError:
-            messagebox.showerror("Error", "Invalid amount")
+            month = parse_month(self.month_entry.get())
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        file_path = filedialog.asksaveasfilename(defaultextension=".csv", initialfile=f"payroll_{month}.csv",
+                                                 filetypes=[("CSV files", "*.csv")])
+        if not file_path:
             return
         
-        conn = sqlite3.connect('school_management.db')
-        c = conn.cursor()
-        c.execute("SELECT * FROM employees WHERE employee_id=?", (employee_id,))
-        employee = c.fetchone()
+        def done(result):
+            count, total = result
+            log_action(f"Exported payroll for {month}", self.current_user)
+            messagebox.showinfo("Success", f"Exported {count} salary slips totalling ${total:.2f}")
         
-        if not employee:
-            messagebox.showerror("Error", "Employee not found")
-            conn.close()
+        self.run_task(lambda: export_payroll(self.db, month, file_path), done, write=False)
+
+    def save_salary_slip(self):
+        row = {'employee_id': self.employee_id_entry.get(), 'month': self.month_entry.get(),
+               'amount': self.salary_amount_entry.get()}
+        
+        try:
+            employee_id, month, amount = salary_slip_fields(row)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
             return
         
-        slip_id = str(uuid.uuid4())
-        issued_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        def checked(salary):
+            if salary is not None and amount != salary:
+                if not messagebox.askyesno("Confirm Amount",
+                                           f"Amount differs from the employee's salary (${salary:.2f}). Continue?"):
+                    return
+            self.issue_salary_slip(row)
         
-        c.execute("INSERT INTO salary_slips (slip_id, employee_id, month, amount, issued_date) VALUES (?, ?, ?, ?, ?)",
-                  (slip_id, employee_id, month, amount, issued_date))
-        conn.commit()
-        conn.close()
+        self.run_read(lambda conn: unissued_salary(conn, employee_id, month), checked)
+
+    def issue_salary_slip(self, row):
+        def done(slip):
+            messagebox.showinfo("Success", f"Salary slip generated. Slip ID: {slip['slip_id']}")
+            self.show_main_menu()
         
-        log_action(f"Generated salary slip for employee: {employee_id}", self.current_user)
-        messagebox.showinfo("Success", f"Salary slip generated. Slip ID: {slip_id}")
-        self.show_main_menu()
+        self.run_task(lambda: issue_salary_slip(self.db, row, self.current_user), done)
 
     def show_report_card(self):
-        self.clear_screen()
-        
-        tk.Label(self.root, text="Generate Report Card", font=("Arial", 16)).pack(pady=20)
+        self.show_screen("report_card")
+
+    def build_report_card(self, frame):
+        tk.Label(frame, text="Generate Report Card", font=("Arial", 16)).pack(pady=20)
         
-        tk.Label(self.root, text="Student ID").pack()
-        self.report_student_id_entry = tk.Entry(self.root)
+        tk.Label(frame, text="Student ID").pack()
+        self.report_student_id_entry = tk.Entry(frame)
         self.report_student_id_entry.pack(pady=5)
         
-        tk.Label(self.root, text="Subject").pack()
-        self.subject_entry = tk.Entry(self.root)
+        tk.Label(frame, text="Subject").pack()
+        self.subject_entry = tk.Entry(frame)
         self.subject_entry.pack(pady=5)
         
-        tk.Label(self.root, text="Marks").pack()
-        self.marks_entry = tk.Entry(self.root)
+        tk.Label(frame, text="Marks").pack()
+        self.marks_entry = tk.Entry(frame)
         self.marks_entry.pack(pady=5)
         
-        tk.Button(self.root, text="Save Marks", command=self.save_report_card, font=("Arial", 12)).pack(pady=20)
-        tk.Button(self.root, text="Back", command=self.go_back_to_main_menu, font=("Arial", 12)).pack(pady=5)
+        tk.Button(frame, text="Save Marks", command=self.save_report_card, font=("Arial", 12)).pack(pady=20)
+        tk.Button(frame, text="Back", command=self.go_back_to_main_menu, font=("Arial", 12)).pack(pady=5)
 
     def save_report_card(self):
-        student_id = self.report_student_id_entry.get()
-        subject = self.subject_entry.get()
-        marks = self.marks_entry.get()
+        row = {'student_id': self.report_student_id_entry.get(), 'subject': self.subject_entry.get(),
+               'marks': self.marks_entry.get()}
         
-        if not all([student_id, subject, marks]):
-            messagebox.showerror("Error", "All fields are required")
-            return
+        def done(result):
+            messagebox.showinfo("Success", "Report card entry saved")
+            self.show_main_menu()
         
-        try:
-            marks = int(marks)
-            if marks < 0 or marks > 100:
-                raise ValueError
-        except ValueError:
-            messagebox.showerror("Error", "Marks must be a number between 0 and 100")
+        self.run_task(lambda: add_marks(self.db, row, self.current_user), done)
+
+    def show_bulk_marks(self):
+        self.show_screen("bulk_marks")
+
+    def build_bulk_marks(self, frame):
+        tk.Label(frame, text="Bulk Marks Entry", font=("Arial", 16)).pack(pady=10)
+        
+        form = tk.Frame(frame)
+        form.pack(pady=5)
+        tk.Label(form, text="Class").grid(row=0, column=0, padx=5)
+        self.marks_class_entry = tk.Entry(form)
+        self.marks_class_entry.grid(row=0, column=1, padx=5)
+        tk.Label(form, text="Subjects (comma separated)").grid(row=0, column=2, padx=5)
+        self.marks_subjects_entry = tk.Entry(form, width=40)
+        self.marks_subjects_entry.grid(row=0, column=3, padx=5)
+        tk.Button(form, text="Load", command=self.load_marks_grid, font=("Arial", 12)).grid(row=0, column=4, padx=5)
+        
+        buttons = tk.Frame(frame)
+        buttons.pack(pady=5)
+        tk.Button(buttons, text="Save All", command=self.save_marks_grid, font=("Arial", 12)).pack(side="left", padx=5)
+        tk.Button(buttons, text="Import Marks File", command=self.show_bulk_import, font=("Arial", 12)).pack(side="left", padx=5)
+        tk.Button(buttons, text="Generate Report Cards", command=self.generate_class_report_cards,
+                  font=("Arial", 12)).pack(side="left", padx=5)
+        tk.Button(buttons, text="Back", command=self.go_back_to_main_menu, font=("Arial", 12)).pack(side="left", padx=5)
+        
+        canvas = tk.Canvas(frame)
+        scrollbar = ttk.Scrollbar(frame, orient="vertical", command=canvas.yview)
+        self.marks_grid = ttk.Frame(canvas)
+        self.marks_grid.bind("<Configure>", lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
+        canvas.create_window((0, 0), window=self.marks_grid, anchor="nw")
+        canvas.configure(yscrollcommand=scrollbar.set)
+        canvas.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+        self.marks_cells = {}
+
+    def refresh_bulk_marks(self):
+        for widget in self.marks_grid.winfo_children():
+            widget.destroy()
+        self.marks_cells = {}
+
+    def load_marks_grid(self):
+        class_ = self.marks_class_entry.get().strip()
+        subjects = list(dict.fromkeys(subject.strip() for subject in self.marks_subjects_entry.get().split(",")
+                                      if subject.strip()))
+        if not class_ or not subjects:
+            messagebox.showerror("Error", "Class and at least one subject are required")
             return
         
-        conn = sqlite3.connect('school_management.db')
-        c = conn.cursor()
-        c.execute("SELECT * FROM students WHERE student_id=?", (student_id,))
-        student = c.fetchone()
+        def query(conn):
+            students = conn.execute("SELECT student_id, name FROM students WHERE class=? ORDER BY name", (class_,)).fetchall()
+            if not students:
+                raise ValueError("No students in this class")
+            placeholders = ", ".join("?" * len(subjects))
+            existing = {(student_id, subject): marks for student_id, subject, marks in conn.execute(
+                f"""SELECT s.student_id, r.subject, r.marks FROM report_cards r
+                    JOIN students s ON s.id = r.student
+                    WHERE s.class = ? AND r.subject IN ({placeholders})""", [class_] + subjects)}
+            return students, existing
+        
+        self.run_read(query, lambda result: self.show_marks_grid(subjects, *result))
+
+    def show_marks_grid(self, subjects, students, existing):
+        for widget in self.marks_grid.winfo_children():
+            widget.destroy()
+        tk.Label(self.marks_grid, text="Student", font=("Arial", 10, "bold")).grid(row=0, column=0, padx=5, sticky="w")
+        for column, subject in enumerate(subjects, start=1):
+            tk.Label(self.marks_grid, text=subject, font=("Arial", 10, "bold")).grid(row=0, column=column, padx=5)
+        self.marks_cells = {}
+        for row, (student_id, name) in enumerate(students, start=1):
+            tk.Label(self.marks_grid, text=name).grid(row=row, column=0, padx=5, sticky="w")
+            for column, subject in enumerate(subjects, start=1):
+                entry = tk.Entry(self.marks_grid, width=6, justify="center")
+                if (student_id, subject) in existing:
+                    entry.insert(0, existing[(student_id, subject)])
+                entry.grid(row=row, column=column, padx=2, pady=1)
+                self.marks_cells[(student_id, subject)] = entry
+
+    def save_marks_grid(self):
+        if not self.marks_cells:
+            messagebox.showerror("Error", "Load a class first")
+            return
         
-        if not student:
-            messagebox.showerror("Error", "Student not found")
-            conn.close()
+        entries = []
+        invalid = 0
+        for (student_id, subject), entry in self.marks_cells.items():
+            value = entry.get().strip()
+            entry.config(bg="white")
+            if not value:
+                continue
+            try:
+                entries.append((student_id, subject, parse_marks(value)))
+            except ValueError:
+                entry.config(bg="#f4cccc")
+                invalid += 1
+        if invalid:
+            messagebox.showerror("Error", f"{invalid} highlighted cells must be numbers between 0 and 100")
             return
         
-        report_id = str(uuid.uuid4())
-        created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        class_ = self.marks_class_entry.get().strip()
         
-        c.execute("INSERT INTO report_cards (report_id, student_id, subject, marks, created_at) VALUES (?, ?, ?, ?, ?)",
-                  (report_id, student_id, subject, marks, created_at))
-        conn.commit()
-        conn.close()
+        def done(result):
+            log_action(f"Saved {len(entries)} marks for class: {class_}", self.current_user)
+            messagebox.showinfo("Success", f"{len(entries)} marks saved")
         
-        log_action(f"Added report card for student: {student_id}", self.current_user)
-        messagebox.showinfo("Success", "Report card entry added")
-        self.show_main_menu()
+        self.run_task(lambda: save_class_marks(self.db, entries), done)
 
-    def show_search_students(self):
-        self.clear_screen()
-        
-        tk.Label(self.root, text="Search Students", font=("Arial", 16)).pack(pady=20)
-        
-        tk.Label(self.root, text="Search by Name or Class").pack()
-        self.search_entry = tk.Entry(self.root)
-        self.search_entry.pack(pady=5)
+    def generate_class_report_cards(self):
+        class_ = self.marks_class_entry.get().strip()
+        if not class_:
+            messagebox.showerror("Error", "Class is required")
+            return
+        output = filedialog.asksaveasfilename(defaultextension=".zip", initialfile=f"report_cards_{class_}.zip",
+                                              filetypes=[("ZIP archives", "*.zip")])
+        if not output:
+            return
         
-        tk.Button(self.root, text="Search", command=self.perform_search, font=("Arial", 12)).pack(pady=10)
-        tk.Button(self.root, text="Back", command=self.go_back_to_main_menu, font=("Arial", 12)).pack(pady=5)
+        def done(count):
+            log_action(f"Generated {count} report cards for class: {class_}", self.current_user)
+            messagebox.showinfo("Success", f"{count} report cards generated")
         
-        self.tree = ttk.Treeview(self.root, columns=("ID", "Name", "Class", "Hostel", "Bus"), show="headings")
-        self.tree.heading("ID", text="Student ID")
-        self.tree.heading("Name", text="Name")
-        self.tree.heading("Class", text="Class")
-        self.tree.heading("Hostel", text="Hostel")
-        self.tree.heading("Bus", text="Bus")
-        self.tree.pack(pady=10, fill="both", expand=True)
+        self.run_with_progress_dialog(
+            "Generating report cards",
+            lambda report: generate_report_cards(self.db, class_, output, report),
+            done, "Report card generation failed")
 
-    def perform_search(self):
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+    def show_search_students(self):
+        self.show_screen("search_students")
+
+    def build_search_students(self, frame):
+        tk.Label(frame, text="Search Students", font=("Arial", 16)).pack(pady=20)
         
+        tk.Label(frame, text="Search by Name or Class").pack()
+        self.search_entry = tk.Entry(frame)
+        self.search_entry.pack(pady=5)
+        self.search_entry.bind("<KeyRelease>", self.schedule_search)
+        self.search_entry.bind("<Return>", lambda event: self.perform_search())
+        
+        tk.Button(frame, text="Search", command=self.perform_search, font=("Arial", 12)).pack(pady=10)
+        tk.Button(frame, text="Back", command=self.go_back_to_main_menu, font=("Arial", 12)).pack(pady=5)
+        
+        self.search_list = VirtualTreeview(frame, self.db, ("ID", "Name", "Class", "Hostel", "Bus"),
+                                           ("Student ID", "Name", "Class", "Hostel", "Bus"),
+                                           empty_text="No matching students")
+        self.search_list.pack(pady=10, fill="both", expand=True)
+        self.tree = self.search_list.tree
+        self.search_after_id = None
+
+    def refresh_search_students(self):
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+            self.search_after_id = None
+        self.search_list.clear()
+        self.search_entry.focus_set()
+
+    def schedule_search(self, event=None):
+        # Debounce keystrokes: only the last one in SEARCH_DEBOUNCE_MS runs a query.
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+        self.search_after_id = self.root.after(SEARCH_DEBOUNCE_MS, self.start_search)
+
+    def start_search(self):
+        self.search_after_id = None
         search_term = self.search_entry.get().strip()
-        
-        conn = sqlite3.connect('school_management.db')
-        c = conn.cursor()
-        query = "SELECT * FROM students WHERE name LIKE ? OR class LIKE ?"
-        c.execute(query, (f"%{search_term}%", f"%{search_term}%"))
-        students = c.fetchall()
-        conn.close()
-        
-        for student in students:
-            self.tree.insert("", "end", values=(student[0], student[1], student[2], student[3], student[4]))
-        
+        self.search_list.set_query(student_search_query(search_term, student_search_enabled(self.db)))
+        return search_term
+
+    def perform_search(self):
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+        search_term = self.start_search()
         log_action(f"Searched students with term: {search_term}", self.current_user)
 
     def show_no_dues(self):
-        self.clear_screen()
-        
-        tk.Label(self.root, text="Generate No Dues Document", font=("Arial", 16)).pack(pady=20)
+        self.show_screen("no_dues")
+
+    def build_no_dues(self, frame):
+        tk.Label(frame, text="Generate No Dues Document", font=("Arial", 16)).pack(pady=20)
         
-        tk.Label(self.root, text="Student ID").pack()
-        self.no_dues_student_id_entry = tk.Entry(self.root)
+        tk.Label(frame, text="Student ID").pack()
+        self.no_dues_student_id_entry = tk.Entry(frame)
         self.no_dues_student_id_entry.pack(pady=5)
         
-        tk.Button(self.root, text="Generate", command=self.generate_no_dues, font=("Arial", 12)).pack(pady=20)
-        tk.Button(self.root, text="Back", command=self.go_back_to_main_menu, font=("Arial", 12)).pack(pady=5)
+        tk.Button(frame, text="Generate", command=self.generate_no_dues, font=("Arial", 12)).pack(pady=20)
+        
+        tk.Label(frame, text="Batch for Class (leave blank for whole school)").pack()
+        self.no_dues_class_entry = tk.Entry(frame)
+        self.no_dues_class_entry.pack(pady=5)
+        self.no_dues_zip = tk.BooleanVar(value=True)
+        tk.Checkbutton(frame, text="Save as ZIP archive", variable=self.no_dues_zip).pack(pady=5)
+        tk.Button(frame, text="Generate Batch", command=self.generate_no_dues_batch, font=("Arial", 12)).pack(pady=10)
+        
+        tk.Button(frame, text="Back", command=self.go_back_to_main_menu, font=("Arial", 12)).pack(pady=5)
+
+    def refresh_no_dues(self):
+        self.no_dues_zip.set(True)
 
     def generate_no_dues(self):
         student_id = self.no_dues_student_id_entry.get()
@@ -735,121 +4367,1050 @@ class SchoolManagementSystem:
             messagebox.showerror("Error", "Student ID is required")
             return
         
-        conn = sqlite3.connect('school_management.db')
-        c = conn.cursor()
-        c.execute("SELECT * FROM students WHERE student_id=?", (student_id,))
-        student = c.fetchone()
+        def checked(no_dues_content):
+            file_path = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("Text files", "*.txt")])
+            if file_path:
+                with open(file_path, 'w') as f:
+                    f.write(no_dues_content)
+                log_action(f"Generated no dues for student: {student_id}", self.current_user)
+                messagebox.showinfo("Success", "No dues document generated")
+            
+            self.show_main_menu()
         
-        if not student:
-            messagebox.showerror("Error", "Student not found")
-            conn.close()
+        self.run_read(lambda conn: no_dues_document(conn, student_id), checked)
+
+    def generate_no_dues_batch(self):
+        class_ = self.no_dues_class_entry.get().strip() or None
+        if self.no_dues_zip.get():
+            output = filedialog.asksaveasfilename(defaultextension=".zip", filetypes=[("ZIP archives", "*.zip")])
+        else:
+            output = filedialog.askdirectory(title="Choose output folder")
+        if not output:
             return
         
-        c.execute("SELECT SUM(amount) FROM fee_transactions WHERE student_id=?", (student_id,))
-        total_paid = c.fetchone()[0] or 0
-        has_dues = total_paid < 10000
+        def done(result):
+            scope = class_ or "all classes"
+            log_action(f"Generated {result['issued']} no dues certificates for {scope}", self.current_user)
+            messagebox.showinfo("Success", f"{result['issued']} certificates generated, "
+                                           f"{result['skipped']} students skipped for pending dues.\n"
+                                           "See manifest.csv for details.")
+        
+        self.run_with_progress_dialog(
+            "Generating certificates",
+            lambda report: generate_no_dues_batch(self.db, output, class_, report),
+            done, "Batch generation failed")
+
+    def show_outstanding_dues(self):
+        self.show_screen("outstanding_dues")
+
+    def build_outstanding_dues(self, frame):
+        tk.Label(frame, text="Students With Dues", font=("Arial", 16)).pack(pady=20)
         
-        conn.close()
+        tk.Label(frame, text="Class (optional)").pack()
+        self.dues_class_entry = tk.Entry(frame)
+        self.dues_class_entry.pack(pady=5)
+        self.dues_class_entry.bind("<Return>", lambda event: self.load_outstanding_dues())
         
-        if has_dues:
-            messagebox.showerror("Error", "Student has pending dues")
-            return
+        tk.Button(frame, text="Show", command=self.load_outstanding_dues, font=("Arial", 12)).pack(pady=10)
+        tk.Button(frame, text="Back", command=self.go_back_to_main_menu, font=("Arial", 12)).pack(pady=5)
         
-        no_dues_content = (
-            f"No Dues Certificate\n"
-            f"Student ID: {student_id}\n"
-            f"Name: {student[1]}\n"
-            f"Date: {datetime.now().strftime('%Y-%m-%d')}\n"
-            "This certifies that the student has no pending dues."
-        )
+        self.dues_list = VirtualTreeview(frame, self.db, ("ID", "Name", "Class", "Fee Type", "Due"),
+                                         ("Student ID", "Name", "Class", "Fee Type", "Amount Due"),
+                                         empty_text="No outstanding dues")
+        self.dues_list.pack(pady=10, fill="both", expand=True)
+
+    def refresh_outstanding_dues(self):
+        self.load_outstanding_dues()
+
+    def load_outstanding_dues(self):
+        self.dues_list.set_query(outstanding_dues_query(self.dues_class_entry.get().strip()))
+
+    def show_fee_settings(self):
+        self.show_screen("fee_settings")
+
+    def build_fee_settings(self, frame):
+        tk.Label(frame, text="Fee Settings", font=("Arial", 16)).pack(pady=20)
         
-        file_path = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("Text files", "*.txt")])
-        if file_path:
-            with open(file_path, 'w') as f:
-                f.write(no_dues_content)
-            log_action(f"Generated no dues for student: {student_id}", self.current_user)
-            messagebox.showinfo("Success", "No dues document generated")
+        tk.Label(frame, text="Class").pack()
+        self.fee_class_entry = tk.Entry(frame)
+        self.fee_class_entry.pack(pady=5)
+        
+        tk.Label(frame, text="Class Fee").pack()
+        self.class_fee_entry = tk.Entry(frame)
+        self.class_fee_entry.pack(pady=5)
+        
+        tk.Button(frame, text="Save Class Fee", command=self.save_class_fee, font=("Arial", 12)).pack(pady=10)
         
-        self.show_main_menu()
+        self.service_fee_entries = {}
+        for fee_type in ("Hostel", "Bus"):
+            tk.Label(frame, text=f"{fee_type} Fee").pack()
+            entry = tk.Entry(frame)
+            entry.pack(pady=5)
+            self.service_fee_entries[fee_type] = entry
+        
+        tk.Button(frame, text="Save Hostel/Bus Fees", command=self.save_service_fees, font=("Arial", 12)).pack(pady=10)
+        tk.Button(frame, text="Back", command=self.go_back_to_main_menu, font=("Arial", 12)).pack(pady=5)
+        
+        self.class_fee_list = VirtualTreeview(frame, self.db, ("Class", "Fee"), ("Class", "Fee"),
+                                              empty_text="No class fees set")
+        self.class_fee_list.pack(pady=10, fill="both", expand=True)
 
-    def show_change_password(self):
-        self.clear_screen()
+    def refresh_fee_settings(self):
+        self.run_task(lambda: service_fees(self.db), self.show_service_fees, write=False)
+        self.class_fee_list.set_query(class_fees_query())
+
+    def show_service_fees(self, fees):
+        for fee_type, entry in self.service_fee_entries.items():
+            entry.delete(0, "end")
+            entry.insert(0, f"{fees.get(fee_type, 0):g}")
+
+    def parse_fee_amount(self, amount):
+        try:
+            amount = float(amount)
+            if amount < 0:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("Error", "Invalid amount")
+            return None
+        return amount
+
+    def save_class_fee(self):
+        class_ = self.fee_class_entry.get().strip()
+        if not class_:
+            messagebox.showerror("Error", "Class is required")
+            return
+        amount = self.parse_fee_amount(self.class_fee_entry.get())
+        if amount is None:
+            return
+        
+        def done(result):
+            log_action(f"Set fee for {class_}: {amount:g}", self.current_user)
+            messagebox.showinfo("Success", f"Fee for {class_} saved")
+            self.class_fee_list.set_query(class_fees_query())
         
-        tk.Label(self.root, text="Change Password", font=("Arial", 16)).pack(pady=20)
+        self.run_task(lambda: set_class_fee(self.db, class_, amount), done)
+
+    def save_service_fees(self):
+        amounts = {}
+        for fee_type, entry in self.service_fee_entries.items():
+            amounts[fee_type] = self.parse_fee_amount(entry.get())
+            if amounts[fee_type] is None:
+                return
+        
+        def work():
+            with self.db.transaction():
+                for fee_type, amount in amounts.items():
+                    set_service_fee(self.db, fee_type, amount)
+        
+        def done(result):
+            log_action("Set hostel and bus fees: " + ", ".join(f"{fee_type} {amount:g}" for fee_type, amount in amounts.items()),
+                       self.current_user)
+            messagebox.showinfo("Success", "Hostel and bus fees saved")
+        
+        self.run_task(work, done)
+
+    def show_change_password(self):
+        self.show_screen("change_password")
+
+    def build_change_password(self, frame):
+        tk.Label(frame, text="Change Password", font=("Arial", 16)).pack(pady=20)
         
-        tk.Label(self.root, text="Current Password").pack()
-        self.current_password_entry = tk.Entry(self.root, show="*")
+        tk.Label(frame, text="Current Password").pack()
+        self.current_password_entry = tk.Entry(frame, show="*")
         self.current_password_entry.pack(pady=5)
         
-        tk.Label(self.root, text="New Password").pack()
-        self.new_password_entry = tk.Entry(self.root, show="*")
+        tk.Label(frame, text="New Password").pack()
+        self.new_password_entry = tk.Entry(frame, show="*")
         self.new_password_entry.pack(pady=5)
         
-        tk.Label(self.root, text="Confirm New Password").pack()
-        self.confirm_password_entry = tk.Entry(self.root, show="*")
+        tk.Label(frame, text="Confirm New Password").pack()
+        self.confirm_password_entry = tk.Entry(frame, show="*")
         self.confirm_password_entry.pack(pady=5)
         
-        tk.Button(self.root, text="Change Password", command=self.change_password, font=("Arial", 12)).pack(pady=20)
-        tk.Button(self.root, text="Back", command=self.go_back_to_main_menu, font=("Arial", 12)).pack(pady=5)
+        tk.Button(frame, text="Change Password", command=self.change_password, font=("Arial", 12)).pack(pady=20)
+        self.change_password_back = tk.Button(frame, text="Back", command=self.go_back_to_main_menu, font=("Arial", 12))
+        self.change_password_logout = tk.Button(frame, text="Logout", command=self.confirm_logout, font=("Arial", 12))
+
+    def refresh_change_password(self):
+        self.change_password_back.pack_forget()
+        self.change_password_logout.pack_forget()
+        if self.password_change_required:
+            self.change_password_logout.pack(pady=5)
+        else:
+            self.change_password_back.pack(pady=5)
 
     def change_password(self):
-        current_password = self.current_password_entry.get()
-        new_password = self.new_password_entry.get()
-        confirm_password = self.confirm_password_entry.get()
+        row = {'current_password': self.current_password_entry.get(), 'new_password': self.new_password_entry.get(),
+               'confirm_password': self.confirm_password_entry.get()}
+        
+        def done(result):
+            self.password_change_required = False
+            messagebox.showinfo("Success", "Password changed successfully")
+            self.go_back_to_main_menu()
+        
+        self.run_task(lambda: change_password(self.db, row, self.current_user), done)
+
+    def show_progress_dialog(self, title):
+        dialog = tk.Toplevel(self.root)
+        dialog.title(title)
+        dialog.transient(self.root)
+        tk.Label(dialog, text=f"{title}...", font=("Arial", 12)).pack(padx=20, pady=10)
+        bar = ttk.Progressbar(dialog, length=300, maximum=100)
+        bar.pack(padx=20, pady=10)
+        return dialog, bar
+
+    def run_with_progress_dialog(self, title, work, on_done, error_prefix):
+        dialog, bar = self.show_progress_dialog(title)
         
-        if not all([current_password, new_password, confirm_password]):
-            messagebox.showerror("Error", "All fields are required")
+        def progress(done, total):
+            if bar.winfo_exists():
+                bar["value"] = done * 100 / total if total else 100
+        
+        def done(result):
+            dialog.destroy()
+            on_done(result)
+        
+        def failed(error):
+            dialog.destroy()
+            messagebox.showerror("Error", f"{error_prefix}: {error}")
+        
+        self.run_in_background(work, progress, done, failed)
+
+    def backup_database(self):
+        file_path = filedialog.asksaveasfilename(defaultextension=".db",
+                                                 filetypes=[("Database files", "*.db"), ("Compressed backups", "*.gz")])
+        if not file_path:
             return
         
-        if new_password != confirm_password:
-            messagebox.showerror("Error", "New passwords do not match")
+        def done(result):
+            log_action("Database backed up", self.current_user)
+            messagebox.showinfo("Success", "Database backed up successfully")
+        
+        self.run_with_progress_dialog(
+            "Backing up database",
+            lambda report: backup_to_file(self.db, file_path, file_path.endswith('.gz'), report),
+            done, "Backup failed")
+
+    def restore_database(self):
+        file_path = filedialog.askopenfilename(filetypes=[("Database files", "*.db"), ("Compressed backups", "*.gz")])
+        if not file_path:
+            return
+        if not messagebox.askyesno("Confirm Restore", "Replace all current data with this backup?"):
             return
         
-        conn = sqlite3.connect('school_management.db')
-        c = conn.cursor()
-        c.execute("SELECT * FROM users WHERE username=? AND password=?", (self.current_user, current_password))
-        user = c.fetchone()
+        def done(result):
+            log_action("Database restored", self.current_user)
+            messagebox.showinfo("Success", "Database restored successfully")
+            self.show_main_menu()
         
-        if not user:
-            messagebox.showerror("Error", "Current password is incorrect")
-            conn.close()
+        self.run_with_progress_dialog(
+            "Restoring database",
+            lambda report: restore_from_file(self.db, file_path, report),
+            done, "Restore failed")
+
+    def show_snapshots(self):
+        self.show_screen("snapshots")
+
+    def build_snapshots(self, frame):
+        tk.Label(frame, text="Restore Snapshot", font=("Arial", 16)).pack(pady=20)
+        
+        self.snapshot_tree = ttk.Treeview(frame, columns=("Created", "Type", "Size", "New Data"), show="headings")
+        for column in ("Created", "Type", "Size", "New Data"):
+            self.snapshot_tree.heading(column, text=column)
+        self.snapshot_tree.pack(pady=10, fill="both", expand=True)
+        self.snapshot_error_label = tk.Label(frame, fg="red")
+        
+        self.snapshot_restore_button = tk.Button(frame, text="Restore Selected", command=self.restore_snapshot,
+                                                 font=("Arial", 12))
+        self.snapshot_restore_button.pack(pady=10)
+        tk.Button(frame, text="Back", command=self.go_back_to_main_menu, font=("Arial", 12)).pack(pady=5)
+
+    def refresh_snapshots(self):
+        self.snapshot_tree.delete(*self.snapshot_tree.get_children())
+        for snapshot in self.snapshots.snapshots():
+            self.snapshot_tree.insert("", "end", iid=snapshot['id'], values=(
+                snapshot['created'], snapshot['tier'].capitalize(), f"{snapshot['size'] / 1048576:.1f} MB",
+                f"{snapshot['new_chunks']} of {len(snapshot['chunks'])} chunks"))
+        
+        error = self.snapshot_scheduler.last_error
+        if error is not None:
+            self.snapshot_error_label.config(text=f"Last snapshot failed: {error}")
+            self.snapshot_error_label.pack(before=self.snapshot_restore_button, pady=5)
+        else:
+            self.snapshot_error_label.pack_forget()
+
+    def restore_snapshot(self):
+        selection = self.snapshot_tree.selection()
+        if not selection:
+            messagebox.showerror("Error", "Select a snapshot to restore")
+            return
+        snapshot_id = selection[0]
+        if not messagebox.askyesno("Confirm Restore", f"Replace all current data with snapshot {snapshot_id}?"):
             return
         
-        c.execute("UPDATE users SET password=? WHERE username=?", (new_password, self.current_user))
-        conn.commit()
-        conn.close()
+        def done(result):
+            log_action(f"Database restored from snapshot {snapshot_id}", self.current_user)
+            messagebox.showinfo("Success", "Database restored successfully")
+            self.show_main_menu()
         
-        log_action("Changed password", self.current_user)
-        messagebox.showinfo("Success", "Password changed successfully")
-        self.show_main_menu()
+        self.run_with_progress_dialog(
+            "Restoring snapshot",
+            lambda report: self.snapshots.restore(self.db, snapshot_id, report),
+            done, "Restore failed")
 
-    def backup_database(self):
-        file_path = filedialog.asksaveasfilename(defaultextension=".db", filetypes=[("Database files", "*.db")])
-        if file_path:
-            try:
-                shutil.copyfile('school_management.db', file_path)
-                log_action("Database backed up", self.current_user)
-                messagebox.showinfo("Success", "Database backed up successfully")
-            except Exception as e:
-                messagebox.showerror("Error", f"Backup failed: {str(e)}")
-        self.show_main_menu()
+    # Task helpers
+    # Handlers validate input on the Tk thread and hand their database work
+    # to run_task. While a write is in flight the current screen's buttons
+    # are disabled, so a double click can't submit it twice.
+    def run_task(self, work, on_done, write=True):
+        disabled = []
+        if write:
+            disabled = [button for button in self.screen_buttons(self.current_screen)
+                        if str(button["state"]) == "normal"]
+            for button in disabled:
+                button.config(state="disabled")
+        self.set_busy(1)
+        
+        def finish():
+            self.set_busy(-1)
+            for button in disabled:
+                if button.winfo_exists():
+                    button.config(state="normal")
+        
+        def done(result):
+            finish()
+            on_done(result)
+        
+        def failed(error):
+            finish()
+            messagebox.showerror("Error", str(error))
+        
+        self.tasks.submit(work, done, failed, write)
+        if not self.polling_tasks:
+            self.polling_tasks = True
+            self.root.after(TASK_POLL_MS, self.poll_tasks)
 
-    def restore_database(self):
-        file_path = filedialog.askopenfilename(filetypes=[("Database files", "*.db")])
-        if file_path:
-            try:
-                shutil.copyfile(file_path, 'school_management.db')
-                log_action("Database restored", self.current_user)
-                messagebox.showinfo("Success", "Database restored successfully")
-            except Exception as e:
-                messagebox.showerror("Error", f"Restore failed: {str(e)}")
-        self.show_main_menu()
+    def run_read(self, query, on_done):
+        # query(conn) runs on a pooled reader connection.
+        def work():
+            with self.db.reader() as conn:
+                return query(conn)
+        self.run_task(work, on_done, write=False)
 
-    def clear_screen(self):
-        for widget in self.root.winfo_children():
-            widget.destroy()
+    def poll_tasks(self):
+        self.tasks.poll()
+        if self.tasks.pending():
+            self.root.after(TASK_POLL_MS, self.poll_tasks)
+        else:
+            self.polling_tasks = False
+
+    def set_busy(self, change):
+        self.busy_tasks += change
+        busy = self.busy_tasks > 0
+        self.busy_label.config(text="Working..." if busy else "")
+        self.root.config(cursor="watch" if busy else "")
+
+    def screen_buttons(self, widget):
+        if widget is None:
+            return []
+        buttons = []
+        for child in widget.winfo_children():
+            if isinstance(child, (tk.Button, ttk.Button)):
+                buttons.append(child)
+            buttons.extend(self.screen_buttons(child))
+        return buttons
+
+    # Screen cache
+    # Each screen is built once into its own frame by build_<name> and kept.
+    # Showing it again hides the current frame, clears the new one's input
+    # fields and calls refresh_<name> (if defined) to reload its data.
+    # Time-to-interactive of every switch is recorded in screen_timings.
+    def show_screen(self, name):
+        start = time.perf_counter()
+        frame = self.screens.get(name)
+        built = frame is None
+        if built:
+            frame = tk.Frame(self.root)
+            getattr(self, f"build_{name}")(frame)
+            self.screens[name] = frame
+        else:
+            self.reset_fields(frame)
+        refresh = getattr(self, f"refresh_{name}", None)
+        if refresh:
+            refresh()
+        if self.current_screen is not frame:
+            if self.current_screen is not None:
+                self.current_screen.pack_forget()
+            frame.pack(fill="both", expand=True)
+            self.current_screen = frame
+        self.root.update_idletasks()
+        elapsed = (time.perf_counter() - start) * 1000
+        self.screen_timings[name].append((built, elapsed))
+        return frame
+
+    def reset_fields(self, widget):
+        for child in widget.winfo_children():
+            if isinstance(child, ttk.Combobox):
+                if child["values"]:
+                    child.current(0)
+            elif isinstance(child, (tk.Entry, ttk.Entry)):
+                child.delete(0, "end")
+            elif isinstance(child, tk.Listbox):
+                child.delete(0, "end")
+            elif isinstance(child, ttk.Treeview):
+                child.selection_remove(child.selection())
+            self.reset_fields(child)
+
+    def screen_timing_report(self):
+        lines = [f"{'screen':<20} {'build ms':>9} {'switches':>9} {'median ms':>10}"]
+        for name, timings in sorted(self.screen_timings.items()):
+            builds = [elapsed for built, elapsed in timings if built]
+            switches = sorted(elapsed for built, elapsed in timings if not built)
+            median = switches[len(switches) // 2] if switches else 0.0
+            lines.append(f"{name:<20} {(builds[0] if builds else 0.0):>9.1f} {len(switches):>9} {median:>10.1f}")
+        return "\n".join(lines)
+
+# Benchmarks
+# Run with: python "SMS2025(2).py" --bench <name> [--rows N]
+BENCH_CLASSES = [f"Class {n}" for n in range(1, 13)]
+BENCH_FIRST_NAMES = ["Aarav", "Diya", "Ishaan", "Ananya", "Rohan", "Meera", "Kabir", "Saanvi", "Arjun", "Priya"]
+BENCH_LAST_NAMES = ["Sharma", "Kar", "Patel", "Das", "Iyer", "Singh", "Mehta", "Nair", "Roy", "Gupta"]
+
+LEGACY_PAYMENT_INSERT_SQL = ("INSERT INTO fee_transactions (transaction_id, student_id, fee_type, amount, payment_date) "
+                             "VALUES (?, ?, ?, ?, ?)")
+
+def seed_database(db, students=1000, payments_per_student=2, seed=42, legacy=False):
+    # legacy=True writes users and payments the way schema version 0 did:
+    # passwords in plaintext, payments keyed by the student's UUID.
+    payment_sql = LEGACY_PAYMENT_INSERT_SQL if legacy else PAYMENT_INSERT_SQL
+    rng = random.Random(seed)
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    student_ids = []
+    with db.transaction() as c:
+        for i in range(students):
+            student_id = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+            student_ids.append(student_id)
+            name = f"{rng.choice(BENCH_FIRST_NAMES)} {rng.choice(BENCH_LAST_NAMES)}"
+            c.execute("INSERT INTO students (student_id, name, class, hostel_status, bus_status, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                      (student_id, name, rng.choice(BENCH_CLASSES), rng.choice(["Yes", "No"]),
+                       rng.choice(["Yes", "No"]), now))
+            if legacy:
+                c.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
+                          (f"student{student_id[:8]}", initial_password(student_id), 'student'))
+            else:
+                # As an upgraded database holds them; full-cost hashes would
+                # take minutes to seed.
+                c.execute("INSERT INTO users (username, password, role, student_id, must_change_password) "
+                          "VALUES (?, ?, ?, ?, 1)",
+                          (f"student{student_id[:8]}",
+                           hash_password(initial_password(student_id), LEGACY_PASSWORD_ITERATIONS),
+                           'student', student_id))
+            for _ in range(payments_per_student):
+                c.execute(payment_sql, (str(uuid.uuid4()), student_id, "Class", 2500.0, now))
+    return student_ids
+
+def create_bench_db(path, students, payments_per_student=2):
+    db = Database(path)
+    init_db(db)
+    student_ids = seed_database(db, students, payments_per_student)
+    return db, student_ids
+
+def create_legacy_bench_db(path, students):
+    # The database as the original application kept it: the schema
+    # init_schema creates, with nothing added since, in rollback-journal
+    # mode. Seeded with the same students as create_bench_db.
+    db = Database(path)
+    with db.transaction() as c:
+        init_schema(c)
+    seed_database(db, students, legacy=True)
+    db.close()
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.close()
+
+def median_ms(fn, repeat=7):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+def ops_per_sec(fn, ops):
+    start = time.perf_counter()
+    for i in range(ops):
+        fn(i)
+    return ops / (time.perf_counter() - start)
+
+def bench_connections(rows):
+    # Replays the save_fee_payment + log_action pattern: one lookup, one
+    # insert and one audit row per operation.
+    ops = 1000
+    with tempfile.TemporaryDirectory() as tmp:
+        pooled_path = os.path.join(tmp, 'pooled.db')
+        legacy_path = os.path.join(tmp, 'legacy.db')
+        db, student_ids = create_bench_db(pooled_path, rows)
+        create_legacy_bench_db(legacy_path, rows)
+
+        def legacy_op(i):
+            student_id = student_ids[i % len(student_ids)]
+            conn = sqlite3.connect(legacy_path)
+            c = conn.cursor()
+            c.execute("SELECT * FROM students WHERE student_id=?", (student_id,))
+            c.fetchone()
+            c.execute("INSERT INTO fee_transactions (transaction_id, student_id, fee_type, amount, payment_date) VALUES (?, ?, ?, ?, ?)",
+                      (str(uuid.uuid4()), student_id, "Class", 100.0, "2025-01-01 00:00:00"))
+            conn.commit()
+            conn.close()
+            conn = sqlite3.connect(legacy_path)
+            conn.execute("INSERT INTO system_logs (log_id, action, username, timestamp) VALUES (?, ?, ?, ?)",
+                         (str(uuid.uuid4()), "bench", "admin", "2025-01-01 00:00:00"))
+            conn.commit()
+            conn.close()
+
+        def pooled_op(i):
+            student_id = student_ids[i % len(student_ids)]
+            db.fetchone("SELECT * FROM students WHERE student_id=?", (student_id,))
+            with db.transaction() as c:
+                c.execute(PAYMENT_INSERT_SQL,
+                          (str(uuid.uuid4()), student_id, "Class", 100.0, "2025-01-01 00:00:00"))
+            with db.transaction() as c:
+                c.execute("INSERT INTO system_logs (log_id, action, username, timestamp) VALUES (?, ?, ?, ?)",
+                          (str(uuid.uuid4()), "bench", "admin", "2025-01-01 00:00:00"))
+
+        legacy = ops_per_sec(legacy_op, ops)
+        pooled = ops_per_sec(pooled_op, ops)
+        db.close()
+    print(f"connect-per-operation: {legacy:10.1f} ops/sec")
+    print(f"shared connection:     {pooled:10.1f} ops/sec  ({pooled / legacy:.1f}x)")
+
+def bench_search(rows):
+    # Search latency for LIKE vs FTS5 at each size up to --rows
+    # (use --rows 1000000 for the full 10k/100k/1M sweep).
+    sizes = [n for n in (10000, 100000, 1000000) if n <= max(rows, 10000)]
+    terms = ["Meera", "Class 7", "sha", "Kabir Iyer", "Zubin"]
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db, _ = create_bench_db(os.path.join(tmp, 'search.db'), size, payments_per_student=0)
+            with db.transaction() as c:
+                c.execute("INSERT INTO students (student_id, name, class, hostel_status, bus_status, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                          (str(uuid.uuid4()), "Zubin Wadia", "Class 12", "No", "No", "2025-01-01 00:00:00"))
+            print(f"{size} students")
+            for term in terms:
+                like = median_ms(lambda: search_students(db.conn, term, use_fts=False))
+                fts = median_ms(lambda: search_students(db.conn, term, 100))
+                print(f"  {term!r:14} LIKE (all rows) {like:9.2f} ms   FTS5 (top 100) {fts:9.2f} ms")
+            db.close()
+
+def bench_import(rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        db, _ = create_bench_db(os.path.join(tmp, 'import.db'), 0)
+        path = os.path.join(tmp, 'students.csv')
+        rng = random.Random(7)
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["name", "class", "hostel", "bus"])
+            for _ in range(rows):
+                writer.writerow([f"{rng.choice(BENCH_FIRST_NAMES)} {rng.choice(BENCH_LAST_NAMES)}",
+                                 rng.choice(BENCH_CLASSES), rng.choice(["Yes", "No"]), rng.choice(["yes", "no"])])
+        start = time.perf_counter()
+        result = bulk_import(db, "Students", path, credentials_path=os.path.join(tmp, 'credentials.csv'))
+        elapsed = time.perf_counter() - start
+        db.close()
+    print(f"imported {result['imported']} students in {elapsed:.2f} s ({result['imported'] / elapsed:.0f} rows/sec), "
+          f"{result['failed']} failed")
+
+def bench_audit(rows):
+    # Throughput of a save_fee_payment-style action with no audit row, with
+    # the old synchronous log insert, and with the buffered audit log.
+    ops = 5000
+    with tempfile.TemporaryDirectory() as tmp:
+        db, student_ids = create_bench_db(os.path.join(tmp, 'audit.db'), rows)
+
+        def action(i):
+            with db.transaction() as c:
+                c.execute(PAYMENT_INSERT_SQL,
+                          (str(uuid.uuid4()), student_ids[i % len(student_ids)], "Class", 100.0, "2025-01-01 00:00:00"))
+
+        def sync_logged(i):
+            action(i)
+            with db.transaction() as c:
+                c.execute("INSERT INTO system_logs (log_id, action, username, timestamp) VALUES (?, ?, ?, ?)",
+                          (str(uuid.uuid4()), "Recorded payment", "admin", datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+
+        def timed_async(file_path=None):
+            audit_log = AuditLog(db, file_path)
+
+            def async_logged(i):
+                action(i)
+                audit_log.record("Recorded payment", "admin")
+
+            start = time.perf_counter()
+            for i in range(ops):
+                async_logged(i)
+            audit_log.close()
+            return ops / (time.perf_counter() - start)
+
+        results = [
+            ("logging off", ops_per_sec(action, ops)),
+            ("synchronous insert", ops_per_sec(sync_logged, ops)),
+            ("buffered, system_logs", timed_async()),
+            ("buffered, file sink", timed_async(os.path.join(tmp, 'audit.jsonl'))),
+        ]
+        db.close()
+    for label, rate in results:
+        print(f"{label:22} {rate:10.1f} actions/sec")
+
+def bench_payroll(rows):
+    # --rows is the number of employees.
+    with tempfile.TemporaryDirectory() as tmp:
+        db, _ = create_bench_db(os.path.join(tmp, 'payroll.db'), 0)
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with db.transaction() as c:
+            c.executemany("INSERT INTO employees (employee_id, name, designation, salary, created_at) VALUES (?, ?, ?, ?, ?)",
+                          [(str(uuid.uuid4()), f"Employee {i}", "Teacher", 30000.0 + i, now) for i in range(rows)])
+        start = time.perf_counter()
+        issued, _ = run_payroll(db, "2025-04")
+        first = time.perf_counter() - start
+        start = time.perf_counter()
+        reissued, existing = run_payroll(db, "2025-04")
+        second = time.perf_counter() - start
+        db.close()
+    print(f"payroll run: {issued} slips in {first * 1000:.1f} ms")
+    print(f"re-run:      {reissued} new, {existing} existing in {second * 1000:.1f} ms")
+
+def bench_dashboard(rows):
+    # Dashboard read from the summary tables vs. the same figures computed
+    # from the base tables.
+    with tempfile.TemporaryDirectory() as tmp:
+        db, _ = create_bench_db(os.path.join(tmp, 'dashboard.db'), rows)
+        summary_ms = median_ms(lambda: dashboard_summary(db))
+        
+        def ad_hoc():
+            with db.reader() as conn:
+                for _, query in DASHBOARD_AGGREGATES.values():
+                    conn.execute(query).fetchall()
+        
+        scan_ms = median_ms(ad_hoc)
+        verify_ms = median_ms(lambda: verify_dashboard(db), repeat=3)
+        db.close()
+    print(f"summary tables: {summary_ms:.2f} ms")
+    print(f"ad-hoc scans:   {scan_ms:.2f} ms")
+    print(f"verify:         {verify_ms:.2f} ms")
+
+def bench_hostel(rows):
+    # Roughly half the seeded students want a bed; rooms of four cover them
+    # with a few split into gender and class blocks.
+    with tempfile.TemporaryDirectory() as tmp:
+        db, _ = create_bench_db(os.path.join(tmp, 'hostel.db'), rows, 0)
+        with db.transaction() as c:
+            c.execute("UPDATE students SET gender = CASE WHEN rowid % 2 THEN 'M' ELSE 'F' END")
+        for i in range(rows // 8 + 1):
+            save_room(db, f"R{i:05d}", "A", 4, ("M", "F", None)[i % 3], BENCH_CLASSES[i % len(BENCH_CLASSES)] if i % 5 == 0 else None)
+        start = time.perf_counter()
+        allocations, unplaced = allocate_beds(db)
+        elapsed = time.perf_counter() - start
+        with db.reader() as conn:
+            lookup_ms = median_ms(lambda: next_free_room(conn, "F", BENCH_CLASSES[0]))
+            occupants_ms = median_ms(lambda: room_occupants(conn, "R00001"))
+        db.close()
+    print(f"allocated {len(allocations)} beds ({len(unplaced)} unplaced) in {elapsed * 1000:.1f} ms")
+    print(f"next free bed: {lookup_ms:.3f} ms, room occupants: {occupants_ms:.3f} ms")
+
+def bench_bus(rows):
+    # Every seeded bus student is given one of 50 stops; 40 routes of 45
+    # seats each serve five stops, overlapping with their neighbours.
+    with tempfile.TemporaryDirectory() as tmp:
+        db, _ = create_bench_db(os.path.join(tmp, 'bus.db'), rows, 0)
+        with db.transaction() as c:
+            c.execute("UPDATE students SET pickup_point = 'Stop ' || (rowid % 50)")
+        for i in range(40):
+            save_route(db, f"Route {i}", 45, [f"Stop {(i + k) % 50}" for k in range(5)])
+        start = time.perf_counter()
+        assignments, overflow = assign_bus_routes(db)
+        elapsed = time.perf_counter() - start
+        db.close()
+    print(f"assigned {len(assignments)} students ({len(overflow)} overflow) in {elapsed * 1000:.1f} ms")
+
+def bench_screens(rows):
+    # Navigates every admin screen the way the front desk does, main menu in
+    # between, and reports build time vs. cached switch time per screen.
+    # Needs a display.
+    with tempfile.TemporaryDirectory() as tmp:
+        db = open_db(os.path.join(tmp, 'screens.db'))
+        init_db(db)
+        seed_database(db, rows)
+        try:
+            root = tk.Tk()
+        except tk.TclError as e:
+            print(f"screens benchmark needs a display: {e}")
+            db.close()
+            return
+        root.withdraw()
+        app = SchoolManagementSystem(root)
+        app.current_user = 'admin'
+        app.current_role = 'admin'
+        screens = [name[len("build_"):] for name in dir(app)
+                   if name.startswith("build_") and name not in ("build_login_screen", "build_student_dashboard")]
+        for _ in range(20):
+            for name in screens:
+                getattr(app, f"show_{name}")()
+                app.show_main_menu()
+        print(app.screen_timing_report())
+        app.shutdown()
+        db.close()
+
+def bench_startup(rows):
+    # Database startup (connect + init_db) for a new database, a legacy one
+    # at schema version 0 holding --rows students, and a warm start on that
+    # database once upgraded, against the old unconditional DDL transaction.
+    with tempfile.TemporaryDirectory() as tmp:
+        def start(path):
+            begin = time.perf_counter()
+            db = Database(path)
+            init_db(db)
+            elapsed = (time.perf_counter() - begin) * 1000
+            db.close()
+            return elapsed
+        
+        new_ms = start(os.path.join(tmp, 'new.db'))
+        
+        legacy_path = os.path.join(tmp, 'legacy.db')
+        db = Database(legacy_path)
+        with db.transaction() as c:
+            init_schema(c)
+        seed_database(db, rows, legacy=True)
+        db.close()
+        upgrade_ms = start(legacy_path)
+        
+        warm_ms = median_ms(lambda: start(legacy_path))
+        
+        def always_ddl():
+            db = Database(legacy_path)
+            with db.transaction() as c:
+                init_schema(c)
+                migrate(c)
+            db.close()
+        
+        ddl_ms = median_ms(always_ddl)
+    print(f"new database:        {new_ms:.1f} ms")
+    print(f"legacy upgrade:      {upgrade_ms:.1f} ms ({rows} students)")
+    print(f"warm start:          {warm_ms:.2f} ms")
+    print(f"warm, DDL every run: {ddl_ms:.2f} ms")
+
+def load_test(address, credentials, student_ids, clients, requests_per_client, write_share=0.2, seed=0):
+    # Each client keeps one connection open and sends a front-desk mix:
+    # student lookups, with write_share of the requests being fee payments.
+    import base64
+    import http.client
+    headers = {"Authorization": "Basic " + base64.b64encode(":".join(credentials).encode()).decode(),
+               "Content-Type": "application/json"}
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+    
+    def client(n):
+        rng = random.Random(seed + n)
+        conn = http.client.HTTPConnection(*address)
+        timings = []
+        failed = 0
+        for _ in range(requests_per_client):
+            student_id = rng.choice(student_ids)
+            if rng.random() < write_share:
+                method, path = "POST", "/fee-payments"
+                body = json.dumps({"student_id": student_id, "fee_type": "Class", "amount": 100})
+            else:
+                method, path, body = "GET", f"/students/{student_id}", None
+            start = time.perf_counter()
+            conn.request(method, path, body, headers)
+            response = conn.getresponse()
+            response.read()
+            timings.append(time.perf_counter() - start)
+            failed += response.status != 200
+        conn.close()
+        with lock:
+            latencies.extend(timings)
+            failures.append(failed)
+    
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "failed": sum(failures),
+        "per_sec": len(latencies) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+    }
+
+def bench_api(rows):
+    # Serves a seeded database on a local port and load-tests it with an
+    # increasing number of concurrent clients.
+    with tempfile.TemporaryDirectory() as tmp:
+        db = open_db(os.path.join(tmp, 'api.db'))
+        init_db(db)
+        student_ids = seed_database(db, rows)
+        server = ApiServer(db, ('127.0.0.1', 0))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            for clients in (1, 4, 16):
+                result = load_test(server.address, ('admin', 'admin'), student_ids, clients, 2000 // clients)
+                print(f"{clients:2d} clients: {result['per_sec']:7.0f} req/s, p50 {result['p50_ms']:.2f} ms, "
+                      f"p99 {result['p99_ms']:.2f} ms, {result['failed']} failed of {result['requests']}")
+        finally:
+            server.shutdown()
+            close_audit_log()
+            db.close()
+
+def bench_group_commit(rows):
+    # Concurrent clients each record fee payments through the engine, with
+    # one commit per payment (max_ops=1) against group commit, under the
+    # shipped synchronous=NORMAL and under FULL, where every commit fsyncs.
+    import asyncio
+    
+    async def run(db, student_ids, clients, max_ops, payments=2000):
+        engine = GroupCommitEngine(db, max_ops=max_ops)
+        await engine.start()
+        
+        async def client(n):
+            rng = random.Random(n)
+            for _ in range(payments // clients):
+                row = {'student_id': rng.choice(student_ids), 'fee_type': 'Class', 'amount': '100'}
+                await engine.write(lambda: record_fee_payment(db, row, 'bench'))
+        
+        start = time.perf_counter()
+        await asyncio.gather(*(client(n) for n in range(clients)))
+        elapsed = time.perf_counter() - start
+        await engine.stop()
+        return engine.operations / elapsed, engine.operations / engine.batches
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        db = open_db(os.path.join(tmp, 'group_commit.db'))
+        init_db(db)
+        student_ids = seed_database(db, rows, 0)
+        for synchronous in ("NORMAL", "FULL"):
+            db.execute(f"PRAGMA synchronous={synchronous}")
+            print(f"synchronous={synchronous}")
+            for clients in (1, 4, 16, 64):
+                single, _ = asyncio.run(run(db, student_ids, clients, 1))
+                grouped, batch = asyncio.run(run(db, student_ids, clients, GROUP_COMMIT_MAX_OPS))
+                print(f"  {clients:2d} clients: {single:6.0f} payments/s one commit each, "
+                      f"{grouped:6.0f} payments/s grouped (avg batch {batch:.1f})")
+        close_audit_log()
+        db.close()
+
+def bench_login(rows):
+    # The old student lookup (student_id LIKE scan) against the users.student_id
+    # link, then 20 students who have chosen their own passwords logging in
+    # five times each, as on results day: the first login pays for one full
+    # PBKDF2 check and the rest are answered from the cache.
+    with tempfile.TemporaryDirectory() as tmp:
+        db = open_db(os.path.join(tmp, 'login.db'))
+        init_db(db)
+        student_ids = seed_database(db, rows, 0)
+        sample = student_ids[::max(1, len(student_ids) // 20)][:20]
+        with db.transaction() as c:
+            c.executemany("UPDATE users SET password=? WHERE student_id=?",
+                          [(hash_password(f"chosen-{student_id[:8]}"), student_id) for student_id in sample])
+        with db.reader() as conn:
+            like_ms = median_ms(lambda: [conn.execute("SELECT student_id FROM students WHERE student_id LIKE ?",
+                                                      (f"%{student_id[:8]}%",)).fetchone()
+                                         for student_id in sample]) / len(sample)
+            link_ms = median_ms(lambda: [conn.execute("SELECT password, student_id FROM users WHERE username=?",
+                                                      (f"student{student_id[:8]}",)).fetchone()
+                                         for student_id in sample]) / len(sample)
+        print(f"student lookup: LIKE scan {like_ms:.3f} ms, users.student_id {link_ms:.3f} ms ({rows} students)")
+        for attempt in range(1, 6):
+            start = time.perf_counter()
+            for student_id in sample:
+                authenticate(db, f"student{student_id[:8]}", f"chosen-{student_id[:8]}", 'student')
+            elapsed = (time.perf_counter() - start) * 1000 / len(sample)
+            print(f"login {attempt}: {elapsed:8.3f} ms per student")
+        print(f"cache: {credentials.hits} hits, {credentials.misses} misses")
+        close_audit_log()
+        db.close()
+
+def bench_student_dashboard(rows):
+    # Per-login cost of the old three dashboard queries, the consolidated
+    # query and a cache hit, then a results-day spike: five logins per
+    # student in random order through the cache.
+    with tempfile.TemporaryDirectory() as tmp:
+        db = open_db(os.path.join(tmp, 'student_dashboard.db'))
+        init_db(db)
+        student_ids = seed_database(db, rows, 0)
+        with db.transaction() as c:
+            c.executemany("INSERT OR REPLACE INTO fees (class, amount) VALUES (?, ?)",
+                          [(class_, 5000.0) for class_ in BENCH_CLASSES])
+        save_class_marks(db, [(student_id, subject, 40 + i % 60) for i, student_id in enumerate(student_ids)
+                              for subject in ("English", "Maths", "Science", "History", "Art")])
+        sample = student_ids[:1000]
+        
+        def three_queries(conn, student_id):
+            student = conn.execute("SELECT id, class FROM students WHERE student_id=?", (student_id,)).fetchone()
+            conn.execute("SELECT subject, marks FROM report_cards WHERE student=?", (student[0],)).fetchall()
+            conn.execute("SELECT amount FROM fees WHERE class=?", (student[1],)).fetchone()
+        
+        with db.reader() as conn:
+            old_ms = median_ms(lambda: [three_queries(conn, student_id) for student_id in sample]) / len(sample)
+            new_ms = median_ms(lambda: [student_dashboard(conn, student_id) for student_id in sample]) / len(sample)
+        for student_id in sample:
+            student_dashboards.get(db, student_id)
+        cached_ms = median_ms(lambda: [student_dashboards.get(db, student_id) for student_id in sample]) / len(sample)
+        print(f"three queries:      {old_ms:.4f} ms per login")
+        print(f"consolidated query: {new_ms:.4f} ms per login")
+        print(f"cache hit:          {cached_ms:.4f} ms per login")
+        
+        student_dashboards.invalidate()
+        hits, misses = student_dashboards.hits, student_dashboards.misses
+        logins = student_ids * 5
+        random.Random(3).shuffle(logins)
+        start = time.perf_counter()
+        for student_id in logins:
+            student_dashboards.get(db, student_id)
+        elapsed = time.perf_counter() - start
+        hits, misses = student_dashboards.hits - hits, student_dashboards.misses - misses
+        print(f"spike: {len(logins)} logins in {elapsed * 1000:.0f} ms, {hits / len(logins):.0%} served from memory")
+        close_audit_log()
+        db.close()
+
+BENCH_YEARS = range(2021, 2026)
+BENCH_SUBJECTS = ("English", "Maths", "Science", "History", "Art")
+
+def bench_integer_keys(rows):
+    # A school with --rows students and five years of history (ten monthly
+    # payments and five subjects a year each), on schema version 9 with UUID
+    # references and after migration_integer_keys: file size after VACUUM,
+    # the time to load one more year of payments, and the joins behind
+    # collections by class and a student's ledger and marks.
+    legacy_marks_sql = ("INSERT INTO report_cards (report_id, student_id, subject, marks, created_at) "
+                        "VALUES (?, ?, ?, ?, ?)")
+    
+    def payments(student_ids, year):
+        return [(str(uuid.uuid4()), student_id, "Class", 500.0, f"{year}-{month:02d}-05 10:00:00")
+                for month in range(1, 11) for student_id in student_ids]
+    
+    def load_year(db, sql, student_ids, year):
+        start = time.perf_counter()
+        with db.transaction() as c:
+            c.executemany(sql, payments(student_ids, year))
+        return rows * 10 / (time.perf_counter() - start)
+    
+    def size_mb(db):
+        db.execute("VACUUM")
+        return db.fetchone("PRAGMA page_count")[0] * db.fetchone("PRAGMA page_size")[0] / 1024 / 1024
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        before_path = os.path.join(tmp, 'uuid_keys.db')
+        after_path = os.path.join(tmp, 'integer_keys.db')
+        db = Database(before_path)
+        with db.transaction() as c:
+            init_schema(c)
+            for migration in MIGRATIONS[:-1]:
+                migration(c)
+            c.execute(f"PRAGMA user_version={len(MIGRATIONS) - 1}")
+        student_ids = seed_database(db, rows, 0)
+        for year in BENCH_YEARS:
+            load_year(db, LEGACY_PAYMENT_INSERT_SQL, student_ids, year)
+        with db.transaction() as c:
+            c.executemany(legacy_marks_sql, [(str(uuid.uuid4()), student_id, f"{subject} {year}", 40 + i % 60,
+                                              f"{year}-03-31 12:00:00")
+                                             for year in BENCH_YEARS for subject in BENCH_SUBJECTS
+                                             for i, student_id in enumerate(student_ids)])
+        db.close()
+        shutil.copyfile(before_path, after_path)
+        
+        before = Database(before_path)
+        after = Database(after_path)
+        start = time.perf_counter()
+        init_db(after)
+        migrate_ms = (time.perf_counter() - start) * 1000
+        
+        by_class = '''SELECT s.class, SUM(t.amount) FROM fee_transactions t
+                         JOIN students s ON s.{key} = t.{ref} GROUP BY s.class'''
+        ledger = '''SELECT t.payment_date, t.amount FROM students s
+                    JOIN fee_transactions t ON t.{ref} = s.{key} WHERE s.student_id = ?'''
+        marks = '''SELECT r.subject, r.marks FROM students s
+                   JOIN report_cards r ON r.{ref} = s.{key} WHERE s.student_id = ?'''
+        sample = student_ids[:1000]
+        results = {}
+        for name, db, key, ref, payment_sql in (("UUID keys", before, "student_id", "student_id", LEGACY_PAYMENT_INSERT_SQL),
+                                                ("integer keys", after, "id", "student", PAYMENT_INSERT_SQL)):
+            megabytes = size_mb(db)
+            per_sec = load_year(db, payment_sql, student_ids, BENCH_YEARS[-1] + 1)
+            with db.reader() as conn:
+                by_class_ms = median_ms(lambda: conn.execute(by_class.format(key=key, ref=ref)).fetchall(), 3)
+                student_ms = median_ms(lambda: [(conn.execute(ledger.format(key=key, ref=ref), (student_id,)).fetchall(),
+                                                 conn.execute(marks.format(key=key, ref=ref), (student_id,)).fetchall())
+                                                for student_id in sample], 3) / len(sample)
+            results[name] = (megabytes, per_sec, by_class_ms, student_ms)
+            db.close()
+    payments_total = rows * 10 * (len(BENCH_YEARS) + 1)
+    print(f"{rows} students, {payments_total} payments, {rows * len(BENCH_SUBJECTS) * len(BENCH_YEARS)} marks")
+    print(f"migration: {migrate_ms:.0f} ms")
+    for name, (megabytes, per_sec, by_class_ms, student_ms) in results.items():
+        print(f"{name + ':':14s}{megabytes:7.1f} MB, {per_sec:7.0f} payments/s, "
+              f"collections by class {by_class_ms:6.1f} ms, student ledger + marks {student_ms:.3f} ms")
+
+BENCHMARKS = {
+    "integer_keys": bench_integer_keys,
+    "student_dashboard": bench_student_dashboard,
+    "login": bench_login,
+    "group_commit": bench_group_commit,
+    "api": bench_api,
+    "audit": bench_audit,
+    "startup": bench_startup,
+    "screens": bench_screens,
+    "bus": bench_bus,
+    "hostel": bench_hostel,
+    "dashboard": bench_dashboard,
+    "payroll": bench_payroll,
+    "connections": bench_connections,
+    "import": bench_import,
+    "search": bench_search,
+}
 
 if __name__ == "__main__":
-    root = tk.Tk()
-    app = SchoolManagementSystem(root)
-    root.mainloop()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="School Management System")
+    parser.add_argument("--bench", choices=sorted(BENCHMARKS), help="run a benchmark instead of the UI")
+    parser.add_argument("--rows", type=int, default=10000, help="number of seeded students for --bench")
+    parser.add_argument("--audit-file", help="append audit entries to this JSONL file instead of system_logs")
+    parser.add_argument("--screen-timings", action="store_true",
+                        help="print time-to-interactive for each screen on exit")
+    parser.add_argument("--rebuild-aggregates", action="store_true",
+                        help="check the dashboard aggregates against the base tables and rebuild them")
+    parser.add_argument("--serve", metavar="[HOST:]PORT",
+                        help="serve the JSON API instead of the UI (HOST defaults to 127.0.0.1)")
+    args = parser.parse_args()
+    configure_audit_log(args.audit_file)
+    if args.bench:
+        BENCHMARKS[args.bench](args.rows)
+    elif args.rebuild_aggregates:
+        init_db()
+        for table, key, stored, expected in verify_dashboard(get_db()):
+            print(f"{table} [{key}]: stored {stored}, expected {expected}")
+        with get_db().transaction() as c:
+            rebuild_dashboard(c)
+        print("Dashboard aggregates rebuilt")
+    elif args.serve:
+        host, _, port = args.serve.rpartition(":")
+        init_db()
+        server = ApiServer(get_db(), (host or API_ADDRESS[0], int(port)))
+        print(f"Serving on http://{server.address[0]}:{server.address[1]}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.shutdown()
+    else:
+        root = tk.Tk()
+        app = SchoolManagementSystem(root)
+        root.mainloop()
+        if args.screen_timings:
+            print(app.screen_timing_report())
\ No newline at end of file
@@ -0,0 +1,914 @@
+import asyncio
+import base64
+import csv
+import gzip
+import http.client
+import importlib.util
+import json
+import os
+import sqlite3
+import threading
+import uuid
+import zipfile
+
+import pytest
+
+SMS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "SMS2025(2).py")
+spec = importlib.util.spec_from_file_location("sms", SMS_PATH)
+sms = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(sms)
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = sms.open_db(str(tmp_path / "school.db"))
+    yield db
+    sms.close_audit_log()
+    db.close()
+
+
+def test_nested_transaction_rolls_back_to_its_savepoint(db):
+    sms.init_db()
+    with db.transaction() as c:
+        c.execute("INSERT INTO fees (class, amount) VALUES ('Class 1', 100)")
+        with pytest.raises(sqlite3.IntegrityError):
+            with db.transaction() as inner:
+                inner.execute("INSERT INTO fees (class, amount) VALUES ('Class 2', 200)")
+                inner.execute("INSERT INTO fees (class, amount) VALUES ('Class 2', 300)")
+    assert db.fetchall("SELECT class, amount FROM fees WHERE class IN ('Class 1', 'Class 2')") == [("Class 1", 100.0)]
+
+
+def test_readers_see_committed_writes_only(db):
+    sms.init_db()
+    with db.transaction() as c:
+        c.execute("INSERT INTO fees (class, amount) VALUES ('Class 1', 100)")
+        with db.reader() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM fees WHERE class='Class 1'").fetchone()[0] == 0
+    with db.reader() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM fees WHERE class='Class 1'").fetchone()[0] == 1
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM fees")
+
+
+def legacy_database(db, students=50):
+    # A database as the original application left it: schema version 0,
+    # plaintext passwords, payments and marks keyed by the student UUID,
+    # including a fee type the ledger does not know.
+    with db.transaction() as c:
+        sms.init_schema(c)
+    student_ids = sms.seed_database(db, students, 2, legacy=True)
+    with db.transaction() as c:
+        c.execute("UPDATE students SET class='Class 11' WHERE student_id=?", (student_ids[0],))
+        c.execute(sms.LEGACY_PAYMENT_INSERT_SQL, (str(uuid.uuid4()), student_ids[0], "Tuition", 500.0,
+                                                  "2024-06-01 10:00:00"))
+        c.executemany("INSERT INTO report_cards (report_id, student_id, subject, marks, created_at) "
+                      "VALUES (?, ?, ?, ?, ?)",
+                      [(str(uuid.uuid4()), student_id, "Maths", 70, "2024-03-31 12:00:00")
+                       for student_id in student_ids])
+    return student_ids
+
+
+def test_upgrade_from_version_0(db):
+    student_ids = legacy_database(db)
+    paid = dict(db.fetchall("SELECT student_id, SUM(amount) FROM fee_transactions GROUP BY student_id"))
+    name, class_ = db.fetchone("SELECT name, class FROM students WHERE student_id=?", (student_ids[1],))
+
+    assert sms.init_db(db)
+    assert db.fetchone("PRAGMA user_version")[0] == sms.SCHEMA_VERSION
+    assert db.fetchall("PRAGMA integrity_check") == [("ok",)]
+    assert sms.verify_dashboard(db) == []
+    ledger = dict(db.fetchall('''SELECT s.student_id, SUM(b.amount_paid) FROM fee_balances b
+                                 JOIN students s ON s.id = b.student GROUP BY s.student_id'''))
+    assert ledger == pytest.approx(paid)
+    # 2 x 2500 plus the "Tuition" payment, all counted against the 6000 Class fee.
+    assert dict(sms.pending_dues(db, student_ids[0]))["Class"] == 500.0
+    plan = db.fetchall("EXPLAIN QUERY PLAN SELECT SUM(amount) FROM fee_transactions WHERE student=?", (1,))
+    assert "COVERING INDEX idx_fee_transactions_student" in plan[0][-1]
+
+    found = sms.search_students(db.conn, name, use_fts=sms.student_search_enabled(db))
+    assert student_ids[1] in [row[0] for row in found]
+    assert sms.student_dashboard(db.conn, student_ids[1]) == {
+        "class": class_, "tuition_fee": None, "results": [("Maths", 70)]}
+    assert not sms.init_db(db)
+    assert db.fetchone("PRAGMA user_version")[0] == sms.SCHEMA_VERSION
+
+
+def test_newer_schema_is_rejected(db):
+    sms.init_db(db)
+    db.execute("PRAGMA user_version=99")
+    with pytest.raises(RuntimeError, match="newer than this application"):
+        sms.init_db(db)
+
+
+def add_students(db, *rows):
+    with db.transaction() as c:
+        c.executemany("INSERT INTO students (student_id, name, class, hostel_status, bus_status, created_at) "
+                      "VALUES (?, ?, ?, 'No', 'No', '2025-04-01 09:00:00')", rows)
+
+
+def test_search_matches_prefixes_of_every_token(db):
+    sms.init_db(db)
+    add_students(db, ("s1", "Meera Sharma", "Class 10"), ("s2", "Meera Iyer", "Class 9"),
+                 ("s3", "O'Brien \"Ro\" Das", "Class 10"))
+    assert [row[0] for row in sms.search_students(db.conn, "mee sha")] == ["s1"]
+    assert sorted(row[0] for row in sms.search_students(db.conn, "meera")) == ["s1", "s2"]
+    assert [row[0] for row in sms.search_students(db.conn, "O'Brien \"Ro")] == ["s3"]
+    assert sms.search_students(db.conn, "AND OR NOT (") == []
+
+    with db.transaction() as c:
+        c.execute("UPDATE students SET name='Diya Sharma' WHERE student_id='s2'")
+        c.execute("DELETE FROM students WHERE student_id='s1'")
+    assert [row[0] for row in sms.search_students(db.conn, "sharma")] == ["s2"]
+
+
+def test_search_falls_back_to_like_without_the_index(db):
+    sms.init_db(db)
+    add_students(db, ("s1", "Meera Sharma", "Class 10"), ("s2", "Rohan Das", "Class 9"))
+    assert [row[0] for row in sms.search_students(db.conn, "eera", use_fts=False)] == ["s1"]
+    assert [row[0] for row in sms.search_students(db.conn, "Class 9", use_fts=False)] == ["s2"]
+
+
+def test_query_worker_posts_only_the_latest_query(db):
+    sms.init_db(db)
+    add_students(db, *[(f"s{i}", f"Student {i}", "Class 10") for i in range(250)])
+    everyone, one = sms.student_search_query("student"), sms.student_search_query("student 249")
+    worker = sms.QueryWorker(db)
+    try:
+        worker.submit(lambda conn: [everyone.page(conn, limit=-1)])
+        latest = worker.submit(lambda conn: [one.page(conn)])
+        rows = []
+        while True:
+            generation, kind, payload = worker.results.get(timeout=5)
+            if generation != latest:
+                continue
+            if kind == "done":
+                break
+            assert kind == "rows"
+            rows.extend(payload)
+    finally:
+        worker.stop()
+    assert [one.values(row)[0] for row in rows] == ["s249"]
+
+
+def test_keyset_pages_cover_every_row_once(db):
+    sms.init_db(db)
+    # Duplicate names: the rowid tiebreaker keeps the order unique.
+    add_students(db, *[(f"s{i:03}", f"Student {i % 7}", "Class 10") for i in range(103)])
+    query = sms.student_search_query("")
+    pages = [query.page(db.conn, limit=10)]
+    while len(pages[-1]) == 10:
+        pages.append(query.page(db.conn, after=query.key(pages[-1][-1]), limit=10))
+    rows = [row for page in pages for row in page]
+    assert len(rows) == 103 and len({query.values(row)[0] for row in rows}) == 103
+    assert [query.values(row)[1] for row in rows] == sorted(query.values(row)[1] for row in rows)
+
+    back = query.page(db.conn, before=query.key(pages[3][0]), limit=10)
+    assert back == pages[2]
+
+
+def write_csv(path, rows):
+    with open(path, "w", newline="") as f:
+        csv.writer(f).writerows(rows)
+    return str(path)
+
+
+def test_import_reports_bad_rows_and_keeps_the_rest(db, tmp_path, monkeypatch):
+    sms.init_db(db)
+    monkeypatch.setattr(sms, "IMPORT_BATCH_ROWS", 2)
+    path = write_csv(tmp_path / "students.csv", [
+        ["Name", "Class", "Hostel", "Bus"],
+        ["Meera Sharma", "Class 10", "yes", "No"],
+        ["Rohan Das", "Class 9", "maybe", "No"],
+        ["", "Class 9", "No", "No"],
+        ["Diya Iyer", "Class 11", "No", "Yes"],
+        ["Kabir Nair", "Class 12", "No", "No"],
+    ])
+    progress = []
+    result = sms.bulk_import(db, "Students", path, progress=lambda rows, fraction: progress.append(rows),
+                             credentials_path=str(tmp_path / "credentials.csv"))
+    assert (result["imported"], result["failed"]) == (3, 2)
+    assert result["errors"] == [(3, "hostel must be Yes or No"), (4, "name is required")]
+    assert progress == [2, 4, 5]
+    assert db.fetchall("SELECT name, hostel_status FROM students ORDER BY name") == [
+        ("Diya Iyer", "No"), ("Kabir Nair", "No"), ("Meera Sharma", "Yes")]
+    with open(tmp_path / "credentials.csv", newline="") as f:
+        credentials = list(csv.DictReader(f))
+    assert [row["name"] for row in credentials] == ["Meera Sharma", "Diya Iyer", "Kabir Nair"]
+    for row in credentials:
+        assert db.fetchone("SELECT role FROM users WHERE username=?", (row["username"],)) == ("student",)
+
+
+def test_import_needs_every_column(db, tmp_path):
+    sms.init_db(db)
+    path = write_csv(tmp_path / "employees.csv", [["name", "salary"], ["A", "100"]])
+    with pytest.raises(ValueError, match="designation"):
+        sms.bulk_import(db, "Employees", path)
+
+
+def test_export_filters_by_class_and_date(db, tmp_path):
+    sms.init_db(db)
+    with db.transaction() as c:
+        c.executemany("INSERT INTO students (student_id, name, class, hostel_status, bus_status, created_at) "
+                      "VALUES (?, ?, ?, 'No', 'No', ?)",
+                      [("s1", "A", "Class 10", "2025-03-31 23:59:59"), ("s2", "B", "Class 10", "2025-04-01 08:00:00"),
+                       ("s3", "C", "Class 9", "2025-04-02 08:00:00"), ("s4", "D", "Class 10", "2025-04-30 18:00:00")])
+    path = str(tmp_path / "students.csv")
+    assert sms.export_table(db, "students", path, class_="Class 10",
+                            date_from="2025-04-01", date_to="2025-04-30") == (2, False)
+    with open(path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["student_id"] for row in rows] == ["s2", "s4"]
+
+    path = str(tmp_path / "students.jsonl")
+    assert sms.export_table(db, "students", path, fmt="jsonl") == (4, False)
+    with open(path) as f:
+        assert [json.loads(line)["name"] for line in f] == ["A", "B", "C", "D"]
+
+    with pytest.raises(ValueError, match="cannot be filtered by class"):
+        sms.export_table(db, "system_logs", path, class_="Class 10")
+    with pytest.raises(ValueError, match="YYYY-MM-DD"):
+        sms.export_table(db, "students", path, date_from="01/04/2025")
+
+
+def test_cancelled_export_leaves_no_file(db, tmp_path, monkeypatch):
+    sms.init_db(db)
+    monkeypatch.setattr(sms, "EXPORT_FETCH_ROWS", 2)
+    add_students(db, *[(f"s{i}", f"Student {i}", "Class 10") for i in range(5)])
+    cancel = threading.Event()
+    progress = []
+
+    def on_progress(written, total):
+        progress.append((written, total))
+        cancel.set()
+
+    path = tmp_path / "students.csv"
+    assert sms.export_table(db, "students", str(path), progress=on_progress, cancel=cancel) == (2, True)
+    assert progress == [(2, 5)]
+    assert not path.exists()
+
+
+@pytest.mark.parametrize("name", ["backup.db", "backup.db.gz"])
+def test_backup_and_restore_round_trip(db, tmp_path, name):
+    sms.init_db(db)
+    add_students(db, ("s1", "Meera Sharma", "Class 10"))
+    path = str(tmp_path / name)
+    progress = []
+    sms.backup_to_file(db, path, compress=name.endswith(".gz"), progress=lambda done, total: progress.append(done))
+    assert progress and not os.path.exists(path + ".partial")
+
+    add_students(db, ("s2", "Rohan Das", "Class 9"))
+    sms.restore_from_file(db, path)
+    assert db.fetchall("SELECT student_id FROM students") == [("s1",)]
+    assert [row[0] for row in sms.search_students(db.conn, "meera")] == ["s1"]
+
+
+def test_restore_refuses_other_databases(db, tmp_path):
+    sms.init_db(db)
+    add_students(db, ("s1", "Meera Sharma", "Class 10"))
+    other = sqlite3.connect(str(tmp_path / "other.db"))
+    other.execute("CREATE TABLE notes (text TEXT)")
+    other.close()
+    with pytest.raises(ValueError, match="Not a School Management System database"):
+        sms.restore_from_file(db, str(tmp_path / "other.db"))
+    assert db.fetchall("SELECT student_id FROM students") == [("s1",)]
+
+
+def test_restore_refuses_newer_or_incomplete_databases(db, tmp_path):
+    sms.init_db(db)
+    add_students(db, ("s1", "Meera Sharma", "Class 10"))
+    newer = str(tmp_path / "newer.db")
+    sms.backup_to_file(db, newer)
+    other = sqlite3.connect(newer)
+    other.execute("PRAGMA user_version=99")
+    other.close()
+    partial = sqlite3.connect(str(tmp_path / "partial.db"))
+    partial.execute("CREATE TABLE students (student_id TEXT PRIMARY KEY, name TEXT)")
+    partial.close()
+
+    with pytest.raises(ValueError, match="schema version 99 is newer"):
+        sms.restore_from_file(db, newer)
+    with pytest.raises(ValueError, match="missing users, hostelers"):
+        sms.restore_from_file(db, str(tmp_path / "partial.db"))
+    assert db.fetchone("PRAGMA user_version")[0] == sms.SCHEMA_VERSION
+    assert db.fetchall("SELECT student_id FROM students") == [("s1",)]
+    assert db.fetchone("SELECT COUNT(*) FROM fee_transactions")[0] == 0
+
+
+def chunk_files(store):
+    return {name for prefix in os.listdir(store.chunk_dir) for name in os.listdir(os.path.join(store.chunk_dir, prefix))}
+
+
+def test_snapshots_share_chunks_and_keep_the_newest(db, tmp_path, monkeypatch):
+    sms.init_db(db)
+    monkeypatch.setattr(sms, "SNAPSHOT_CHUNK_BYTES", 4096)
+    add_students(db, *[(f"s{i}", f"Student {i}", "Class 10") for i in range(200)])
+    store = sms.SnapshotStore(str(tmp_path / "snapshots"))
+    retention = {"hourly": 2}
+
+    first = store.take(db, "hourly", retention)
+    assert first["new_chunks"] == len(set(first["chunks"])) > 1
+    assert store.take(db, "hourly", retention)["new_chunks"] == 0
+    add_students(db, ("late", "Late Student", "Class 9"))
+    third = store.take(db, "hourly", retention)
+    assert 0 < third["new_chunks"] < len(third["chunks"])
+
+    kept = store.snapshots()
+    assert [snapshot["sha256"] for snapshot in kept][0] == third["sha256"] and len(kept) == 2
+    assert chunk_files(store) == {digest for snapshot in kept for digest in snapshot["chunks"]}
+
+    store.restore(db, kept[1]["id"])
+    assert db.fetchone("SELECT COUNT(*) FROM students")[0] == 200
+    store.restore(db, kept[0]["id"])
+    assert db.fetchone("SELECT COUNT(*) FROM students")[0] == 201
+
+
+def test_corrupt_snapshot_is_not_restored(db, tmp_path):
+    sms.init_db(db)
+    add_students(db, ("s1", "Meera Sharma", "Class 10"))
+    store = sms.SnapshotStore(str(tmp_path / "snapshots"))
+    snapshot = store.take(db, "daily")
+    add_students(db, ("s2", "Rohan Das", "Class 9"))
+    with gzip.open(store.chunk_path(snapshot["chunks"][0]), "wb") as f:
+        f.write(b"garbage")
+    with pytest.raises(ValueError, match="is corrupt"):
+        store.restore(db, snapshot["id"])
+    assert db.fetchone("SELECT COUNT(*) FROM students")[0] == 2
+
+
+def test_restore_keeps_its_chunks_while_retention_runs(db, tmp_path, monkeypatch):
+    sms.init_db(db)
+    add_students(db, ("s1", "Meera Sharma", "Class 10"))
+    store = sms.SnapshotStore(str(tmp_path / "snapshots"))
+    old = store.take(db, "daily")
+    add_students(db, ("s2", "Rohan Das", "Class 9"))
+    stray = os.path.join(store.chunk_dir, old["chunks"][0][:2], "0" * 64 + ".partial")
+    open(stray, "wb").close()
+
+    # The scheduler drops the snapshot being restored and collects garbage
+    # while the restore is reading its chunks.
+    chunk_path, taken = store.chunk_path, []
+
+    def take_during_restore(digest):
+        monkeypatch.setattr(store, "chunk_path", chunk_path)
+        taken.append(store.take(db, "daily", {"daily": 1}))
+        return chunk_path(digest)
+
+    monkeypatch.setattr(store, "chunk_path", take_during_restore)
+    store.restore(db, old["id"])
+    assert db.fetchall("SELECT student_id FROM students") == [("s1",)]
+    assert [snapshot["id"] for snapshot in store.snapshots()] == [taken[0]["id"]]
+    assert os.path.exists(stray)
+
+    store.take(db, "daily", {"daily": 1})
+    assert chunk_files(store) - {os.path.basename(stray)} == set(store.snapshots()[0]["chunks"])
+
+
+def test_audit_entries_are_batched_until_flushed(db, monkeypatch):
+    sms.init_db(db)
+    monkeypatch.setattr(sms, "AUDIT_FLUSH_SECONDS", 60)
+    monkeypatch.setattr(sms, "AUDIT_FLUSH_ROWS", 1000)
+    audit_log = sms.AuditLog(db)
+    for i in range(5):
+        audit_log.record(f"Action {i}", "admin")
+    assert db.fetchone("SELECT COUNT(*) FROM system_logs")[0] == 0
+    audit_log.flush()
+    assert db.fetchall("SELECT action FROM system_logs ORDER BY rowid") == [(f"Action {i}",) for i in range(5)]
+    audit_log.record("Last", "admin")
+    audit_log.close()
+    assert (audit_log.written, audit_log.failed) == (6, 0)
+    with pytest.raises(RuntimeError, match="closed"):
+        audit_log.record("Too late", "admin")
+
+
+def test_audit_file_sink(db, tmp_path):
+    sms.init_db(db)
+    path = str(tmp_path / "audit.jsonl")
+    audit_log = sms.AuditLog(db, path)
+    audit_log.record("Logged in", "admin")
+    audit_log.close()
+    with open(path) as f:
+        entries = [json.loads(line) for line in f]
+    assert [(entry["action"], entry["username"]) for entry in entries] == [("Logged in", "admin")]
+    assert db.fetchone("SELECT COUNT(*) FROM system_logs")[0] == 0
+
+
+def test_audit_entries_left_at_close_go_to_the_fallback_file(db):
+    sms.init_db(db)
+    audit_log = sms.AuditLog(db)
+    db.execute("DROP TABLE system_logs")
+    audit_log.record("Logged in", "admin")
+    audit_log.close()
+    with open(db.path + sms.AUDIT_FALLBACK_SUFFIX) as f:
+        assert [json.loads(line)["action"] for line in f] == ["Logged in"]
+    assert (audit_log.written, audit_log.failed) == (1, 0)
+
+
+def test_audit_log_falls_back_while_open_when_the_database_keeps_failing(db, monkeypatch):
+    sms.init_db(db)
+    monkeypatch.setattr(sms, "AUDIT_FLUSH_SECONDS", 0.01)
+    monkeypatch.setattr(sms, "AUDIT_BUFFER_ROWS", 2)
+    audit_log = sms.AuditLog(db)
+    db.execute("DROP TABLE system_logs")
+    for i in range(5):
+        audit_log.record(f"Action {i}", "admin")
+    audit_log.flush()
+    assert not audit_log.closed
+    with open(db.path + sms.AUDIT_FALLBACK_SUFFIX) as f:
+        assert [json.loads(line)["action"] for line in f] == [f"Action {i}" for i in range(5)]
+    assert (audit_log.written, audit_log.failed) == (5, 0)
+    audit_log.close()
+
+
+def pay(db, student_id, fee_type, amount, sql=sms.PAYMENT_INSERT_SQL):
+    transaction_id = f"T{db.fetchone('SELECT COUNT(*) FROM fee_transactions')[0]}"
+    with db.transaction() as c:
+        c.execute(sql, (transaction_id, student_id, fee_type, amount, "2025-05-01"))
+    return transaction_id
+
+
+def test_fee_ledger_follows_fees_students_and_payments(db):
+    sms.init_db(db)
+    with db.transaction() as c:
+        c.execute("INSERT OR REPLACE INTO fees (class, amount) VALUES ('Class 1', 5000)")
+        c.execute("UPDATE service_fees SET amount = 3000 WHERE fee_type = 'Hostel'")
+        c.execute("INSERT INTO students (student_id, name, class, hostel_status, bus_status, created_at) "
+                  "VALUES ('S1', 'Asha', 'Class 1', 'Yes', 'No', '2025-04-01 09:00:00')")
+    assert sorted(sms.pending_dues(db, "S1")) == [("Class", 5000.0), ("Hostel", 3000.0)]
+
+    transaction_id = pay(db, "S1", "Class", 5000)
+    assert sms.pending_dues(db, "S1") == [("Hostel", 3000.0)]
+    db.execute("UPDATE fee_transactions SET amount = 4000 WHERE transaction_id = ?", (transaction_id,))
+    db.execute("UPDATE fees SET amount = 6000 WHERE class = 'Class 1'")
+    db.execute("UPDATE students SET hostel_status = 'No' WHERE student_id = 'S1'")
+    assert sms.pending_dues(db, "S1") == [("Class", 2000.0)]
+    with db.reader() as conn:
+        assert sms.outstanding_dues_query("Class 1").page(conn)[0][2:] == ("S1", "Asha", "Class 1", "Class", 2000.0)
+        assert sms.outstanding_dues_query("Class 2").page(conn) == []
+
+    db.execute("DELETE FROM fee_transactions")
+    db.execute("DELETE FROM students")
+    assert db.fetchone("SELECT COUNT(*) FROM fee_balances")[0] == 0
+
+
+def test_fee_ledger_backfill_counts_unknown_fee_types_as_class(db):
+    with db.transaction() as c:
+        sms.init_schema(c)
+    add_students(db, ("S1", "Asha", "Class 1"))
+    for fee_type, amount in ((" hostel ", 100), ("Tuition", 200), ("Exam", 300)):
+        pay(db, "S1", fee_type, amount, sms.LEGACY_PAYMENT_INSERT_SQL)
+
+    sms.init_db(db)
+    assert db.fetchall("SELECT fee_type, amount_paid FROM fee_balances WHERE amount_paid > 0 ORDER BY fee_type") == [
+        ("Class", 500.0), ("Hostel", 100.0)]
+    assert db.fetchone("SELECT action FROM system_logs WHERE username = 'system'")[0] == \
+        "Schema upgrade: 2 payments with an unknown fee type counted as Class"
+
+
+def test_fee_settings_update_what_students_owe(db):
+    sms.init_db(db)
+    assert sms.service_fees(db) == {"Hostel": 0.0, "Bus": 0.0}
+    with db.transaction() as c:
+        c.execute("INSERT INTO students (student_id, name, class, hostel_status, bus_status, created_at) "
+                  "VALUES ('S1', 'Asha', 'Class 13', 'No', 'Yes', '2025-04-01 09:00:00')")
+    assert sms.pending_dues(db, "S1") == []
+
+    sms.set_class_fee(db, "Class 13", 7000)
+    sms.set_service_fee(db, "bus", 1200)
+    assert sms.pending_dues(db, "S1") == [("Bus", 1200.0), ("Class", 7000.0)]
+    sms.set_class_fee(db, "Class 13", 6500)
+    assert sms.pending_dues(db, "S1") == [("Bus", 1200.0), ("Class", 6500.0)]
+    with pytest.raises(ValueError):
+        sms.set_service_fee(db, "Class", 100)
+
+
+@pytest.mark.parametrize("name", ["certificates", "certificates.zip"])
+def test_batch_no_dues_issues_only_students_without_dues(db, tmp_path, monkeypatch, name):
+    monkeypatch.setattr(sms, "NO_DUES_FETCH_ROWS", 2)
+    sms.init_db(db)
+    sms.set_class_fee(db, "Class 1", 5000)
+    add_students(db, ("S1", "Asha", "Class 1"), ("S2", "Ravi", "Class 1"), ("S3", "Meera", "Class 1"),
+                 ("S4", "Kiran", "Class 2"))
+    pay(db, "S1", "Class", 5000)
+    pay(db, "S3", "Class", 5000)
+    progress = []
+
+    output = str(tmp_path / name)
+    result = sms.generate_no_dues_batch(db, output, "Class 1", lambda done, total: progress.append((done, total)))
+    assert (result["issued"], result["skipped"], result["cancelled"]) == (2, 1, False)
+    assert progress == [(2, 3), (3, 3)]
+    if name.endswith(".zip"):
+        with zipfile.ZipFile(output) as archive:
+            files = {info.filename: archive.read(info).decode() for info in archive.infolist()}
+    else:
+        files = {}
+        for file_name in os.listdir(output):
+            with open(os.path.join(output, file_name), newline="") as f:
+                files[file_name] = f.read()
+    assert sorted(files) == ["manifest.csv", "no_dues_S1.txt", "no_dues_S3.txt"]
+    assert "Name: Asha" in files["no_dues_S1.txt"]
+    manifest = list(csv.DictReader(files["manifest.csv"].splitlines()))
+    assert {row["student_id"]: (row["status"], row["pending_dues"]) for row in manifest} == {
+        "S1": ("issued", ""), "S2": ("skipped", "Class 5000.00"), "S3": ("issued", "")}
+
+
+def test_duplicate_marks_keep_the_latest_on_upgrade(db):
+    with db.transaction() as c:
+        sms.init_schema(c)
+        c.execute("INSERT INTO students (student_id, name, class) VALUES ('S1', 'Asha', 'Class 1')")
+        c.executemany("INSERT INTO report_cards (report_id, student_id, subject, marks, created_at) VALUES (?, ?, ?, ?, ?)",
+                      [("R1", "S1", "Maths", 40, "2025-01-01 09:00:00"),
+                       ("R2", "S1", "Maths", 60, "2025-02-01 09:00:00"),
+                       ("R3", "S1", "Science", 70, "2025-01-01 09:00:00")])
+    sms.init_db(db)
+    assert db.fetchall("SELECT subject, marks FROM report_cards ORDER BY subject") == [("Maths", 60), ("Science", 70)]
+    sms.save_class_marks(db, [("S1", "Maths", 90), ("S1", "English", 80)])
+    assert db.fetchall("SELECT subject, marks FROM report_cards ORDER BY subject") == [
+        ("English", 80), ("Maths", 90), ("Science", 70)]
+
+
+def test_report_cards_rank_the_class_by_total(db, tmp_path):
+    sms.init_db(db)
+    add_students(db, ("S1", "Asha", "Class 1"), ("S2", "Ravi", "Class 1"), ("S3", "Meera", "Class 1"),
+                 ("S4", "Kiran", "Class 1"), ("S5", "Tara", "Class 2"))
+    sms.save_class_marks(db, [("S1", "Maths", 80), ("S1", "Science", 70),
+                              ("S2", "Maths", 95), ("S2", "Science", 90),
+                              ("S3", "Maths", 75), ("S3", "Science", 75),
+                              ("S5", "Maths", 100)])
+
+    output = str(tmp_path / "cards")
+    assert sms.generate_report_cards(db, "Class 1", output) == 4
+    with open(os.path.join(output, "class_summary.csv"), newline="") as f:
+        summary = [(row["rank"], row["student_id"], row["total"], row["grade"]) for row in csv.DictReader(f)]
+    assert summary == [("1", "S2", "185", "A+"), ("2", "S1", "150", "B"), ("2", "S3", "150", "B"), ("", "S4", "", "-")]
+    with open(os.path.join(output, "report_card_S3.txt")) as f:
+        card = f.read()
+    assert "Class Rank: 2 of 4" in card
+    assert "Maths                       75" in card
+
+
+def add_employees(db, *rows):
+    with db.transaction() as c:
+        c.executemany("INSERT INTO employees (employee_id, name, designation, salary, created_at) "
+                      "VALUES (?, ?, 'Teacher', ?, '2025-04-01 09:00:00')", rows)
+
+
+def test_payroll_rerun_is_idempotent(db, tmp_path):
+    sms.init_db(db)
+    add_employees(db, ("E1", "A", 1000), ("E2", "B", 2000), ("E3", "C", 3000), ("E4", "X", 9000))
+    db.execute("UPDATE employees SET status = 'Inactive' WHERE employee_id = 'E4'")
+    assert sms.run_payroll(db, "2025-04") == (3, 0)
+    add_employees(db, ("E5", "D", 500))
+    assert sms.run_payroll(db, "2025-04") == (1, 3)
+    assert sms.run_payroll(db, " 2025-04 ") == (0, 4)
+    assert db.fetchone("SELECT COUNT(*), SUM(amount) FROM salary_slips WHERE month='2025-04'") == (4, 6500.0)
+    with pytest.raises(ValueError, match="YYYY-MM"):
+        sms.run_payroll(db, "April")
+
+    path = str(tmp_path / "payroll.csv")
+    assert sms.export_payroll(db, "2025-04", path) == (4, 6500.0)
+    with open(path, newline="") as f:
+        rows = list(csv.reader(f))
+    assert [row[2] for row in rows[1:5]] == ["A", "B", "C", "D"]
+    assert rows[-1][:3] == ["Total", "", "4 slips"]
+
+
+def test_dashboard_aggregates_follow_every_write(db):
+    sms.init_db(db)
+    sms.set_class_fee(db, "Class 1", 5000)
+    with db.transaction() as c:
+        c.executemany("INSERT INTO students (student_id, name, class, hostel_status, bus_status, created_at) "
+                      "VALUES (?, ?, ?, ?, ?, '2025-04-01 09:00:00')",
+                      [("S1", "Asha", "Class 1", "Yes", "No"), ("S2", "Ravi", "Class 1", "No", "Yes"),
+                       ("S3", "Meera", "Class 2", "No", "Yes")])
+    sms.save_room(db, "A1", "A", 2)
+    sms.save_route(db, "R1", 40, ["Gate"])
+    with db.transaction() as c:
+        c.execute("INSERT INTO hostelers (hosteler_id, student_id, room_number, joining_date) "
+                  "VALUES ('H1', 'S1', 'A1', '2025-04-01')")
+        c.executemany("INSERT INTO bus_holders (bus_holder_id, student_id, route_number, pickup_point) "
+                      "VALUES (?, ?, 'R1', 'Gate')", [("B1", "S2"), ("B2", "S3")])
+    pay(db, "S1", "Class", 2000)
+    db.execute("DELETE FROM bus_holders WHERE bus_holder_id = 'B2'")
+
+    summary = sms.dashboard_summary(db)
+    assert (summary["students"], summary["hostel_students"], summary["hostelers"], summary["beds"],
+            summary["bus_riders"]) == (3, 1, 1, 2, 1)
+    assert summary["classes"] == [("Class 1", 2, 1, 1), ("Class 2", 1, 0, 1)]
+    assert summary["routes"] == [("R1", 1, 40)]
+    assert summary["collections"] == [("2025-05", 1, 2000.0)]
+    assert summary["outstanding_dues"] == 8000.0
+    assert sms.verify_dashboard(db) == []
+
+    db.execute("UPDATE class_stats SET students = 5 WHERE class = 'Class 2'")
+    assert sms.verify_dashboard(db) == [("class_stats", "Class 2", (5, 0, 1), (1, 0, 1))]
+    with db.transaction() as c:
+        sms.rebuild_dashboard(c)
+    assert sms.verify_dashboard(db) == []
+
+
+def add_hostel_students(db, *rows):
+    with db.transaction() as c:
+        c.executemany("INSERT INTO students (student_id, name, class, hostel_status, bus_status, created_at, gender) "
+                      "VALUES (?, ?, ?, 'Yes', 'No', '2025-04-01 09:00:00', ?)", rows)
+
+
+def test_full_room_is_rejected(db):
+    sms.init_db(db)
+    add_hostel_students(db, ("S1", "Asha", "Class 10", "F"), ("S2", "Meera", "Class 10", "F"))
+    sms.save_room(db, "A1", "A", 1)
+    db.execute("INSERT INTO hostelers (hosteler_id, student_id, room_number, joining_date) "
+               "VALUES ('H1', 'S1', 'A1', '2025-04-01')")
+    with pytest.raises(sqlite3.IntegrityError, match="Room is full"):
+        db.execute("INSERT INTO hostelers (hosteler_id, student_id, room_number, joining_date) "
+                   "VALUES ('H2', 'S2', 'A1', '2025-04-01')")
+    with pytest.raises(sqlite3.IntegrityError, match="Room not found"):
+        db.execute("INSERT INTO hostelers (hosteler_id, student_id, room_number, joining_date) "
+                   "VALUES ('H2', 'S2', 'Z9', '2025-04-01')")
+    with pytest.raises(ValueError, match="already has 1 occupants"):
+        sms.save_room(db, "A1", "A", 0)
+    assert db.fetchone("SELECT occupied FROM hostel_rooms WHERE room_number='A1'")[0] == 1
+
+
+def test_allocator_fills_the_most_specific_block_first(db):
+    sms.init_db(db)
+    add_hostel_students(db, ("S1", "Asha", "Class 10", "F"), ("S2", "Ravi", "Class 10", "M"),
+                        ("S3", "Meera", "Class 9", "F"), ("S4", "Kiran", "Class 9", "M"))
+    sms.save_room(db, "G1", "Girls", 1, gender="F", class_="Class 10")
+    sms.save_room(db, "G2", "Girls", 2, gender="F")
+    sms.save_room(db, "O1", "Open", 1)
+
+    allocations, unplaced = sms.allocate_beds(db, joining_date="2025-04-01")
+    assert sorted((student_id, room) for _, student_id, room, _ in allocations) == [
+        ("S1", "G1"), ("S2", "O1"), ("S3", "G2")]
+    assert unplaced == ["S4"]
+    with db.reader() as conn:
+        assert sms.next_free_room(conn, "F", "Class 9") == ("G2",)
+        assert sms.next_free_room(conn, "M", "Class 9") is None
+        assert [row[0] for row in sms.room_occupants(conn, "G1")] == ["S1"]
+    assert sms.dashboard_summary(db)["beds"] == 4
+    assert sms.verify_dashboard(db) == []
+
+
+def add_bus_students(db, *rows):
+    with db.transaction() as c:
+        c.executemany("INSERT INTO students (student_id, name, class, hostel_status, bus_status, created_at, pickup_point) "
+                      "VALUES (?, ?, 'Class 10', 'No', 'Yes', '2025-04-01 09:00:00', ?)", rows)
+
+
+def test_full_route_is_rejected(db):
+    sms.init_db(db)
+    add_bus_students(db, ("S1", "Asha", "Gate"), ("S2", "Ravi", "Gate"))
+    sms.save_route(db, "R1", 1, ["Gate"])
+    db.execute("INSERT INTO bus_holders (bus_holder_id, student_id, route_number, pickup_point) "
+               "VALUES ('B1', 'S1', 'R1', 'Gate')")
+    with pytest.raises(sqlite3.IntegrityError, match="Route is full"):
+        db.execute("INSERT INTO bus_holders (bus_holder_id, student_id, route_number, pickup_point) "
+                   "VALUES ('B2', 'S2', 'R1', 'Gate')")
+    with pytest.raises(sqlite3.IntegrityError, match="not a stop"):
+        db.execute("INSERT INTO bus_holders (bus_holder_id, student_id, route_number, pickup_point) "
+                   "VALUES ('B2', 'S2', 'R1', 'Market')")
+    assert db.fetchone("SELECT riders FROM bus_routes WHERE route_number='R1'")[0] == 1
+
+
+def test_route_assignment_spreads_load_and_reports_overflow(db):
+    sms.init_db(db)
+    add_bus_students(db, ("S1", "Asha", "Gate"), ("S2", "Ravi", "Gate"), ("S3", "Meera", "Gate"),
+                     ("S4", "Kiran", "Lake"), ("S5", "Tara", None))
+    sms.save_route(db, "R1", 1, ["Gate", "Market"])
+    sms.save_route(db, "R2", 1, ["Gate"])
+
+    assignments, overflow = sms.assign_bus_routes(db)
+    assert sorted(route for _, _, route, _ in assignments) == ["R1", "R2"]
+    assert sorted((student_id, reason) for student_id, _, _, reason in overflow) == [
+        ("S2", "All routes through this stop are full"), ("S4", "No route stops here"),
+        ("S5", "No pickup point recorded")]
+    with db.reader() as conn:
+        assert [row[0] for row in sms.route_riders(conn, "R1")] + [row[0] for row in sms.route_riders(conn, "R2")] in (
+            ["S1", "S3"], ["S3", "S1"])
+    assert sms.verify_dashboard(db) == []
+
+
+def test_task_executor_runs_writes_in_order_and_reports_errors():
+    executor = sms.TaskExecutor(readers=2)
+    done, errors = [], []
+    for i in range(5):
+        executor.submit(lambda i=i: i, done.append, errors.append)
+    executor.submit(lambda: 1 / 0, done.append, errors.append)
+    executor.submit(lambda: "read", done.append, errors.append, write=False)
+    executor.stop()
+    assert executor.pending() == 7
+    executor.poll()
+    assert executor.pending() == 0
+    assert [result for result in done if result != "read"] == [0, 1, 2, 3, 4]
+    assert "read" in done
+    assert [type(error) for error in errors] == [ZeroDivisionError]
+
+
+@pytest.fixture
+def verifier(monkeypatch):
+    verifier = sms.CredentialVerifier()
+    monkeypatch.setattr(sms, "credentials", verifier)
+    return verifier
+
+
+@pytest.fixture
+def api(db, verifier):
+    sms.init_db(db)
+    # The API refuses the issued admin password.
+    sms.change_password(db, {"current_password": "admin", "new_password": "s3cret", "confirm_password": "s3cret"},
+                        "admin")
+    server = sms.ApiServer(db, ("127.0.0.1", 0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+def api_request(server, method, path, body=None, credentials=("admin", "s3cret")):
+    headers = {}
+    if credentials:
+        headers["Authorization"] = "Basic " + base64.b64encode(":".join(credentials).encode()).decode()
+    if isinstance(body, dict):
+        body = json.dumps(body)
+    conn = http.client.HTTPConnection(*server.address)
+    try:
+        conn.request(method, path, body, headers)
+        response = conn.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        conn.close()
+
+
+def test_api_status_codes(api):
+    status, student = api_request(api, "POST", "/students", {"name": "Asha", "class": "Class 1", "hostel": "No", "bus": "No"})
+    assert status == 200
+    student_id = student["student_id"]
+    assert api_request(api, "GET", "/students?q=ash")[1][0]["student_id"] == student_id
+    assert api_request(api, "GET", f"/students/{student_id}")[1]["name"] == "Asha"
+    assert api_request(api, "POST", "/fee-payments", {"student_id": student_id, "fee_type": "Class", "amount": 100})[0] == 200
+
+    assert api_request(api, "GET", "/students", credentials=None)[0] == 401
+    assert api_request(api, "GET", "/students", credentials=("admin", "wrong"))[0] == 401
+    assert api_request(api, "POST", "/fee-payments", {"student_id": student_id, "fee_type": "Class", "amount": -5})[0] == 400
+    assert api_request(api, "POST", "/students", "not json")[0] == 400
+    assert api_request(api, "GET", "/students?limit=ten")[0] == 400
+    assert api_request(api, "GET", "/nowhere")[0] == 404
+
+
+def test_api_rejects_out_of_range_limits_unknown_students_and_bad_logins(api):
+    assert api_request(api, "GET", f"/students?limit={sms.API_MAX_SEARCH_ROWS}")[0] == 200
+    for limit in (0, -1, sms.API_MAX_SEARCH_ROWS + 1):
+        assert api_request(api, "GET", f"/students?limit={limit}")[0] == 400
+    assert api_request(api, "GET", "/students/missing") == (404, {"error": "Student not found"})
+    assert api_request(api, "GET", "/students/missing/no-dues")[0] == 404
+    status, _ = api_request(api, "POST", "/login", {"username": "admin", "password": "wrong", "role": "admin"},
+                            credentials=None)
+    assert status == 401
+    status, login = api_request(api, "POST", "/login", {"username": "admin", "password": "s3cret", "role": "admin"},
+                                credentials=None)
+    assert (status, login["username"]) == (200, "admin")
+
+
+def test_group_commit_isolates_failed_operations(db):
+    sms.init_db(db)
+    student_ids = sms.seed_database(db, 5, 0)
+
+    def payment(student_id):
+        return lambda: sms.record_fee_payment(db, {"student_id": student_id, "fee_type": "Class", "amount": "100"},
+                                              "admin")
+
+    async def run():
+        engine = sms.GroupCommitEngine(db)
+        await engine.start()
+        works = [payment(student_ids[0]), payment("missing"), payment(student_ids[1]),
+                 lambda: db.execute("INSERT INTO no_such_table VALUES (1)")]
+        results = await asyncio.gather(*(engine.write(work) for work in works), return_exceptions=True)
+        await engine.stop()
+        return engine.batches, results
+
+    batches, results = asyncio.run(run())
+    assert batches == 1
+    assert "transaction_id" in results[0] and "transaction_id" in results[2]
+    assert isinstance(results[1], ValueError)
+    assert isinstance(results[3], sqlite3.OperationalError)
+    assert db.fetchone("SELECT COUNT(*) FROM fee_transactions")[0] == 2
+    assert sms.verify_dashboard(db) == []
+    sms.close_audit_log()
+    actions = [action for action, in db.fetchall("SELECT action FROM system_logs")]
+    assert actions == [f"Recorded payment for student: {student_ids[0]}",
+                       f"Recorded payment for student: {student_ids[1]}"]
+
+
+def test_upgrade_hashes_passwords_and_links_students(db, verifier):
+    student_ids = legacy_database(db, 5)
+    sms.init_db(db)
+    users = db.fetchall("SELECT username, password, student_id, must_change_password FROM users WHERE role='student'")
+    assert all(password.startswith(f"pbkdf2_sha256${sms.LEGACY_PASSWORD_ITERATIONS}$") for _, password, _, _ in users)
+    assert {student_id for _, _, student_id, _ in users} == set(student_ids)
+    assert {flag for _, _, _, flag in users} == {1}
+
+    username = f"student{student_ids[0][:8]}"
+    login = sms.authenticate(db, username, sms.initial_password(student_ids[0]), "student")
+    assert (login["student_id"], login["must_change_password"]) == (student_ids[0], True)
+    login["rehash"]()
+    stored = db.fetchone("SELECT password FROM users WHERE username=?", (username,))[0]
+    assert stored.startswith(f"pbkdf2_sha256${sms.PASSWORD_ITERATIONS}$")
+    assert sms.authenticate(db, username, sms.initial_password(student_ids[0]), "student")["rehash"] is None
+    assert sms.authenticate(db, "admin", "admin", "admin")["student_id"] is None
+    with pytest.raises(ValueError, match="Invalid admin username or password"):
+        sms.authenticate(db, "admin", "wrong", "admin")
+    with pytest.raises(ValueError, match="Invalid student username or password"):
+        sms.authenticate(db, "admin", "admin", "student")
+
+
+def test_logins_are_cached_and_locked_out_after_repeated_failures(db, verifier, monkeypatch):
+    sms.init_db(db)
+    sms.authenticate(db, "admin", "admin", "admin")["rehash"]()
+    sms.authenticate(db, "admin", "admin", "admin")
+    sms.authenticate(db, "admin", "admin", "admin")
+    assert (verifier.hits, verifier.misses) == (1, 2)
+
+    for _ in range(sms.LOGIN_MAX_FAILURES):
+        with pytest.raises(ValueError, match="Invalid"):
+            sms.authenticate(db, "admin", "wrong", "admin")
+    with pytest.raises(ValueError, match="Too many failed attempts"):
+        sms.authenticate(db, "admin", "admin", "admin")
+    monkeypatch.setattr(sms, "LOGIN_LOCKOUT_SECONDS", 0)
+    sms.authenticate(db, "admin", "admin", "admin")
+
+    sms.change_password(db, {"current_password": "admin", "new_password": "s3cret", "confirm_password": "s3cret"},
+                        "admin")
+    with pytest.raises(ValueError, match="Invalid"):
+        sms.authenticate(db, "admin", "admin", "admin")
+    assert sms.authenticate(db, "admin", "s3cret", "admin")["must_change_password"] is False
+
+
+def test_lockouts_are_per_client_and_unknown_usernames_cannot_evict_them(db, verifier, monkeypatch):
+    sms.init_db(db)
+    for _ in range(sms.LOGIN_MAX_FAILURES):
+        with pytest.raises(ValueError, match="Invalid"):
+            sms.authenticate(db, "admin", "wrong", "admin", "10.0.0.9")
+    with pytest.raises(ValueError, match="Too many failed attempts"):
+        sms.authenticate(db, "admin", "admin", "admin", "10.0.0.9")
+    sms.authenticate(db, "admin", "admin", "admin", "10.0.0.1")
+
+    monkeypatch.setattr(verifier, "cache_size", 2)
+    for n in range(5):
+        with pytest.raises(ValueError, match="Invalid"):
+            sms.authenticate(db, f"nobody{n}", "wrong", "admin", "10.0.0.9")
+    with pytest.raises(ValueError, match="Too many failed attempts"):
+        sms.authenticate(db, "admin", "admin", "admin", "10.0.0.9")
+
+def test_issued_passwords_are_random_and_must_be_changed(db, verifier):
+    sms.init_db(db)
+    first = sms.add_student(db, {"name": "Asha", "class": "Class 1", "hostel": "No", "bus": "No"}, "admin")
+    second = sms.add_student(db, {"name": "Ravi", "class": "Class 1", "hostel": "No", "bus": "No"}, "admin")
+    assert first["password"] != sms.initial_password(first["student_id"])
+    assert first["password"] != second["password"] and len(first["password"]) >= 12
+    stored = db.fetchone("SELECT password FROM users WHERE username=?", (first["username"],))[0]
+    assert stored.startswith(f"pbkdf2_sha256${sms.PASSWORD_ITERATIONS}$")
+    login = sms.authenticate(db, first["username"], first["password"], "student")
+    assert (login["student_id"], login["must_change_password"]) == (first["student_id"], True)
+
+    row = {"current_password": first["password"], "new_password": first["password"], "confirm_password": first["password"]}
+    with pytest.raises(ValueError, match="different"):
+        sms.change_password(db, row, first["username"])
+    sms.change_password(db, dict(row, new_password="chosen", confirm_password="chosen"), first["username"])
+    assert sms.authenticate(db, first["username"], "chosen", "student")["must_change_password"] is False
+
+
+def test_api_refuses_issued_admin_passwords(db, verifier):
+    sms.init_db(db)
+    server = sms.ApiServer(db, ("127.0.0.1", 0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        assert server.handle("GET", "/dashboard", {}, ("admin", "admin")) == (
+            401, {"error": "Change the issued password before using the API"})
+        status, login = server.handle("POST", "/login", {"username": "admin", "password": "admin", "role": "admin"}, None)
+        assert (status, login["must_change_password"]) == (200, True)
+    finally:
+        server.shutdown()
+
+
+def test_student_dashboard_cache_follows_marks_and_fee_changes(db, monkeypatch):
+    sms.init_db(db)
+    cache = sms.StudentDashboardCache()
+    monkeypatch.setattr(sms, "student_dashboards", cache)
+    add_students(db, ("s1", "Meera Sharma", "Class 10"), ("s2", "Rohan Das", "Class 10"))
+    assert cache.get(db, "s1") == {"class": "Class 10", "tuition_fee": 5000.0, "results": []}
+    cache.get(db, "s1")
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.get(db, "missing") is None
+
+    sms.add_marks(db, {"student_id": "s1", "subject": "Maths", "marks": "90"}, "admin")
+    assert cache.get(db, "s1")["results"] == [("Maths", 90)]
+    cache.get(db, "s2")
+    sms.save_class_marks(db, [("s2", "Maths", 70), ("s2", "Art", 80)])
+    assert cache.get(db, "s2")["results"] == [("Art", 80), ("Maths", 70)]
+
+    # As if the fee were changed from another terminal.
+    monkeypatch.setattr(sms, "STUDENT_DASHBOARD_VERSION_CHECK", 0)
+    other = sqlite3.connect(db.path)
+    with other:
+        other.execute("UPDATE fees SET amount=5500 WHERE class='Class 10'")
+    other.close()
+    assert cache.get(db, "s1")["tuition_fee"] == 5500.0